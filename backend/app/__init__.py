@@ -6,7 +6,15 @@ from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 
 from app.chat_orchestrator import ChatOrchestrator
+from app.metrics import observe_request, record_rate_limit_breach, start_request_timer
+from app.profiling import configure_profiling, end_request_profile, start_request_profile
+from app.routes.health import health_bp
+from app.routes.metrics import metrics_bp
 from app.routes.orchestrator import orchestrator_bp
+from app.tracing import configure_tracing, end_request_trace, start_request_trace
+from app.utils.auth import initialise_jwks, warm_up_jwks
+from app.utils.rate_limit_storage import SQLiteStorage  # noqa: F401 - registers the sqlite:// storage scheme
+from app.warmup import Warmup
 from config import config
 
 
@@ -70,14 +78,53 @@ def create_app():
         app=app,
         key_func=get_remote_address,
         default_limits=["100 per hour"],
-        storage_uri="memory://",
-        strategy="fixed-window"
+        storage_uri=loaded_config.RATE_LIMIT_STORAGE_URI,
+        strategy=loaded_config.RATE_LIMIT_STRATEGY,
+        on_breach=record_rate_limit_breach,
     )
 
     app.config.from_object(loaded_config)
+    initialise_jwks(
+        loaded_config.AUTH0_DOMAIN,
+        jwks_file=loaded_config.JWKS_FILE,
+        background_refresh=loaded_config.JWKS_BACKGROUND_REFRESH,
+    )
     app.orchestrator = ChatOrchestrator(config=loaded_config)
     app.limiter = limiter
     app.register_blueprint(orchestrator_bp)
+    app.register_blueprint(health_bp)
+    app.register_blueprint(metrics_bp)
+    # Load balancers probe readiness, and Prometheus scrapes, far more often than the default limit allows
+    limiter.exempt(health_bp)
+    limiter.exempt(metrics_bp)
+
+    app.warmup = Warmup({
+        **app.orchestrator.get_warmup_steps(),
+        "jwks": lambda: warm_up_jwks(
+            loaded_config.AUTH0_DOMAIN,
+            background_refresh=loaded_config.JWKS_BACKGROUND_REFRESH,
+        ),
+    })
+    if loaded_config.WARMUP_ON_STARTUP:
+        app.warmup.run()
+
+    configure_tracing(
+        loaded_config.TRACING_EXPORT_PATH,
+        sample_rate=loaded_config.TRACING_SAMPLE_RATE,
+        slow_request_seconds=loaded_config.TRACING_SLOW_REQUEST_SECONDS,
+    )
+    configure_profiling(
+        loaded_config.PROFILING_OUTPUT_DIR,
+        sample_rate=loaded_config.PROFILING_SAMPLE_RATE,
+        token=loaded_config.PROFILING_TOKEN,
+    )
+    app.before_request(start_request_profile)
+    app.before_request(start_request_trace)
+    app.before_request(start_request_timer)
+    # after_request hooks run in reverse order, so the trace ends, and then the profile, last
+    app.after_request(end_request_profile)
+    app.after_request(end_request_trace)
+    app.after_request(observe_request)
     app.after_request(add_security_headers)
 
     return app
@@ -0,0 +1,70 @@
+import logging
+import threading
+import time
+from typing import Callable
+
+from app.types import BoardGame
+
+logger = logging.getLogger(__name__)
+
+
+class BoardGameCatalog:
+    """
+    In-memory view of the board_games catalog with O(1) membership checks.
+
+    The catalog is reloaded once it is older than ttl_seconds, or on the next lookup after
+    invalidate() is called, so newly ingested board games appear without a restart.
+    If a reload fails, the previously loaded catalog keeps being served until the next attempt.
+    """
+
+    def __init__(self, load_board_games: Callable[[], list[BoardGame]], ttl_seconds: float):
+        self._load_board_games = load_board_games
+        self._ttl_seconds = ttl_seconds
+        self._board_games: dict[str, BoardGame] = {}
+        self._names: frozenset[str] = frozenset()
+        self._loaded = False
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+
+    def _refresh_if_stale(self) -> None:
+        if time.monotonic() < self._expires_at:
+            return
+
+        with self._lock:
+            # Another thread may have refreshed the catalog while we waited for the lock
+            if time.monotonic() < self._expires_at:
+                return
+
+            try:
+                board_games = self._load_board_games()
+
+            except Exception as e:
+                if not self._loaded:
+                    raise
+
+                logger.warning("Failed to refresh board game catalog, serving previous version: %s", str(e))
+                self._expires_at = time.monotonic() + self._ttl_seconds
+                return
+
+            self._board_games = {board_game["name"]: board_game for board_game in board_games}
+            self._names = frozenset(self._board_games)
+            self._loaded = True
+            self._expires_at = time.monotonic() + self._ttl_seconds
+
+    def __contains__(self, name: str) -> bool:
+        self._refresh_if_stale()
+        return name in self._names
+
+    def names(self) -> list[str]:
+        """Get the names of all board games in the catalog, sorted alphabetically."""
+        self._refresh_if_stale()
+        return sorted(self._names)
+
+    def get(self, name: str) -> BoardGame | None:
+        """Get a board game's catalog entry, or None if it isn't in the catalog."""
+        self._refresh_if_stale()
+        return self._board_games.get(name)
+
+    def invalidate(self) -> None:
+        """Reload the catalog on the next lookup."""
+        self._expires_at = 0.0
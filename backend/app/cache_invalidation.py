@@ -0,0 +1,225 @@
+import logging
+import os
+import socket
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Callable
+
+from pymongo import ASCENDING
+from pymongo.collection import Collection
+from pymongo.errors import OperationFailure, PyMongoError
+
+from app.config.constants import (
+    CACHE_INVALIDATION_POLL_INTERVAL_SECONDS,
+    CACHE_INVALIDATION_PUBLISH_INTERVAL_SECONDS,
+    CACHE_INVALIDATION_POLL_OVERLAP_SECONDS,
+    CACHE_INVALIDATION_SEEN_EVENTS_MAX_ENTRIES,
+)
+from app.utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Topic namespaces. Topics are either a bare namespace or "<namespace>:<key>"
+CATALOG_TOPIC = "catalog"
+USER_TOPIC = "user"
+
+
+class CacheInvalidationBus:
+    """
+    Broadcasts cache invalidations between processes through the cache_invalidations collection.
+
+    publish() queues an event for a topic such as "catalog" or "user:<user_id>". Queued topics are
+    written in batches from a background thread every CACHE_INVALIDATION_PUBLISH_INTERVAL_SECONDS,
+    so publishing never costs the request that made the write a round trip, and a topic published
+    many times within one interval is only written once.
+    Other processes receive events through a change stream ("auto" mode), or by polling
+    the collection every CACHE_INVALIDATION_POLL_INTERVAL_SECONDS where change streams are unavailable
+    ("poll" mode, and the fallback for "auto"), and call the handlers subscribed to its namespace.
+
+    A process ignores its own events, since its caches are already up to date with its own writes.
+    """
+
+    def __init__(self, get_collection: Callable[[], Collection], mode: str = "auto"):
+        self._get_collection = get_collection
+        self._mode = mode
+        self._handlers: dict[str, list[Callable[[str | None], None]]] = {}
+        self._handlers_lock = threading.Lock()
+        self._source = None
+        self._stop = threading.Event()
+        self._pending_topics: set[str] = set()
+        self._pending_lock = threading.Lock()
+        self._has_pending_topics = threading.Event()
+        self._last_polled_at = None
+        self._seen_event_ids = TTLCache(
+            max_entries=CACHE_INVALIDATION_SEEN_EVENTS_MAX_ENTRIES,
+            ttl_seconds=4 * CACHE_INVALIDATION_POLL_OVERLAP_SECONDS,
+        )
+
+    def subscribe(self, namespace: str, handler: Callable[[str | None], None]) -> None:
+        """
+        Call handler whenever another process publishes a topic in namespace.
+        The handler receives the topic's key, or None for a bare namespace.
+        """
+        with self._handlers_lock:
+            self._handlers.setdefault(namespace, []).append(handler)
+
+    def start(self) -> None:
+        """Start receiving invalidations in the current process. Called once per process."""
+        self._source = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._last_polled_at = datetime.now(timezone.utc)
+
+        if self._mode == "off":
+            return
+
+        receiver_thread = threading.Thread(
+            target=self._run,
+            name="cache-invalidation-bus",
+            daemon=True,
+        )
+        receiver_thread.start()
+
+        publisher_thread = threading.Thread(
+            target=self._run_publisher,
+            name="cache-invalidation-publisher",
+            daemon=True,
+        )
+        publisher_thread.start()
+
+    def stop(self) -> None:
+        """
+        Stop receiving invalidations, and publish any that are still queued before returning,
+        so a short-lived process such as a manage.py command doesn't exit with its invalidations unsent.
+        """
+        self._stop.set()
+        self._has_pending_topics.set()
+        self.flush()
+
+    def publish(self, namespace: str, key: str | None = None) -> None:
+        """
+        Tell other processes to drop anything they have cached for a topic.
+        The event is only queued here, and written by the publisher thread shortly afterwards.
+        """
+        if self._mode == "off":
+            return
+
+        topic = namespace if key is None else f"{namespace}:{key}"
+
+        with self._pending_lock:
+            self._pending_topics.add(topic)
+        self._has_pending_topics.set()
+
+    def _run_publisher(self) -> None:
+        """Write queued events in batches until stopped, then write whatever is still queued."""
+        while True:
+            self._has_pending_topics.wait()
+            # Let a batch gather, so bursts of writes share one insert
+            self._stop.wait(CACHE_INVALIDATION_PUBLISH_INTERVAL_SECONDS)
+            self._has_pending_topics.clear()
+            self.flush()
+
+            if self._stop.is_set():
+                return
+
+    def flush(self) -> None:
+        """
+        Write every queued event with a single insert.
+
+        Failures are logged rather than raised: the writes that made caches stale have already
+        succeeded, and cache TTLs still bound how long other processes serve stale data.
+        """
+        with self._pending_lock:
+            topics, self._pending_topics = self._pending_topics, set()
+
+        if not topics:
+            return
+
+        published_at = datetime.now(timezone.utc)
+
+        try:
+            self._get_collection().insert_many(
+                [{"topic": topic, "source": self._source, "created_at": published_at} for topic in topics],
+                ordered=False,
+            )
+
+        except Exception as e:
+            logger.error("Error publishing %d cache invalidations: %s", len(topics), str(e))
+
+    def _run(self) -> None:
+        """Receive invalidations until stopped, falling back to polling if change streams aren't supported."""
+        use_change_stream = self._mode == "auto"
+
+        while not self._stop.is_set():
+            if use_change_stream:
+                try:
+                    self._watch()
+
+                except OperationFailure as e:
+                    # e.g. a standalone server, which doesn't support change streams
+                    logger.info("Change streams unavailable, polling for cache invalidations: %s", str(e))
+                    use_change_stream = False
+
+                except PyMongoError as e:
+                    logger.warning("Cache invalidation change stream failed, catching up by polling: %s", str(e))
+
+                except Exception as e:
+                    logger.error("Unexpected error watching for cache invalidations: %s", str(e))
+
+            try:
+                self._poll()
+            except PyMongoError as e:
+                logger.warning("Failed to poll for cache invalidations: %s", str(e))
+            except Exception as e:
+                logger.error("Unexpected error polling for cache invalidations: %s", str(e))
+
+            self._stop.wait(CACHE_INVALIDATION_POLL_INTERVAL_SECONDS)
+
+    def _watch(self) -> None:
+        """Dispatch events from a change stream until stopped or the stream fails."""
+        with self._get_collection().watch(
+            [{"$match": {"operationType": "insert"}}],
+            max_await_time_ms=CACHE_INVALIDATION_POLL_INTERVAL_SECONDS * 1000,
+        ) as stream:
+            # Catch up on anything published before the stream opened
+            self._poll()
+
+            while not self._stop.is_set() and stream.alive:
+                watched_at = datetime.now(timezone.utc)
+                change = stream.try_next()
+
+                if change is not None:
+                    self._handle_event(change["fullDocument"])
+
+                # Everything up to here has been delivered, so a fallback poll can start from this point
+                self._last_polled_at = watched_at
+
+    def _poll(self) -> None:
+        """
+        Dispatch events published since the last poll. The previous
+        CACHE_INVALIDATION_POLL_OVERLAP_SECONDS are re-read to allow for clock skew between
+        processes, and events that have already been handled are skipped.
+        """
+        polled_at = datetime.now(timezone.utc)
+        since = self._last_polled_at - timedelta(seconds=CACHE_INVALIDATION_POLL_OVERLAP_SECONDS)
+
+        events = self._get_collection().find({"created_at": {"$gt": since}}).sort("created_at", ASCENDING)
+        for event in events:
+            self._handle_event(event)
+
+        self._last_polled_at = polled_at
+
+    def _handle_event(self, event: dict) -> None:
+        if event.get("source") == self._source or self._seen_event_ids.get(event["_id"]) is not None:
+            return
+
+        self._seen_event_ids.set(event["_id"], True)
+
+        namespace, _, key = event["topic"].partition(":")
+        with self._handlers_lock:
+            handlers = list(self._handlers.get(namespace, []))
+
+        for handler in handlers:
+            try:
+                handler(key or None)
+            except Exception as e:
+                logger.error("Error handling cache invalidation for topic '%s': %s", event["topic"], str(e))
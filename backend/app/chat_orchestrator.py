@@ -1,15 +1,33 @@
 import json
+import os
 import re
 import logging
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable
 
-import openai
-import tiktoken
 from urllib.parse import quote
 
-from app.config.constants import MAX_COST_PER_USER_PER_DAY_USD
+from flask import g, has_request_context
+from pymongo.errors import ConnectionFailure, ServerSelectionTimeoutError
+
+from app.config.constants import (
+    ASK_QUESTION_ESTIMATED_EMBEDDING_TOKENS,
+    ASK_QUESTION_ESTIMATED_INPUT_TOKENS,
+    ASK_QUESTION_ESTIMATED_OUTPUT_TOKENS,
+    BOARD_GAME_CATALOG_TTL_SECONDS,
+    DAILY_SPEND_CACHE_MAX_ENTRIES,
+    DAILY_SPEND_CACHE_SAFE_FRACTION,
+    DAILY_SPEND_CACHE_TTL_SECONDS,
+    DETERMINE_BOARD_GAME_ESTIMATED_INPUT_TOKENS,
+    DETERMINE_BOARD_GAME_ESTIMATED_OUTPUT_TOKENS,
+    MAX_COST_PER_USER_PER_DAY_USD,
+)
 from app.config.models import (
     OPENAI_MODEL_PRICING_USD,
     OPENAI_CHAT_MODEL,
+    OPENAI_EMBEDDING_DIMENSIONS,
     OPENAI_EMBEDDING_MODEL,
 )
 from app.config.prompts import (
@@ -22,22 +40,135 @@ from app.config.prompts import (
     THE_BOARD_GAME_IS_STRING,
     THE_RULEBOOK_PAGES_ARE_STRING,
 )
+from app.board_game_catalog import BoardGameCatalog
+from app.cache_invalidation import CATALOG_TOPIC, USER_TOPIC
+from app.metrics import OPENAI_REQUEST_DURATION, OPENAI_TIME_TO_FIRST_TOKEN, OPENAI_TOKENS
+from app.tracing import SPAN_KIND_CLIENT, span, start_span, traced
 from app.mongodb_client import MongoDBClient
-from app.types import Message, TokenUsage
+from app.types import Message, StoredMessage, TokenUsage
+from app.user_admission import UserAdmissionControl
+from app.utils.cache import TTLCache
+from app.utils.lazy_import import LazyModule
 from config import Config
 
+# Only needed once a question is asked, and openai alone more than doubles the app's import time
+httpx = LazyModule("httpx")
+openai = LazyModule("openai")
+tiktoken = LazyModule("tiktoken")
+
 logger = logging.getLogger(__name__)
 
+
+def _mark_model_called() -> None:
+    """Record on flask.g that the current request has called OpenAI, so its admitted cost is kept."""
+    if has_request_context():
+        g.model_called = True
+
+
 class ChatOrchestrator:
     def __init__(self, config: Config):
-        self._openai_client = openai.OpenAI(api_key=config.OPENAI_API_KEY)
-        self._encoding = tiktoken.encoding_for_model(OPENAI_CHAT_MODEL)
+        self._openai_api_key = config.OPENAI_API_KEY
+        self._openai_max_connections = config.OPENAI_MAX_CONNECTIONS
+        self._openai_client_instance = None
+        self._openai_client_pid = None
+        self._openai_client_lock = threading.Lock()
         self._chat_model_name = OPENAI_CHAT_MODEL
         self._chat_model_pricing_usd = OPENAI_MODEL_PRICING_USD[OPENAI_CHAT_MODEL]
         self._embedding_model_name = OPENAI_EMBEDDING_MODEL
         self._embedding_model_pricing_usd = OPENAI_MODEL_PRICING_USD[OPENAI_EMBEDDING_MODEL]
         self._mongodb_client = MongoDBClient(config=config)
-        self._known_board_games = None
+        self._create_indexes_on_startup = config.MONGODB_CREATE_INDEXES_ON_STARTUP
+        self._indexes_checked = False
+        self._chat_history_max_turns = config.CHAT_HISTORY_MAX_TURNS
+        self._chat_history_max_tokens = config.CHAT_HISTORY_MAX_TOKENS
+        self._board_game_catalog = BoardGameCatalog(
+            self._mongodb_client.get_board_game_catalog,
+            ttl_seconds=BOARD_GAME_CATALOG_TTL_SECONDS,
+        )
+        self._daily_spend_cache = TTLCache(
+            max_entries=DAILY_SPEND_CACHE_MAX_ENTRIES,
+            ttl_seconds=DAILY_SPEND_CACHE_TTL_SECONDS,
+            name="daily_spend",
+        )
+        self._user_admission = UserAdmissionControl(
+            config.USER_ADMISSION_STORAGE_URI,
+            budget_usd=config.USER_REQUEST_BUDGET_USD,
+            refill_usd_per_hour=config.USER_REQUEST_BUDGET_REFILL_USD_PER_HOUR,
+            max_concurrent_streams=config.USER_MAX_CONCURRENT_STREAMS,
+        )
+        # Cost reserved from a user's request budget by each admitted operation, before its actual cost is known
+        self._estimated_costs_usd = {
+            "ask_question": self._get_token_usage_cost_usd({
+                self._embedding_model_name: {"input_tokens": ASK_QUESTION_ESTIMATED_EMBEDDING_TOKENS},
+                self._chat_model_name: {
+                    "input_tokens": ASK_QUESTION_ESTIMATED_INPUT_TOKENS,
+                    "output_tokens": ASK_QUESTION_ESTIMATED_OUTPUT_TOKENS,
+                },
+            }),
+            "determine_board_game": self._get_token_usage_cost_usd({
+                self._chat_model_name: {
+                    "input_tokens": DETERMINE_BOARD_GAME_ESTIMATED_INPUT_TOKENS,
+                    "output_tokens": DETERMINE_BOARD_GAME_ESTIMATED_OUTPUT_TOKENS,
+                },
+            }),
+        }
+        self._streaming_operations = {"ask_question"}
+
+        # Drop cached state that other worker processes have made stale
+        invalidation_bus = self._mongodb_client.invalidation_bus
+        invalidation_bus.subscribe(CATALOG_TOPIC, lambda _: self._board_game_catalog.invalidate())
+        invalidation_bus.subscribe(
+            USER_TOPIC,
+            lambda user_id: self._daily_spend_cache.invalidate(self._get_daily_spend_cache_key(user_id)),
+        )
+
+        try:
+            self._check_indexes()
+        except (ConnectionFailure, ServerSelectionTimeoutError) as e:
+            # MongoDB being down at boot mustn't stop the app starting; warmup retries the check
+            logger.warning("Unable to check MongoDB indexes at startup, will retry during warmup: %s", str(e))
+
+    def _check_indexes(self) -> None:
+        """Create or verify the MongoDB indexes, unless that has already been done."""
+        if self._indexes_checked:
+            return
+
+        if self._create_indexes_on_startup:
+            self._mongodb_client.ensure_indexes()
+        else:
+            self._mongodb_client.verify_indexes()
+
+        self._indexes_checked = True
+
+    @property
+    def _openai_client(self) -> "openai.OpenAI":
+        """
+        The OpenAI client for the current process, created on first use. Like the MongoDB client,
+        it is never shared across a fork, since its connection pool's sockets would be.
+        Its pool is sized so every request thread of a gthread worker can hold a stream open.
+        """
+        if self._openai_client_pid == os.getpid():
+            return self._openai_client_instance
+
+        with self._openai_client_lock:
+            if self._openai_client_pid != os.getpid():
+                self._openai_client_instance = openai.OpenAI(
+                    api_key=self._openai_api_key,
+                    http_client=openai.DefaultHttpxClient(
+                        limits=httpx.Limits(
+                            max_connections=self._openai_max_connections,
+                            max_keepalive_connections=self._openai_max_connections,
+                        ),
+                    ),
+                )
+                self._openai_client_pid = os.getpid()
+
+        return self._openai_client_instance
+
+    @property
+    def _encoding(self) -> "tiktoken.Encoding":
+        """The chat model's tokenizer, loaded on first use. tiktoken caches it, so later calls are cheap."""
+        return tiktoken.encoding_for_model(self._chat_model_name)
 
     def _handle_openai_error(
         self,
@@ -63,10 +194,15 @@ class ChatOrchestrator:
         question: str,
     ):
         try:
-            response = self._openai_client.embeddings.create(
-                model=self._embedding_model_name,
-                input=question
-            )
+            with OPENAI_REQUEST_DURATION.labels(model=self._embedding_model_name, operation="embedding").time(), \
+                    span("openai.embeddings.create", SPAN_KIND_CLIENT, **{
+                        "gen_ai.request.model": self._embedding_model_name,
+                    }):
+                _mark_model_called()
+                response = self._openai_client.embeddings.create(
+                    model=self._embedding_model_name,
+                    input=question
+                )
             return response.data[0].embedding, response.usage.prompt_tokens
 
         except Exception as e:
@@ -82,7 +218,7 @@ class ChatOrchestrator:
 
     def _get_output_message_from_response(
         self,
-        response: openai.types.responses.Response,
+        response: "openai.types.responses.Response",
     ):
         try:
             output_message = next(
@@ -101,23 +237,74 @@ class ChatOrchestrator:
         allow_web_search: bool = False,
     ):
         try:
-            response = self._openai_client.responses.create(
-                model=self._chat_model_name,
-                input=messages,
-                stream=stream,
-                tools=[{
-                    "type": "web_search",
-                }] if allow_web_search else [],
-                store=False,
-            )
+            started_at = time.perf_counter()
+            # For a stream, this span ends once the response has started; _observe_stream traces the rest
+            with span("openai.responses.create", SPAN_KIND_CLIENT, stream=stream, **{
+                "gen_ai.request.model": self._chat_model_name,
+            }):
+                _mark_model_called()
+                response = self._openai_client.responses.create(
+                    model=self._chat_model_name,
+                    input=messages,
+                    stream=stream,
+                    tools=[{
+                        "type": "web_search",
+                    }] if allow_web_search else [],
+                    store=False,
+                )
             if stream:
-                return response
+                return self._observe_stream(response, started_at)
 
+            OPENAI_REQUEST_DURATION.labels(model=self._chat_model_name, operation="response").observe(
+                time.perf_counter() - started_at
+            )
             return self._get_output_message_from_response(response)
 
         except Exception as e:
             self._handle_openai_error(e, "chat completion")
 
+    def _observe_stream(
+        self,
+        stream,
+        started_at: float,
+    ):
+        """
+        Pass a response stream's events through, observing the time to its first text and, if it
+        runs to the end, its duration. Streams the client abandons aren't observed, but are traced.
+        """
+        first_token_at = None
+        # Not made current, since the caller's own steps run between the stream's events
+        stream_span = start_span("openai.responses.stream", SPAN_KIND_CLIENT, **{
+            "gen_ai.request.model": self._chat_model_name,
+        })
+
+        try:
+            for event in stream:
+                if first_token_at is None and event.type == "response.output_text.delta":
+                    first_token_at = time.perf_counter()
+                    OPENAI_TIME_TO_FIRST_TOKEN.labels(model=self._chat_model_name).observe(first_token_at - started_at)
+                    if stream_span is not None:
+                        stream_span.set_attribute("time_to_first_token_ms", round((first_token_at - started_at) * 1000))
+                yield event
+
+        except GeneratorExit:
+            if stream_span is not None:
+                stream_span.set_attribute("cancelled", True)
+            raise
+
+        except Exception as e:
+            if stream_span is not None:
+                stream_span.record_error(e)
+            raise
+
+        finally:
+            if stream_span is not None:
+                stream_span.end()
+
+        OPENAI_REQUEST_DURATION.labels(model=self._chat_model_name, operation="response_stream").observe(
+            time.perf_counter() - started_at
+        )
+
     def _construct_rulebook_link(
         self,
         board_game: str,
@@ -140,7 +327,7 @@ class ChatOrchestrator:
             citation_str = match.group(0)
             json_str = citation_str.replace("'", '"')
             citation_dict = json.loads(json_str)
-            
+
             if not isinstance(citation_dict, dict):
                 raise ValueError("Citation must be a dictionary")
             if "rulebook_name" not in citation_dict or "page_num" not in citation_dict:
@@ -151,7 +338,7 @@ class ChatOrchestrator:
                 raise ValueError("page_num must be an integer or string")
             if not citation_dict["rulebook_name"].strip():
                 raise ValueError("rulebook_name cannot be empty")
-            
+
             display_text = f"{citation_dict['rulebook_name']}, Page {citation_dict['page_num']}"
             link = self._construct_rulebook_link(board_game, citation_dict)
 
@@ -165,7 +352,7 @@ class ChatOrchestrator:
 
     def _convert_to_user_facing_message(
         self,
-        message: Message,
+        message: StoredMessage,
     ):
         content = message["content"]
         if message["role"] == "user":
@@ -180,10 +367,10 @@ class ChatOrchestrator:
             ):
                 content = content.split(USER_QUESTION_STRING)[1].strip()
 
-            return {"content": content, "role": "user"}
+            return {"content": content, "role": "user", "index": message["seq"]}
 
         if message["role"] == "assistant":
-            return {"content": content, "role": "assistant"}
+            return {"content": content, "role": "assistant", "index": message["seq"]}
 
         raise ValueError(f"Invalid role value '{message['role']}', expected 'user' or 'assistant'")
 
@@ -229,18 +416,89 @@ class ChatOrchestrator:
 
         return total_cost
 
+    def _get_daily_spend_cache_key(
+        self,
+        user_id: str,
+    ):
+        return user_id, datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+    @traced()
+    def _record_turn(
+        self,
+        user_id: str,
+        model_token_usages: dict[str, TokenUsage],
+        board_game: str | None = None,
+        messages: list[Message] | None = None,
+        estimated_cost_usd: float = 0.0,
+    ):
+        self._mongodb_client.record_turn(
+            user_id=user_id,
+            model_token_usages=model_token_usages,
+            board_game=board_game,
+            messages=messages,
+        )
+
+        for model_name, model_usage in model_token_usages.items():
+            OPENAI_TOKENS.labels(model=model_name, type="input").inc(model_usage["input_tokens"])
+            if "output_tokens" in model_usage:
+                OPENAI_TOKENS.labels(model=model_name, type="output").inc(model_usage["output_tokens"])
+
+        # Keep this worker's view of the user's spend current without re-reading it
+        cost_usd = self._get_token_usage_cost_usd(model_token_usages)
+        self._daily_spend_cache.update(
+            self._get_daily_spend_cache_key(user_id),
+            lambda cached_cost_usd: cached_cost_usd + cost_usd,
+        )
+
+        # The estimate was taken from the user's request budget when the request was admitted
+        self._user_admission.charge(user_id, cost_usd - estimated_cost_usd)
+
+    def get_warmup_steps(self) -> dict[str, Callable[[], None]]:
+        """Get the steps that prime this process's clients and caches before it serves traffic, by name."""
+        return {
+            "tokenizer": lambda: self._get_token_count("Warming up the tokenizer"),
+            "mongodb": lambda: self._mongodb_client.connect(),
+            "indexes": self._check_indexes,
+            "board_game_catalog": lambda: self._board_game_catalog.names(),
+            "vector_search": self._warm_up_vector_search,
+            "openai": self._warm_up_openai_connection,
+        }
+
+    def _warm_up_vector_search(self) -> None:
+        """Run a throwaway vector search, so the first question doesn't pay for a cold search index."""
+        board_games = self._board_game_catalog.names()
+        if not board_games:
+            return
+
+        unit_embedding = [OPENAI_EMBEDDING_DIMENSIONS ** -0.5] * OPENAI_EMBEDDING_DIMENSIONS
+        self._mongodb_client.get_similar_rulebook_pages(board_games[0], unit_embedding, limit=1)
+
+    def _warm_up_openai_connection(self) -> None:
+        """Open a TLS connection to OpenAI with a free request, leaving it in the connection pool."""
+        self._openai_client.models.retrieve(self._chat_model_name)
+
     def get_known_board_games(self) -> list[str]:
-        if self._known_board_games is None:
-            self._known_board_games = self._mongodb_client.get_all_board_games()
+        return self._board_game_catalog.names()
 
-        return self._known_board_games
+    def is_known_board_game(self, board_game: str) -> bool:
+        return board_game in self._board_game_catalog
 
+    @traced()
     def get_message_history(
         self,
         user_id: str,
         board_game: str,
+        limit: int | None = None,
+        before: int | None = None,
+        since: int | None = None,
     ):
-        message_history = self._mongodb_client.get_message_history(user_id, board_game)
+        message_history = self._mongodb_client.get_message_history(
+            user_id,
+            board_game,
+            limit=limit,
+            before=before,
+            since=since,
+        )
 
         return [
             self._convert_to_user_facing_message(message)
@@ -265,6 +523,7 @@ class ChatOrchestrator:
     ):
         self._mongodb_client.clear_message_history(user_id, board_game)
 
+    @traced()
     def determine_board_game(
         self,
         user_id: str,
@@ -277,20 +536,25 @@ class ChatOrchestrator:
         }
         response = self._call_openai_model([message], stream=False)
 
-        self._mongodb_client.increment_todays_token_usage(
+        self._record_turn(
             user_id=user_id,
-            model_name=self._chat_model_name,
-            input_tokens=self._get_token_count(prompt),
-            output_tokens=self._get_token_count(response),
+            model_token_usages={
+                self._chat_model_name: {
+                    "input_tokens": self._get_token_count(prompt),
+                    "output_tokens": self._get_token_count(response),
+                },
+            },
+            estimated_cost_usd=self._estimated_costs_usd["determine_board_game"],
         )
 
-        if response in self.get_known_board_games() or response == UNKNOWN_VALUE:
+        if self.is_known_board_game(response) or response == UNKNOWN_VALUE:
             return response
 
         raise ValueError(
             f"Received an unexpected response when attempting to determine board game: {response}"
         )
 
+    @traced()
     def ask_question(
         self,
         user_id: str,
@@ -298,12 +562,92 @@ class ChatOrchestrator:
         question: str,
     ):
         embedding, token_count = self._get_embedding_and_token_count(question)
-        self._mongodb_client.increment_todays_token_usage(
+
+        # Usage is recorded alongside the new messages in a single write at the end of the turn
+        model_token_usages = {
+            self._embedding_model_name: {
+                "input_tokens": token_count,
+            },
+        }
+
+        try:
+            messages = yield from self._answer_question(
+                user_id,
+                board_game,
+                question,
+                embedding,
+                model_token_usages,
+            )
+
+        except (Exception, GeneratorExit):
+            # Still account for the embedding if the answer failed or the client disconnected part-way
+            self._record_turn(
+                user_id=user_id,
+                model_token_usages=model_token_usages,
+                estimated_cost_usd=self._estimated_costs_usd["ask_question"],
+            )
+            raise
+
+        self._record_turn(
             user_id=user_id,
-            model_name=self._embedding_model_name,
-            input_tokens=token_count,
+            model_token_usages=model_token_usages,
+            board_game=board_game,
+            messages=messages,
+            estimated_cost_usd=self._estimated_costs_usd["ask_question"],
         )
 
+    @traced()
+    def _get_recent_message_history(
+        self,
+        user_id: str,
+        board_game: str,
+    ) -> tuple[list[Message], bool]:
+        """
+        Get the most recent turns of a conversation to send to the model, limited to
+        CHAT_HISTORY_MAX_TURNS turns and CHAT_HISTORY_MAX_TOKENS tokens. Older turns are dropped
+        whole, so the returned history always starts with a user message.
+
+        Also returns whether the conversation is empty.
+        """
+        if self._chat_history_max_turns == 0:
+            recent_messages = self._mongodb_client.get_recent_messages(user_id, board_game, 1)
+            return [], len(recent_messages) == 0
+
+        recent_messages = self._mongodb_client.get_recent_messages(
+            user_id,
+            board_game,
+            2 * self._chat_history_max_turns,
+        )
+        message_history = [
+            {"content": message["content"], "role": message["role"]}
+            for message in recent_messages
+        ]
+        token_counts = [self._get_token_count(message["content"]) for message in message_history]
+        total_tokens = sum(token_counts)
+
+        start = 0
+        while start < len(message_history) and (
+            total_tokens > self._chat_history_max_tokens or
+            message_history[start]["role"] != "user"
+        ):
+            total_tokens -= token_counts[start]
+            start += 1
+
+        return message_history[start:], len(recent_messages) == 0
+
+    @traced()
+    def _answer_question(
+        self,
+        user_id: str,
+        board_game: str,
+        question: str,
+        embedding: list[float],
+        model_token_usages: dict[str, TokenUsage],
+    ):
+        """
+        Stream an answer to a question, adding the chat model's usage to model_token_usages.
+        Returns the user and assistant messages to store once the answer is complete.
+        """
         # Get N most relevant pages of rulebooks for the selected board game
         # and construct a prompt with these pages in them
         rulebook_pages = self._mongodb_client.get_similar_rulebook_pages(
@@ -324,20 +668,26 @@ class ChatOrchestrator:
             .replace("<QUESTION>", question)
         )
 
-        message_history = self._mongodb_client.get_message_history(user_id, board_game)
+        message_history, is_first_message = self._get_recent_message_history(user_id, board_game)
 
         # Prepend the system prompt if this is the first message
-        if len(message_history) == 0:
+        if is_first_message:
             prompt = SYSTEM_PROMPT + prompt
 
         user_message = {
             "content": prompt,
             "role": "user"
         }
+        messages = message_history + [user_message]
+
+        # The system prompt is stored with the first message, which may have fallen out of the window
+        if not messages[0]["content"].startswith(SYSTEM_PROMPT):
+            messages[0] = {"content": SYSTEM_PROMPT + messages[0]["content"], "role": messages[0]["role"]}
+
         input_tokens = self._get_token_count(prompt)
 
         stream = self._call_openai_model(
-            messages=message_history + [user_message],
+            messages=messages,
             stream=True,
             allow_web_search=True,
         )
@@ -378,7 +728,7 @@ class ChatOrchestrator:
                     else:
                         full_response += content
                         yield content
-            
+
             elif event.type == "response.web_search_call.completed":
                 web_search_count += 1
 
@@ -388,18 +738,13 @@ class ChatOrchestrator:
         }
         output_tokens = self._get_token_count(full_response)
 
-        self._mongodb_client.append_messages(
-            user_id=user_id,
-            board_game=board_game,
-            messages=[user_message, assistant_message],
-        )
-        self._mongodb_client.increment_todays_token_usage(
-            user_id=user_id,
-            model_name=self._chat_model_name,
-            input_tokens=input_tokens,
-            output_tokens=output_tokens,
-            web_searches=web_search_count,
-        )
+        model_token_usages[self._chat_model_name] = {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "web_searches": web_search_count,
+        }
+
+        return [user_message, assistant_message]
 
     def submit_feedback(
         self,
@@ -419,14 +764,58 @@ class ChatOrchestrator:
     def set_user_theme(self, user_id: str, theme: int) -> None:
         self._mongodb_client.set_user_theme(user_id, theme)
 
+    @traced()
     def user_has_exceeded_daily_token_limit(
         self,
         user_id: str,
     ):
-        model_token_usages = self._mongodb_client.get_todays_token_usage(user_id)
-        if not model_token_usages:
+        cache_key = self._get_daily_spend_cache_key(user_id)
+
+        # Users comfortably under the limit don't need an up-to-date figure
+        cached_cost_usd = self._daily_spend_cache.get(cache_key)
+        if (
+            cached_cost_usd is not None and
+            cached_cost_usd < MAX_COST_PER_USER_PER_DAY_USD * DAILY_SPEND_CACHE_SAFE_FRACTION
+        ):
             return False
 
+        model_token_usages = self._mongodb_client.get_todays_token_usage(user_id)
         cost_usd = self._get_token_usage_cost_usd(model_token_usages)
+        self._daily_spend_cache.set(cache_key, cost_usd)
 
         return cost_usd > MAX_COST_PER_USER_PER_DAY_USD
+
+    @traced()
+    def admit_request(
+        self,
+        user_id: str,
+        operation: str,
+    ) -> str | None:
+        """
+        Reserve the estimated cost of an operation ("ask_question" or "determine_board_game") from the
+        user's request budget, and a stream slot if it streams. Returns the stream slot's ID.
+        Raises AdmissionDeniedError if the user has to wait first.
+        """
+        return self._user_admission.acquire(
+            user_id,
+            self._estimated_costs_usd[operation],
+            stream=operation in self._streaming_operations,
+        )
+
+    @traced()
+    def release_request(
+        self,
+        user_id: str,
+        operation: str,
+        lease_id: str | None = None,
+        refund: bool = False,
+    ) -> None:
+        """
+        Free an admitted request's stream slot. With refund, the reserved cost is returned too,
+        for requests rejected before calling the model.
+        """
+        self._user_admission.release(
+            user_id,
+            lease_id=lease_id,
+            refund_usd=self._estimated_costs_usd[operation] if refund else 0.0,
+        )
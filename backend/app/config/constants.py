@@ -1,6 +1,50 @@
 # Configuration constants
 DEFAULT_TIMEOUT_SECONDS = 5
 MAX_COST_PER_USER_PER_DAY_USD = 0.01
+MONGODB_HEALTH_CHECK_INTERVAL_SECONDS = 60
+MAX_MESSAGE_INSERT_ATTEMPTS = 3
+MAX_MESSAGE_HISTORY_PAGE_SIZE = 100
+TOKEN_USAGE_RETENTION_DAYS = 90
+CONVERSATION_CACHE_MAX_ENTRIES = 1000
+CONVERSATION_CACHE_TTL_SECONDS = 30
+BOARD_GAME_CATALOG_TTL_SECONDS = 60
+LAST_ACTIVE_CACHE_MAX_ENTRIES = 10000
+# Each process writes a user's last_active at most once per this many seconds
+LAST_ACTIVE_DEBOUNCE_SECONDS = 300
+DAILY_SPEND_CACHE_MAX_ENTRIES = 10000
+DAILY_SPEND_CACHE_TTL_SECONDS = 60
+# Cached spend below this fraction of MAX_COST_PER_USER_PER_DAY_USD skips the database read
+DAILY_SPEND_CACHE_SAFE_FRACTION = 0.5
+# Other processes drop invalidated cache entries within roughly this delay when polling
+CACHE_INVALIDATION_POLL_INTERVAL_SECONDS = 2
+CACHE_INVALIDATION_POLL_OVERLAP_SECONDS = 10
+# Each process writes the invalidations it has queued at most once per this many seconds
+CACHE_INVALIDATION_PUBLISH_INTERVAL_SECONDS = 0.1
+CACHE_INVALIDATION_SEEN_EVENTS_MAX_ENTRIES = 10000
+CACHE_INVALIDATION_EVENT_RETENTION_SECONDS = 60 * 60
+# Each process deletes expired rate limit counters from the SQLite store at most once per this many seconds
+RATE_LIMIT_STORAGE_PURGE_INTERVAL_SECONDS = 60
+# How long a process waits for another to release a shared SQLite database's write lock
+SQLITE_BUSY_TIMEOUT_SECONDS = 5
+# Usage reserved from a user's request budget before a request runs, corrected once its actual usage is known
+ASK_QUESTION_ESTIMATED_EMBEDDING_TOKENS = 250
+ASK_QUESTION_ESTIMATED_INPUT_TOKENS = 4000
+ASK_QUESTION_ESTIMATED_OUTPUT_TOKENS = 500
+DETERMINE_BOARD_GAME_ESTIMATED_INPUT_TOKENS = 500
+DETERMINE_BOARD_GAME_ESTIMATED_OUTPUT_TOKENS = 10
+# A stream's slot is released when it closes, or after this long if its worker dies mid-stream
+USER_STREAM_LEASE_SECONDS = 300
+# Clients refused a stream slot are asked to retry after this long, since streams have no fixed end
+USER_STREAM_RETRY_AFTER_SECONDS = 5
+USER_ADMISSION_PURGE_INTERVAL_SECONDS = 60
+# Readiness probes retry failed warmup steps at most once per this many seconds
+WARMUP_RETRY_INTERVAL_SECONDS = 10
+# Spans recorded beyond this many in one request are dropped, and counted in the exported trace
+TRACING_MAX_SPANS_PER_TRACE = 1000
+# A profiled request's thread is sampled this often; requests using less CPU than this may record nothing
+PROFILING_SAMPLE_INTERVAL_SECONDS = 0.005
+# Each worker process profiles at most this many requests at once
+PROFILING_MAX_CONCURRENT_REQUESTS = 2
 
 # Error message constants
 # User ID validation errors
@@ -17,9 +61,16 @@ ERROR_TOKEN_DOES_NOT_CONTAIN_USER_ID = "Token does not contain a user ID"
 ERROR_INVALID_USER_ID = "Invalid user ID"
 ERROR_INVALID_HEADER_NO_KID = "Invalid header: No KID"
 ERROR_UNABLE_TO_FIND_APPROPRIATE_KEY = "Unable to find appropriate key"
+ERROR_SIGNING_KEYS_NOT_LOADED = "Signing keys have not been loaded yet, please try again shortly"
 ERROR_INVALID_TOKEN = "Invalid token"
 ERROR_AUTH0_CONFIGURATION_NOT_PROPERLY_SET_UP = "Auth0 configuration is not properly set up"
-ERROR_ERROR_EXTRACTING_USER_ID = "Error extracting user ID"
+
+# Admission errors
+ERROR_REQUEST_BUDGET_EXCEEDED = "You are sending questions too quickly, please try again shortly"
+ERROR_TOO_MANY_CONCURRENT_STREAMS = "Please wait for your other answers to finish before asking another question"
+
+# Readiness errors
+ERROR_NOT_READY = "Service is warming up"
 
 # Validation errors (generic patterns used in multiple validators)
 ERROR_CANNOT_BE_EMPTY = "cannot be empty"
@@ -0,0 +1,69 @@
+# MongoDB index definitions required by MongoDBClient queries
+from pymongo import ASCENDING
+
+from .constants import CACHE_INVALIDATION_EVENT_RETENTION_SECONDS, TOKEN_USAGE_RETENTION_DAYS
+
+MONGODB_INDEXES = [
+    {
+        "collection": "user_data",
+        "keys": [("user_id", ASCENDING)],
+        "options": {"name": "user_id", "unique": True},
+    },
+    {
+        "collection": "feedback",
+        "keys": [("user_id", ASCENDING)],
+        "options": {"name": "user_id", "unique": True},
+    },
+    {
+        "collection": "rulebook_pages",
+        "keys": [("board_game", ASCENDING), ("rulebook_name", ASCENDING)],
+        "options": {"name": "board_game_rulebook_name"},
+    },
+    {
+        "collection": "board_games",
+        "keys": [("name", ASCENDING)],
+        "options": {"name": "name", "unique": True},
+    },
+    {
+        "collection": "messages",
+        "keys": [("user_id", ASCENDING), ("board_game", ASCENDING), ("seq", ASCENDING)],
+        "options": {"name": "user_id_board_game_seq", "unique": True},
+    },
+    {
+        "collection": "token_usage",
+        "keys": [("user_id", ASCENDING), ("date", ASCENDING)],
+        "options": {"name": "user_id_date", "unique": True},
+    },
+    {
+        "collection": "token_usage",
+        "keys": [("created_at", ASCENDING)],
+        "options": {"name": "created_at_ttl", "expireAfterSeconds": TOKEN_USAGE_RETENTION_DAYS * 24 * 60 * 60},
+    },
+    {
+        "collection": "cache_invalidations",
+        "keys": [("created_at", ASCENDING)],
+        "options": {"name": "created_at_ttl", "expireAfterSeconds": CACHE_INVALIDATION_EVENT_RETENTION_SECONDS},
+    },
+]
+
+# Atlas Vector Search index used by MongoDBClient.get_similar_rulebook_pages
+VECTOR_SEARCH_INDEX_NAME = "embedding_index"
+VECTOR_SEARCH_INDEX = {
+    "collection": "rulebook_pages",
+    "name": VECTOR_SEARCH_INDEX_NAME,
+    "type": "vectorSearch",
+    "definition": {
+        "fields": [
+            {
+                "type": "vector",
+                "path": "embedding",
+                "numDimensions": 1536,
+                "similarity": "cosine",
+            },
+            {
+                "type": "filter",
+                "path": "board_game",
+            },
+        ]
+    },
+}
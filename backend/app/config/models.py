@@ -1,6 +1,7 @@
 # AI model configurations
 OPENAI_CHAT_MODEL = "gpt-4o-mini"
 OPENAI_EMBEDDING_MODEL = "text-embedding-ada-002"
+OPENAI_EMBEDDING_DIMENSIONS = 1536
 OPENAI_MODEL_PRICING_USD = {
     "gpt-4o-mini": {
         "one_million_input_tokens": 0.15,
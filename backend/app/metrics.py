@@ -0,0 +1,131 @@
+"""
+Prometheus metrics for requests, OpenAI and MongoDB calls, answer streams, caches and admission.
+
+Under gunicorn, gunicorn.conf.py sets PROMETHEUS_MULTIPROC_DIR before any worker imports this
+module, so each worker writes its samples to files in that directory and render_metrics()
+aggregates every worker's samples, whichever worker serves the scrape. Without it, as under the
+development server and in tests, metrics are kept in the process's default registry.
+"""
+import os
+import time
+
+from flask import Response, g, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+# Answer streams last tens of seconds, so request buckets go well past the default 10s
+REQUEST_DURATION_BUCKETS_SECONDS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+TIME_TO_FIRST_TOKEN_BUCKETS_SECONDS = (0.1, 0.25, 0.5, 1, 2, 3, 5, 8, 13, 20, 30)
+MONGODB_DURATION_BUCKETS_SECONDS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+HTTP_REQUESTS = Counter(
+    "bgchat_http_requests_total",
+    "HTTP requests served, by route and status code.",
+    ["method", "route", "status"],
+)
+HTTP_REQUEST_DURATION = Histogram(
+    "bgchat_http_request_duration_seconds",
+    "Time from receiving a request to sending the last byte of its response, including streamed answers.",
+    ["method", "route"],
+    buckets=REQUEST_DURATION_BUCKETS_SECONDS,
+)
+ACTIVE_STREAMS = Gauge(
+    "bgchat_active_streams",
+    "Server-sent event streams currently open.",
+    multiprocess_mode="livesum",
+)
+
+OPENAI_REQUEST_DURATION = Histogram(
+    "bgchat_openai_request_duration_seconds",
+    "Duration of OpenAI API calls, until the last event for streamed responses.",
+    ["model", "operation"],
+    buckets=REQUEST_DURATION_BUCKETS_SECONDS,
+)
+OPENAI_TIME_TO_FIRST_TOKEN = Histogram(
+    "bgchat_openai_time_to_first_token_seconds",
+    "Time from calling OpenAI to receiving the first text of a streamed response.",
+    ["model"],
+    buckets=TIME_TO_FIRST_TOKEN_BUCKETS_SECONDS,
+)
+OPENAI_TOKENS = Counter(
+    "bgchat_openai_tokens_total",
+    "Tokens used by OpenAI calls, by model and whether they were input or output.",
+    ["model", "type"],
+)
+
+MONGODB_OPERATION_DURATION = Histogram(
+    "bgchat_mongodb_operation_duration_seconds",
+    "Duration of MongoDBClient operations, by method.",
+    ["operation"],
+    buckets=MONGODB_DURATION_BUCKETS_SECONDS,
+)
+
+CACHE_LOOKUPS = Counter(
+    "bgchat_cache_lookups_total",
+    "In-process cache lookups, by cache and whether they hit or missed.",
+    ["cache", "result"],
+)
+
+REQUEST_REJECTIONS = Counter(
+    "bgchat_request_rejections_total",
+    "Requests refused by rate limits, per-user admission or the daily cost limit, by reason.",
+    ["reason"],
+)
+
+
+def start_request_timer() -> None:
+    """Note when the request started, for its duration. Registered as a before_request hook."""
+    g.request_started_at = time.perf_counter()
+
+
+def observe_request(response: Response) -> Response:
+    """
+    Count the request and observe its duration. Registered as an after_request hook.
+    Streamed responses, including answers and PDFs, are observed when their stream closes.
+    """
+    started_at = g.get("request_started_at", time.perf_counter())
+    # The URL rule rather than the path, so each route is one label however many PDFs or games there are
+    route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    method = request.method
+    status = str(response.status_code)
+    is_event_stream = response.is_streamed and response.mimetype == "text/event-stream"
+
+    if is_event_stream:
+        ACTIVE_STREAMS.inc()
+
+    def observe():
+        if is_event_stream:
+            ACTIVE_STREAMS.dec()
+        HTTP_REQUESTS.labels(method=method, route=route, status=status).inc()
+        HTTP_REQUEST_DURATION.labels(method=method, route=route).observe(time.perf_counter() - started_at)
+
+    if response.is_streamed:
+        response.call_on_close(observe)
+    else:
+        observe()
+
+    return response
+
+
+def record_rate_limit_breach(_request_limit) -> None:
+    """Count a request refused by flask-limiter. Passed to the Limiter as on_breach."""
+    REQUEST_REJECTIONS.labels(reason="rate_limit").inc()
+
+
+def render_metrics() -> tuple[bytes, str]:
+    """Get every metric in the Prometheus text format, and its content type."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+
+    return generate_latest(registry), CONTENT_TYPE_LATEST
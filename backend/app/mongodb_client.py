@@ -1,21 +1,86 @@
 import logging
-import time
+import os
+import threading
 from datetime import datetime, timezone
+from functools import wraps
 
-from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure, ServerSelectionTimeoutError
+from pymongo import ASCENDING, DESCENDING, MongoClient, UpdateOne
+from pymongo.database import Database
+from pymongo.errors import ConnectionFailure, DuplicateKeyError, OperationFailure, ServerSelectionTimeoutError
+from pymongo.operations import SearchIndexModel
 from pymongo.results import UpdateResult
 from urllib.parse import quote_plus
 
-from app.types import Message, RulebookPage, TokenUsage
+from app.cache_invalidation import CATALOG_TOPIC, USER_TOPIC, CacheInvalidationBus
+from app.config.constants import (
+    CONVERSATION_CACHE_MAX_ENTRIES,
+    CONVERSATION_CACHE_TTL_SECONDS,
+    LAST_ACTIVE_CACHE_MAX_ENTRIES,
+    LAST_ACTIVE_DEBOUNCE_SECONDS,
+    MAX_MESSAGE_INSERT_ATTEMPTS,
+    MONGODB_HEALTH_CHECK_INTERVAL_SECONDS,
+)
+from app.config.indexes import MONGODB_INDEXES, VECTOR_SEARCH_INDEX, VECTOR_SEARCH_INDEX_NAME
+from app.metrics import MONGODB_OPERATION_DURATION
+from app.tracing import SPAN_KIND_CLIENT, span
+from app.types import BoardGame, CatalogRulebook, Message, RulebookPage, StoredMessage, TokenUsage
+from app.utils.cache import TTLCache
 from config import Config
 
 logger = logging.getLogger(__name__)
 
+
+def _observe_operation(method):
+    """
+    Decorator that observes how long each operation takes, whether or not it fails, and traces it.
+
+    Operations that fail because the server is unreachable are logged and re-raised. The client
+    is never rebuilt: the driver's server monitoring reconnects on its own once the server is
+    back, and retryable reads/writes already absorb transient blips.
+    """
+    operation_duration = MONGODB_OPERATION_DURATION.labels(operation=method.__name__)
+    span_name = f"MongoDBClient.{method.__name__}"
+
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        try:
+            with operation_duration.time(), span(span_name, SPAN_KIND_CLIENT, **{"db.system": "mongodb"}):
+                return method(self, *args, **kwargs)
+        except (ConnectionFailure, ServerSelectionTimeoutError) as e:
+            logger.warning("MongoDB unreachable during %s: %s", method.__name__, str(e))
+            raise
+
+    return wrapper
+
+
+def _slice_message_history(
+    messages: list[StoredMessage],
+    limit: int | None,
+    before: int | None,
+    since: int | None,
+) -> list[StoredMessage]:
+    """
+    Apply get_message_history's limit/before/since bounds to a full, in-order conversation.
+    Bounds are matched against each message's seq, as the database query does, not its position.
+    """
+    messages = [
+        message for message in messages
+        if (since is None or message["seq"] >= since) and (before is None or message["seq"] < before)
+    ]
+
+    if limit is not None:
+        messages = messages[-limit:]
+
+    return list(messages)
+
+
 class MongoDBClient:
     """
     Singleton client for MongoDB database operations.
     Handles connection management and data persistence.
+
+    The underlying MongoClient is created lazily, once per process, so a client
+    constructed before a fork (e.g. gunicorn --preload) is never shared with workers.
     """
     _instance = None
     _initialized = False
@@ -28,11 +93,67 @@ class MongoDBClient:
     def __init__(self, config: Config):
         if not self._initialized:
             self.config = config
-            self.client = None
-            self.db = None
-            self._connect()
+            self._client = None
+            self._db = None
+            self._pid = None
+            self._connection_lock = threading.Lock()
+            self._health_probe_stop = threading.Event()
+            self._conversation_cache = TTLCache(
+                max_entries=CONVERSATION_CACHE_MAX_ENTRIES,
+                ttl_seconds=CONVERSATION_CACHE_TTL_SECONDS,
+                name="conversations",
+                group_key=lambda key: key[0],
+            )
+            self._last_active_cache = TTLCache(
+                max_entries=LAST_ACTIVE_CACHE_MAX_ENTRIES,
+                ttl_seconds=LAST_ACTIVE_DEBOUNCE_SECONDS,
+                name="last_active",
+            )
+            self.invalidation_bus = CacheInvalidationBus(
+                lambda: self.db.cache_invalidations,
+                mode=config.CACHE_INVALIDATION_MODE,
+            )
+            self.invalidation_bus.subscribe(USER_TOPIC, self._invalidate_user_conversations)
             self._initialized = True
 
+    @property
+    def client(self) -> MongoClient:
+        """The MongoClient for the current process, connecting first if necessary."""
+        if self._pid != os.getpid():
+            self.connect()
+        return self._client
+
+    @property
+    def db(self) -> Database:
+        """The database for the current process, connecting first if necessary."""
+        if self._pid != os.getpid():
+            self.connect()
+        return self._db
+
+    @db.setter
+    def db(self, db: Database) -> None:
+        self._db = db
+        self._pid = os.getpid()
+
+    def connect(self) -> None:
+        """
+        Connect to MongoDB if this process doesn't already have a connection.
+        A change of PID means we are in a forked child, so a new client is created
+        rather than reusing the parent's connection pool and monitoring threads.
+        """
+        with self._connection_lock:
+            current_pid = os.getpid()
+            if self._pid == current_pid:
+                return
+
+            if self._pid is not None:
+                logger.info("Process forked (PID %d -> %d), creating a new MongoDB client", self._pid, current_pid)
+
+            self._connect()
+            self._start_health_probe()
+            self._pid = current_pid
+            self.invalidation_bus.start()
+
     def _get_mongodb_uri(self) -> str:
         """Get the MongoDB connection URI with proper encoding."""
         username = quote_plus(self.config.MONGODB_USERNAME)
@@ -41,43 +162,71 @@ class MongoDBClient:
 
         return f"mongodb+srv://{username}:{password}@{host}/?retryWrites=true&w=majority"
 
-    def _connect(self) -> None:
-        """Establish connection to MongoDB with retry logic."""
-        max_retries = 3
-        retry_count = 0
-        while retry_count < max_retries:
-            try:
-                self.client = MongoClient(self._get_mongodb_uri())
-                self.client.admin.command("ping")
-                logger.info("Successfully connected to MongoDB server")
+    def _get_client_options(self) -> dict:
+        """Get the connection pool, timeout and compression options for the MongoClient."""
+        options = {
+            "retryReads": True,
+            "retryWrites": True,
+            "maxPoolSize": self.config.MONGODB_MAX_POOL_SIZE,
+            "minPoolSize": self.config.MONGODB_MIN_POOL_SIZE,
+            "connectTimeoutMS": self.config.MONGODB_CONNECT_TIMEOUT_MS,
+            "socketTimeoutMS": self.config.MONGODB_SOCKET_TIMEOUT_MS,
+            "serverSelectionTimeoutMS": self.config.MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+        }
 
-                self.db = self.client[self.config.MONGODB_DB_NAME]
-                logger.info("Successfully loaded database '%s'", self.config.MONGODB_DB_NAME)
+        if self.config.MONGODB_COMPRESSORS:
+            options["compressors"] = self.config.MONGODB_COMPRESSORS
 
-                return
+        return options
 
-            except (ConnectionFailure, ServerSelectionTimeoutError) as e:
-                retry_count += 1
-                if retry_count == max_retries:
-                    logger.error(
-                        "Failed to connect to MongoDB after %d attempts: %s", max_retries, str(e)
-                    )
-                    raise
+    def _connect(self) -> None:
+        """
+        Create this process's MongoClient and check the server is reachable.
+        There is a single attempt, with no sleeping between retries, since this can run on a
+        request thread; if it fails the next use of the database simply tries again.
+        """
+        client = MongoClient(self._get_mongodb_uri(), **self._get_client_options())
+        try:
+            client.admin.command("ping")
+        except (ConnectionFailure, ServerSelectionTimeoutError) as e:
+            logger.error("Failed to connect to MongoDB: %s", str(e))
+            # Don't leak the failed client's connection pool and monitoring threads
+            client.close()
+            raise
 
-                logger.warning(
-                    "Failed to connect to MongoDB, attempt %d/%d", retry_count, max_retries
-                )
+        logger.info("Successfully connected to MongoDB server")
 
-                time.sleep(2 ** retry_count)
+        # A client inherited from the parent process is dropped rather than closed,
+        # since its sockets are shared with the parent, which is still using them
+        self._client = client
+        self._db = client[self.config.MONGODB_DB_NAME]
+        logger.info("Successfully loaded database '%s'", self.config.MONGODB_DB_NAME)
 
-    def _ensure_connection(self) -> None:
-        """Ensure MongoDB connection is active, reconnect if necessary."""
-        try:
-            self.client.admin.command("ping")
+    def _start_health_probe(self) -> None:
+        """
+        Start a low-frequency background thread that pings the server and logs when it
+        becomes unreachable. Operations themselves never ping before running.
+        """
+        thread = threading.Thread(
+            target=self._run_health_probe,
+            name="mongodb-health-probe",
+            daemon=True,
+        )
+        thread.start()
 
-        except (ConnectionFailure, ServerSelectionTimeoutError):
-            logger.warning("MongoDB connection lost, attempting to reconnect...")
-            self._connect()
+    def _run_health_probe(self) -> None:
+        """Ping the server every MONGODB_HEALTH_CHECK_INTERVAL_SECONDS until stopped."""
+        while not self._health_probe_stop.wait(MONGODB_HEALTH_CHECK_INTERVAL_SECONDS):
+            try:
+                self._client.admin.command("ping")
+            except (ConnectionFailure, ServerSelectionTimeoutError) as e:
+                logger.warning("MongoDB health probe failed: %s", str(e))
+            except Exception as e:
+                logger.error("Unexpected error during MongoDB health probe: %s", str(e))
+
+    def _invalidate_user_conversations(self, user_id: str) -> None:
+        """Drop every cached conversation for a user, e.g. after another process wrote to one."""
+        self._conversation_cache.invalidate_group(user_id)
 
     def _get_current_datetime_utc(self) -> datetime:
         """Get the current UTC time."""
@@ -90,6 +239,235 @@ class MongoDBClient:
             logger.error(error_message)
             raise ValueError(error_message)
 
+    def _get_next_message_seq(self, user_id: str, board_game: str) -> int:
+        """
+        Get the sequence number the next message for a given user and board game should use.
+        Always read from the messages collection, never the conversation cache, since another
+        process may have changed the conversation without this one knowing yet.
+        """
+        last_message = self.db.messages.find_one(
+            {"user_id": user_id, "board_game": board_game},
+            {"seq": 1, "_id": 0},
+            sort=[("seq", DESCENDING)]
+        )
+
+        if last_message is None:
+            return 0
+
+        return last_message["seq"] + 1
+
+    def _find_index(self, index: dict) -> dict | None:
+        """Find an existing index with the same key pattern as the given index definition."""
+        existing_indexes = self.db[index["collection"]].index_information()
+
+        for name, info in existing_indexes.items():
+            if list(info["key"]) == index["keys"]:
+                return {"name": name, **info}
+
+        return None
+
+    def _vector_search_index_exists(self) -> bool:
+        """Check whether the Atlas Vector Search index exists."""
+        collection = self.db[VECTOR_SEARCH_INDEX["collection"]]
+
+        return any(collection.list_search_indexes(VECTOR_SEARCH_INDEX_NAME))
+
+    @_observe_operation
+    def verify_indexes(self) -> list[str]:
+        """
+        Check that every index in MONGODB_INDEXES and the vector search index exist,
+        logging a warning for each one that is missing or defined with different options.
+        Returns the names of the missing indexes.
+        """
+        missing_indexes = []
+
+        for index in MONGODB_INDEXES:
+            existing_index = self._find_index(index)
+
+            if existing_index is None:
+                logger.warning(
+                    "Missing index '%s' on %s, queries on %s will fall back to a collection scan",
+                    index["options"]["name"],
+                    index["collection"],
+                    ", ".join(field for field, _ in index["keys"]),
+                )
+                missing_indexes.append(index["options"]["name"])
+                continue
+
+            for option, value in index["options"].items():
+                if option != "name" and existing_index.get(option) != value:
+                    logger.warning(
+                        "Index '%s' on %s has %s=%s, expected %s",
+                        existing_index["name"], index["collection"], option, existing_index.get(option), value,
+                    )
+
+        try:
+            if not self._vector_search_index_exists():
+                logger.warning(
+                    "Missing vector search index '%s' on %s, similar rulebook page lookups will fail",
+                    VECTOR_SEARCH_INDEX_NAME,
+                    VECTOR_SEARCH_INDEX["collection"],
+                )
+                missing_indexes.append(VECTOR_SEARCH_INDEX_NAME)
+        except OperationFailure as e:
+            logger.warning("Unable to verify vector search index '%s': %s", VECTOR_SEARCH_INDEX_NAME, str(e))
+
+        return missing_indexes
+
+    @_observe_operation
+    def ensure_indexes(self) -> list[str]:
+        """
+        Create any index in MONGODB_INDEXES, and the vector search index, that doesn't already exist.
+        Indexes are matched by key pattern, so indexes created by hand under another name are left alone.
+        Returns the names of the indexes that were created.
+        """
+        created_indexes = []
+
+        for index in MONGODB_INDEXES:
+            if self._find_index(index) is not None:
+                continue
+
+            try:
+                self.db[index["collection"]].create_index(index["keys"], **index["options"])
+                logger.info("Created index '%s' on %s", index["options"]["name"], index["collection"])
+                created_indexes.append(index["options"]["name"])
+            except OperationFailure as e:
+                logger.error(
+                    "Error creating index '%s' on %s: %s", index["options"]["name"], index["collection"], str(e)
+                )
+
+        try:
+            if not self._vector_search_index_exists():
+                self.db[VECTOR_SEARCH_INDEX["collection"]].create_search_index(
+                    SearchIndexModel(
+                        definition=VECTOR_SEARCH_INDEX["definition"],
+                        name=VECTOR_SEARCH_INDEX_NAME,
+                        type=VECTOR_SEARCH_INDEX["type"],
+                    )
+                )
+                logger.info("Created vector search index '%s'", VECTOR_SEARCH_INDEX_NAME)
+                created_indexes.append(VECTOR_SEARCH_INDEX_NAME)
+        except OperationFailure as e:
+            logger.error("Error creating vector search index '%s': %s", VECTOR_SEARCH_INDEX_NAME, str(e))
+
+        return created_indexes
+
+    def _insert_messages(
+        self,
+        user_id: str,
+        board_game: str,
+        messages: list[Message],
+        request_datetime_utc: datetime,
+    ) -> None:
+        """
+        Insert messages at the end of a conversation, retrying with a fresh sequence number
+        if another request appended to it concurrently, and write them through to the cache.
+        """
+        cache_key = (user_id, board_game)
+
+        for attempt in range(1, MAX_MESSAGE_INSERT_ATTEMPTS + 1):
+            next_seq = self._get_next_message_seq(user_id, board_game)
+            try:
+                self.db.messages.insert_many([
+                    {
+                        "user_id": user_id,
+                        "board_game": board_game,
+                        "seq": next_seq + offset,
+                        "role": message["role"],
+                        "content": message["content"],
+                        "created_at": request_datetime_utc,
+                    }
+                    for offset, message in enumerate(messages)
+                ])
+                break
+
+            except DuplicateKeyError:
+                # Another request (possibly in another worker) appended to this conversation
+                # concurrently, so any cached copy of it is stale
+                self._conversation_cache.invalidate(cache_key)
+                if attempt == MAX_MESSAGE_INSERT_ATTEMPTS:
+                    raise
+                logger.warning(
+                    "Message sequence conflict for user %s in '%s', retrying (attempt %d/%d)",
+                    user_id, board_game, attempt, MAX_MESSAGE_INSERT_ATTEMPTS
+                )
+
+        cached_messages = self._conversation_cache.peek(cache_key)
+        if cached_messages is None:
+            return
+
+        # The cached copy is only extended if it ends exactly where the new messages begin,
+        # otherwise another process changed the conversation and the copy is stale
+        cached_next_seq = cached_messages[-1]["seq"] + 1 if cached_messages else 0
+        if cached_next_seq != next_seq:
+            self._conversation_cache.invalidate(cache_key)
+            return
+
+        self._conversation_cache.set(cache_key, cached_messages + [
+            {"seq": next_seq + offset, "role": message["role"], "content": message["content"]}
+            for offset, message in enumerate(messages)
+        ])
+
+    def _increment_token_usage(
+        self,
+        user_id: str,
+        model_token_usages: dict[str, TokenUsage],
+        request_datetime_utc: datetime,
+    ) -> None:
+        """Increment today's token usage for any number of models with a single upsert."""
+        fields_to_increment = {}
+
+        for model_name, model_usage in model_token_usages.items():
+            fields_to_increment[f"usage.{model_name}.input_tokens"] = model_usage["input_tokens"]
+
+            if model_usage.get("output_tokens", 0) > 0:
+                fields_to_increment[f"usage.{model_name}.output_tokens"] = model_usage["output_tokens"]
+
+            if model_usage.get("web_searches", 0) > 0:
+                fields_to_increment[f"usage.{model_name}.web_searches"] = model_usage["web_searches"]
+
+        self.db.token_usage.update_one(
+            {"user_id": user_id, "date": request_datetime_utc.strftime("%Y-%m-%d")},
+            {
+                "$setOnInsert": {
+                    "created_at": request_datetime_utc,
+                },
+                "$inc": fields_to_increment,
+            },
+            upsert=True
+        )
+
+    def _last_active_is_due(self, user_id: str) -> bool:
+        """
+        Whether this process hasn't written the user's last_active in the past
+        LAST_ACTIVE_DEBOUNCE_SECONDS. If it has, the user's document is also known to exist.
+        """
+        return self._last_active_cache.get(user_id) is None
+
+    def _touch_user(self, user_id: str, request_datetime_utc: datetime) -> None:
+        """
+        Update a user's last_active field, creating their document if it doesn't exist.
+        Skipped if last_active was written recently, see _last_active_is_due.
+        """
+        if not self._last_active_is_due(user_id):
+            return
+
+        self.db.user_data.update_one(
+            {"user_id": user_id},
+            {
+                "$setOnInsert": {
+                    "user_id": user_id,
+                    "created_at": request_datetime_utc,
+                },
+                "$set": {
+                    "last_active": request_datetime_utc
+                }
+            },
+            upsert=True
+        )
+        self._last_active_cache.set(user_id, True)
+
+    @_observe_operation
     def append_messages(
         self,
         user_id: str,
@@ -98,80 +476,130 @@ class MongoDBClient:
     ) -> None:
         """
         Append messages to the message history for a given user and board game.
+        Each message is stored as a separate document in the messages collection,
+        numbered by a per-conversation sequence number that matches its index.
 
         If the user does not exist, creates and populates a new document for them.
         If the user exists, updates the last_active field.
         """
-        self._ensure_connection()
         try:
             request_datetime_utc = self._get_current_datetime_utc()
-            self.db.user_data.update_one(
-                {"user_id": user_id},
-                {
-                    "$setOnInsert": {
-                        "user_id": user_id,
-                        "created_at": request_datetime_utc,
-                    },
-                    "$set": {
-                        "last_active": request_datetime_utc
-                    },
-                    "$push": {
-                        f"messages.{board_game}": {
-                            "$each": messages
-                        }
-                    }
-                },
-                upsert=True
-            )
+            self._insert_messages(user_id, board_game, messages, request_datetime_utc)
+            self._touch_user(user_id, request_datetime_utc)
+            self.invalidation_bus.publish(USER_TOPIC, user_id)
 
         except Exception as e:
             logger.error("Error storing messages: %s", str(e))
             raise
 
+    @_observe_operation
+    def record_turn(
+        self,
+        user_id: str,
+        model_token_usages: dict[str, TokenUsage],
+        board_game: str | None = None,
+        messages: list[Message] | None = None,
+    ) -> None:
+        """
+        Record everything a single request changes for a user in as few writes as possible:
+        the new messages (if any), today's token usage for every model used, and last_active.
+
+        Usage for all models is applied in one upsert, rather than one per model, and the
+        user document is only written once.
+        """
+        try:
+            request_datetime_utc = self._get_current_datetime_utc()
+
+            if messages:
+                self._insert_messages(user_id, board_game, messages, request_datetime_utc)
+
+            self._increment_token_usage(user_id, model_token_usages, request_datetime_utc)
+            self._touch_user(user_id, request_datetime_utc)
+            self.invalidation_bus.publish(USER_TOPIC, user_id)
+
+        except Exception as e:
+            logger.error("Error recording turn for user '%s': %s", user_id, str(e))
+            raise
+
+    @_observe_operation
     def get_message_history(
             self,
             user_id: str,
-            board_game: str
-    ) -> list[Message]:
-        """Get message history for a given user and board game."""
-        self._ensure_connection()
+            board_game: str,
+            limit: int | None = None,
+            before: int | None = None,
+            since: int | None = None,
+    ) -> list[StoredMessage]:
+        """
+        Get message history for a given user and board game, ordered oldest first.
+
+        Only messages with index >= since and index < before are returned when these are given.
+        If limit is given, only the most recent limit messages matching these bounds are returned,
+        so older messages can be loaded lazily by passing the smallest index seen so far as before.
+
+        Conversations are cached per process for CONVERSATION_CACHE_TTL_SECONDS. Any request for a
+        conversation that isn't cached reads and caches the whole of it with one indexed query, so the
+        requests that follow, e.g. the recent turns read for each question or the next page of history,
+        are served from memory.
+        """
         try:
-            result = self.db.user_data.find_one(
-                {"user_id": user_id},
-                {f"messages.{board_game}": 1, "_id": 0}
-            )
+            cache_key = (user_id, board_game)
+            messages = self._conversation_cache.get(cache_key)
 
-            if result is None:
-                return []
+            if messages is None:
+                messages = list(self.db.messages.find(
+                    {"user_id": user_id, "board_game": board_game},
+                    {"seq": 1, "role": 1, "content": 1, "_id": 0}
+                ).sort("seq", ASCENDING))
+                self._conversation_cache.set(cache_key, messages)
 
-            return result.get("messages", {}).get(board_game, [])
+            return _slice_message_history(messages, limit, before, since)
 
         except Exception as e:
             logger.error("Error retrieving message history: %s", str(e))
             raise
 
+    def get_recent_messages(
+            self,
+            user_id: str,
+            board_game: str,
+            n: int,
+    ) -> list[StoredMessage]:
+        """
+        Get the last n messages for a given user and board game, ordered oldest first.
+        Served from the conversation cache, which this fills if the conversation isn't cached yet.
+        """
+        return self.get_message_history(user_id, board_game, limit=n)
+
+    @_observe_operation
     def clear_message_history(
             self,
             user_id: str,
             board_game: str
     ) -> None:
         """Clear the message history for a given user and board game."""
-        self._ensure_connection()
         try:
-            result = self.db.user_data.update_one(
-                {"user_id": user_id},
-                {
-                    "$set": {
-                        f"messages.{board_game}": [],
-                        "last_active": self._get_current_datetime_utc()
+            if self._last_active_is_due(user_id):
+                result = self.db.user_data.update_one(
+                    {"user_id": user_id},
+                    {
+                        "$set": {
+                            "last_active": self._get_current_datetime_utc()
+                        }
                     }
-                }
-            )
-            self._raise_on_no_user_id_match(result)
+                )
+                self._raise_on_no_user_id_match(result)
+                self._last_active_cache.set(user_id, True)
+
+            self.db.messages.delete_many({"user_id": user_id, "board_game": board_game})
+            self._conversation_cache.invalidate((user_id, board_game))
+            self.invalidation_bus.publish(USER_TOPIC, user_id)
+
         except Exception as e:
             logger.error("Error clearing message history: %s", str(e))
             raise
 
+    @_observe_operation
     def delete_messages_from_index(
             self,
             user_id: str,
@@ -182,35 +610,141 @@ class MongoDBClient:
         Delete all messages with index greater than or equal to the specified index (0-based)
         for a given user and board game.
         """
-        self._ensure_connection()
         try:
-            result = self.db.user_data.update_one(
-                {"user_id": user_id},
-                {
-                    "$push": {
-                        f"messages.{board_game}": {
-                            "$each": [],
-                            "$slice": index
-                        },
-                    },
-                    "$set": {
-                        "last_active": self._get_current_datetime_utc()
+            if self._last_active_is_due(user_id):
+                result = self.db.user_data.update_one(
+                    {"user_id": user_id},
+                    {
+                        "$set": {
+                            "last_active": self._get_current_datetime_utc()
+                        }
                     }
-                }
-            )
-            self._raise_on_no_user_id_match(result)
+                )
+                self._raise_on_no_user_id_match(result)
+                self._last_active_cache.set(user_id, True)
+
+            self.db.messages.delete_many({
+                "user_id": user_id,
+                "board_game": board_game,
+                "seq": {"$gte": index}
+            })
+            self._conversation_cache.invalidate((user_id, board_game))
+            self.invalidation_bus.publish(USER_TOPIC, user_id)
 
         except Exception as e:
             logger.error("Error deleting messages: %s", str(e))
             raise
 
+    def _matches_stored_messages(self, user_id: str, board_game: str, messages: list[Message]) -> bool:
+        """
+        Whether every message stored for a conversation at an embedded message's index is that
+        embedded message, i.e. the messages collection holds none or part of the embedded history.
+        """
+        stored_messages = self.db.messages.find(
+            {"user_id": user_id, "board_game": board_game, "seq": {"$lt": len(messages)}},
+            {"seq": 1, "role": 1, "content": 1, "_id": 0}
+        )
+
+        return all(
+            stored_message["role"] == messages[stored_message["seq"]]["role"]
+            and stored_message["content"] == messages[stored_message["seq"]]["content"]
+            for stored_message in stored_messages
+        )
+
+    @_observe_operation
+    def migrate_embedded_messages(self) -> int:
+        """
+        Move message histories embedded in user_data documents (messages.<board_game> arrays)
+        into the messages collection, then remove the embedded arrays.
+
+        Safe to re-run: messages are upserted by (user_id, board_game, seq), so a migration
+        interrupted part-way through can be resumed without creating duplicates.
+        A conversation that already has other messages in the messages collection, e.g. because
+        the app served it before the migration ran, is left embedded and logged rather than merged,
+        so neither copy is lost.
+        Returns the number of conversations migrated.
+        """
+        try:
+            self.ensure_indexes()
+
+            migrated_conversations = 0
+            migration_datetime_utc = self._get_current_datetime_utc()
+            user_documents = self.db.user_data.find(
+                {"messages": {"$exists": True}},
+                {"user_id": 1, "messages": 1}
+            )
+
+            for user_document in user_documents:
+                user_id = user_document["user_id"]
+                unmigrated_board_games = []
+
+                for board_game, messages in user_document["messages"].items():
+                    if not self._matches_stored_messages(user_id, board_game, messages):
+                        logger.error(
+                            "Not migrating message history for user %s in '%s': the messages collection "
+                            "already has a different conversation, the embedded copy has been kept",
+                            user_id, board_game
+                        )
+                        unmigrated_board_games.append(board_game)
+                        continue
+
+                    if messages:
+                        self.db.messages.bulk_write([
+                            UpdateOne(
+                                {"user_id": user_id, "board_game": board_game, "seq": seq},
+                                {
+                                    "$setOnInsert": {
+                                        "role": message["role"],
+                                        "content": message["content"],
+                                        "created_at": migration_datetime_utc,
+                                    }
+                                },
+                                upsert=True
+                            )
+                            for seq, message in enumerate(messages)
+                        ])
+
+                        # A request may have appended to the conversation since it was checked
+                        if not self._matches_stored_messages(user_id, board_game, messages):
+                            logger.error(
+                                "Message history for user %s in '%s' changed while it was being migrated, "
+                                "the embedded copy has been kept",
+                                user_id, board_game
+                            )
+                            unmigrated_board_games.append(board_game)
+                            continue
+
+                    migrated_conversations += 1
+
+                if unmigrated_board_games:
+                    migrated_fields = {
+                        f"messages.{board_game}": ""
+                        for board_game in user_document["messages"]
+                        if board_game not in unmigrated_board_games
+                    }
+                    if migrated_fields:
+                        self.db.user_data.update_one({"_id": user_document["_id"]}, {"$unset": migrated_fields})
+                    continue
+
+                self.db.user_data.update_one(
+                    {"_id": user_document["_id"]},
+                    {"$unset": {"messages": ""}}
+                )
+                logger.info("Migrated message history for user %s", user_id)
+
+            return migrated_conversations
+
+        except Exception as e:
+            logger.error("Error migrating embedded messages: %s", str(e))
+            raise
+
+    @_observe_operation
     def store_rulebook_pages(self, pages: list[RulebookPage]
     ) -> None:
         """
         Store rulebook pages for a given board game and rulebook.
         Each page is stored as a separate document in the rulebook_pages collection.
         """
-        self._ensure_connection()
         try:
             self.db.rulebook_pages.insert_many(pages)
 
@@ -218,13 +752,13 @@ class MongoDBClient:
             logger.error("Error storing rulebook pages: %s", str(e))
             raise
 
+    @_observe_operation
     def delete_rulebook_pages(
         self,
         board_game: str,
         rulebook: str
     ) -> None:
         """Delete all pages for a given board game and rulebook."""
-        self._ensure_connection()
         try:
             result = self.db.rulebook_pages.delete_many({
                 "board_game": board_game,
@@ -237,6 +771,7 @@ class MongoDBClient:
                         rulebook, board_game, str(e))
             raise
 
+    @_observe_operation
     def get_rulebook_pages(
         self,
         board_game: str,
@@ -245,7 +780,6 @@ class MongoDBClient:
         """
         Get all pages for a given board game and rulebook.
         """
-        self._ensure_connection()
         try:
             results = self.db.rulebook_pages.find(
                 {"board_game": board_game, "rulebook_name": rulebook},
@@ -258,6 +792,7 @@ class MongoDBClient:
             logger.error("Error retrieving rulebook pages for '%s': %s", board_game, str(e))
             raise
 
+    @_observe_operation
     def get_similar_rulebook_pages(
         self,
         board_game: str,
@@ -267,12 +802,11 @@ class MongoDBClient:
         """
         Find rulebook pages for a given board game with similar embeddings to the query embedding.
         """
-        self._ensure_connection()
         try:
             results = self.db.rulebook_pages.aggregate([
                 {
                     "$vectorSearch": {
-                        "index": "embedding_index",
+                        "index": VECTOR_SEARCH_INDEX_NAME,
                         "path": "embedding",
                         "filter": {
                             "board_game": {
@@ -298,6 +832,7 @@ class MongoDBClient:
             logger.error("Error performing vector search: %s", str(e))
             raise
 
+    @_observe_operation
     def increment_todays_token_usage(
         self,
         user_id: str,
@@ -308,108 +843,255 @@ class MongoDBClient:
     ) -> None:
         """
         Increment today's token usage for a given user.
+        Usage is stored as one small document per user per day in the token_usage collection,
+        which expires TOKEN_USAGE_RETENTION_DAYS after it was created.
 
         If the user does not exist, creates and populates a new document for them.
-        If the user exists, updates the last_active field and increments the token usage for today.
+        If the user exists, updates the last_active field.
         """
-        self._ensure_connection()
         try:
             request_datetime_utc = self._get_current_datetime_utc()
-            todays_date = request_datetime_utc.strftime("%Y-%m-%d")
-
-            fields_to_increment = {
-                f"token_usage.{todays_date}.{model_name}.input_tokens": input_tokens,
+            model_token_usages = {
+                model_name: {
+                    "input_tokens": input_tokens,
+                    "output_tokens": output_tokens,
+                    "web_searches": web_searches,
+                }
             }
 
-            if output_tokens > 0:
-                fields_to_increment[f"token_usage.{todays_date}.{model_name}.output_tokens"] = output_tokens
+            self._increment_token_usage(user_id, model_token_usages, request_datetime_utc)
+            self._touch_user(user_id, request_datetime_utc)
+            self.invalidation_bus.publish(USER_TOPIC, user_id)
 
-            if web_searches > 0:
-                fields_to_increment[f"token_usage.{todays_date}.{model_name}.web_searches"] = web_searches
+        except Exception as e:
+            logger.error("Error incrementing token usage: %s", str(e))
+            raise
 
-            self.db.user_data.update_one(
-                {"user_id": user_id},
+    @_observe_operation
+    def get_todays_token_usage(self, user_id: str) -> dict[str, TokenUsage]:
+        """
+        Get today's token usage broken down by model for a given user.
+
+        Returns a dictionary of model names to token usage.
+        Returns an empty dictionary if the user doesn't have an entry in the database for today.
+        """
+        try:
+            todays_date = self._get_current_datetime_utc().strftime("%Y-%m-%d")
+            result = self.db.token_usage.find_one(
+                {"user_id": user_id, "date": todays_date},
+                {"usage": 1, "_id": 0}
+            )
+
+            if result is None:
+                return {}
+
+            return result.get("usage", {})
+        except Exception as e:
+            logger.error("Error retrieving token usage for user '%s': %s", user_id, str(e))
+            raise
+
+    @_observe_operation
+    def migrate_embedded_token_usage(self) -> int:
+        """
+        Move daily token usage embedded in user_data documents (token_usage.<date> fields)
+        into the token_usage collection, then remove the embedded fields.
+
+        Embedded usage is added to any usage already recorded in the collection for the same day,
+        e.g. by requests served before the migration ran, rather than replacing or being replaced by it.
+        Migrated documents are timestamped with their usage date, so any older than
+        TOKEN_USAGE_RETENTION_DAYS are removed by the TTL index shortly afterwards.
+        Safe to re-run: each day's document is marked once its embedded usage has been added,
+        and never added to again.
+        Returns the number of daily usage documents migrated.
+        """
+        try:
+            self.ensure_indexes()
+
+            migrated_days = 0
+            user_documents = self.db.user_data.find(
+                {"token_usage": {"$exists": True}},
+                {"user_id": 1, "token_usage": 1}
+            )
+
+            for user_document in user_documents:
+                user_id = user_document["user_id"]
+
+                for date, model_token_usages in user_document["token_usage"].items():
+                    fields_to_increment = {
+                        f"usage.{model_name}.{field}": count
+                        for model_name, model_usage in model_token_usages.items()
+                        for field, count in model_usage.items()
+                    }
+
+                    update = {
+                        "$setOnInsert": {
+                            "created_at": datetime.strptime(date, "%Y-%m-%d").replace(tzinfo=timezone.utc),
+                        },
+                        "$set": {"migrated_embedded_usage": True},
+                    }
+                    if fields_to_increment:
+                        update["$inc"] = fields_to_increment
+
+                    try:
+                        self.db.token_usage.update_one(
+                            {"user_id": user_id, "date": date, "migrated_embedded_usage": {"$ne": True}},
+                            update,
+                            upsert=True
+                        )
+                    except DuplicateKeyError:
+                        # The day's document is already marked, so this day was migrated by an earlier run
+                        continue
+
+                    migrated_days += 1
+
+                self.db.user_data.update_one(
+                    {"_id": user_document["_id"]},
+                    {"$unset": {"token_usage": ""}}
+                )
+                logger.info("Migrated token usage for user %s", user_id)
+
+            return migrated_days
+
+        except Exception as e:
+            logger.error("Error migrating embedded token usage: %s", str(e))
+            raise
+
+    @_observe_operation
+    def upsert_board_game(self, name: str, rulebooks: list[CatalogRulebook]) -> None:
+        """
+        Add or update a board game in the board_games catalog, incrementing its version.
+        Called by ingestion once the board game's rulebook pages have been stored.
+        """
+        try:
+            request_datetime_utc = self._get_current_datetime_utc()
+
+            self.db.board_games.update_one(
+                {"name": name},
                 {
                     "$setOnInsert": {
-                        "user_id": user_id,
+                        "name": name,
                         "created_at": request_datetime_utc,
                     },
                     "$set": {
-                        "last_active": request_datetime_utc,
+                        "rulebooks": rulebooks,
+                        "page_count": sum(rulebook["page_count"] for rulebook in rulebooks),
+                        "updated_at": request_datetime_utc,
                     },
-                    "$inc": fields_to_increment,
+                    "$inc": {"version": 1},
                 },
                 upsert=True
             )
+            self.invalidation_bus.publish(CATALOG_TOPIC)
+            logger.info("Updated board game catalog entry for '%s'", name)
 
         except Exception as e:
-            logger.error("Error incrementing token usage: %s", str(e))
+            logger.error("Error updating board game catalog entry for '%s': %s", name, str(e))
             raise
 
-    def get_todays_token_usage(self, user_id: str) -> dict[str, TokenUsage]:
+    @_observe_operation
+    def get_board_game_catalog(self) -> list[BoardGame]:
         """
-        Get today's token usage broken down by model for a given user.
+        Get every board game in the board_games catalog, sorted by name.
 
-        Returns a dictionary of model names to token usage.
-        Returns None if the user doesn't have an entry in the database for today.
+        Falls back to the distinct board games in rulebook_pages if the catalog is empty,
+        i.e. for databases ingested before the catalog existed.
         """
-        self._ensure_connection()
         try:
-            todays_date = self._get_current_datetime_utc().strftime("%Y-%m-%d")
-            result = self.db.user_data.find_one(
-                {"user_id": user_id},
-                {f"token_usage.{todays_date}": 1, "_id": 0}
+            board_games = list(
+                self.db.board_games.find(
+                    {},
+                    {"name": 1, "rulebooks": 1, "page_count": 1, "version": 1, "_id": 0}
+                ).sort("name", ASCENDING)
             )
 
-            if result is None:
-                return {}
+            if not board_games:
+                logger.warning(
+                    "Board game catalog is empty, falling back to rulebook pages. "
+                    "Run 'python manage.py rebuild-catalog' to populate it"
+                )
+                board_games = [
+                    {"name": name, "rulebooks": [], "page_count": 0, "version": 0}
+                    for name in sorted(self.db.rulebook_pages.distinct("board_game"))
+                ]
+
+            return board_games
 
-            return result.get("token_usage", {}).get(todays_date, {})
         except Exception as e:
-            logger.error("Error retrieving token usage for user '%s': %s", user_id, str(e))
+            logger.error("Error retrieving board game catalog: %s", str(e))
             raise
 
-    def get_all_board_games(self) -> list[str]:
+    @_observe_operation
+    def rebuild_board_game_catalog(self) -> int:
         """
-        Get a list of all unique board games that have rulebook pages stored in the database.
-        Returns an empty list if no board games are found.
+        Rebuild the board_games catalog from the rulebook pages currently stored,
+        removing entries for board games that no longer have any pages.
+        Returns the number of board games in the catalog.
         """
-        self._ensure_connection()
         try:
-            board_games = self.db.rulebook_pages.distinct("board_game")
-            return sorted(board_games)
+            rulebooks_by_board_game = {}
+            results = self.db.rulebook_pages.aggregate([
+                {
+                    "$group": {
+                        "_id": {"board_game": "$board_game", "rulebook_name": "$rulebook_name"},
+                        "page_count": {"$sum": 1},
+                    }
+                },
+                {"$sort": {"_id.board_game": 1, "_id.rulebook_name": 1}},
+            ])
+
+            for result in results:
+                rulebooks_by_board_game.setdefault(result["_id"]["board_game"], []).append({
+                    "name": result["_id"]["rulebook_name"],
+                    "page_count": result["page_count"],
+                })
+
+            for name, rulebooks in rulebooks_by_board_game.items():
+                self.upsert_board_game(name, rulebooks)
+
+            self.db.board_games.delete_many({"name": {"$nin": list(rulebooks_by_board_game)}})
+            self.invalidation_bus.publish(CATALOG_TOPIC)
+
+            return len(rulebooks_by_board_game)
+
         except Exception as e:
-            logger.error("Error retrieving board games list: %s", str(e))
+            logger.error("Error rebuilding board game catalog: %s", str(e))
             raise
 
+    def get_all_board_games(self) -> list[str]:
+        """
+        Get the names of all board games in the catalog, sorted alphabetically.
+        Returns an empty list if no board games are found.
+        """
+        return [board_game["name"] for board_game in self.get_board_game_catalog()]
+
+    @_observe_operation
     def get_user_theme(self, user_id: str) -> int | None:
         """
         Get the user's saved theme preference.
         Returns None if no theme is saved.
         """
-        self._ensure_connection()
         try:
             result = self.db.user_data.find_one(
                 {"user_id": user_id},
                 {"theme": 1, "_id": 0}
             )
-            
+
             if result is None:
                 return None
-            
+
             return result.get("theme")
         except Exception as e:
             logger.error("Error retrieving theme for user '%s': %s", user_id, str(e))
             raise
 
+    @_observe_operation
     def set_user_theme(self, user_id: str, theme: int) -> None:
         """
         Save the user's selected theme.
         """
-        self._ensure_connection()
         try:
             request_datetime_utc = self._get_current_datetime_utc()
-            
+
             self.db.user_data.update_one(
                 {"user_id": user_id},
                 {
@@ -424,11 +1106,14 @@ class MongoDBClient:
                 },
                 upsert=True
             )
+            # The user document was written anyway, so last_active came for free
+            self._last_active_cache.set(user_id, True)
             logger.info("Theme '%s' saved for user %s", theme, user_id)
         except Exception as e:
             logger.error("Error saving theme for user '%s': %s", user_id, str(e))
             raise
 
+    @_observe_operation
     def store_feedback(
         self,
         user_id: str,
@@ -441,11 +1126,10 @@ class MongoDBClient:
         If the user does not exist, creates and populates a new document for them.
         If the user already exists, updates their email (if provided) and appends their feedback.
         """
-        self._ensure_connection()
         try:
             request_datetime_utc = self._get_current_datetime_utc()
             request_date = request_datetime_utc.strftime("%Y-%m-%d")
-            
+
             update_query = {
                 "$setOnInsert": {
                     "user_id": user_id,
@@ -456,26 +1140,42 @@ class MongoDBClient:
                     }
                 }
             }
-            
+
             if email is not None:
                 update_query["$set"] = {"email": email}
-            
+
             self.db.feedback.update_one(
                 {"user_id": user_id},
                 update_query,
                 upsert=True
             )
             logger.info("Feedback submitted successfully for user %s", user_id)
-            
+
         except Exception as e:
             logger.error("Error submitting feedback for user '%s': %s", user_id, str(e))
             raise
 
+    def get_cache_stats(self) -> dict[str, dict[str, float]]:
+        """Get hit rate statistics for this process's caches."""
+        return {
+            "conversations": self._conversation_cache.stats(),
+            "last_active": self._last_active_cache.stats(),
+        }
+
+    def close(self) -> None:
+        """
+        Publish any queued cache invalidations, then stop the background threads and close the connection.
+        Called by command line entry points before they exit, since daemon threads die with the process.
+        """
+        self._health_probe_stop.set()
+        self.invalidation_bus.stop()
+        if self._client and self._pid == os.getpid():
+            self._client.close()
+
     def __del__(self):
         """Cleanup MongoDB connection on object deletion."""
         try:
-            if self.client:
-                self.client.close()
+            self.close()
         except ImportError:
             # Python is shutting down, ignore the error
             pass
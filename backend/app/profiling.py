@@ -0,0 +1,186 @@
+"""
+Opt-in CPU profiling of individual requests.
+
+With PROFILING_OUTPUT_DIR set, a request is profiled if it sends PROFILING_TOKEN in the
+X-Profile-Token header, or if it is picked at PROFILING_SAMPLE_RATE. A profiled request's
+thread is sampled from a background thread for the whole life of the request, including
+a streamed answer, and every sample is weighted by the CPU time the request thread used since the
+previous one. Time spent waiting on MongoDB or OpenAI therefore barely registers, and the profile
+shows where the request burned CPU: tokenizing, serializing pages, sanitizing input, parsing
+citations.
+
+Profiles are written as collapsed stacks, one "frame;frame;frame microseconds" line per stack,
+which flamegraph.pl, speedscope and inferno read directly. Sampling only the request's own thread
+keeps profiles of concurrent requests in a gthread worker apart.
+"""
+import hmac
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+from flask import Response, g, request
+
+from app.config.constants import PROFILING_MAX_CONCURRENT_REQUESTS, PROFILING_SAMPLE_INTERVAL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+PROFILE_TOKEN_HEADER = "X-Profile-Token"
+PROFILE_FILE_HEADER = "X-Profile-File"
+
+_ROUTE_SLUG_PATTERN = re.compile(r"[^A-Za-z0-9]+")
+
+
+class _ProfilingSettings:
+    def __init__(self, output_dir: str, sample_rate: float, token: str | None):
+        self.output_dir = output_dir
+        self.sample_rate = sample_rate
+        self.token = token
+
+
+_settings: _ProfilingSettings | None = None
+# Each profiled request has a sampler thread, so only a few are profiled at once
+_profiling_slots = threading.BoundedSemaphore(PROFILING_MAX_CONCURRENT_REQUESTS)
+
+
+def _short_filename(filename: str) -> str:
+    _, site_packages, package_path = filename.rpartition("site-packages" + os.sep)
+    if site_packages:
+        return package_path
+
+    return os.path.relpath(filename) if filename.startswith(os.getcwd()) else filename
+
+
+def _collapse_stack(frame) -> str:
+    """Format a frame and its callers as a collapsed stack, outermost frame first."""
+    frames = []
+    while frame is not None:
+        code = frame.f_code
+        frames.append(f"{code.co_qualname} ({_short_filename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+
+    return ";".join(reversed(frames))
+
+
+class RequestSampler:
+    """Samples one thread's stack, weighting each stack by the CPU time the thread used in between."""
+
+    def __init__(self, thread_id: int, interval_seconds: float = PROFILING_SAMPLE_INTERVAL_SECONDS):
+        self._thread_id = thread_id
+        self._cpu_clock_id = time.pthread_getcpuclockid(thread_id)
+        self._interval_seconds = interval_seconds
+        self._cpu_microseconds_by_stack: Counter[str] = Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def _run(self) -> None:
+        previous_cpu_time = time.clock_gettime(self._cpu_clock_id)
+
+        while not self._stopped.wait(self._interval_seconds):
+            frame = sys._current_frames().get(self._thread_id)
+            cpu_time = time.clock_gettime(self._cpu_clock_id)
+            cpu_microseconds = round((cpu_time - previous_cpu_time) * 1_000_000)
+            previous_cpu_time = cpu_time
+
+            if frame is not None and cpu_microseconds > 0:
+                self._cpu_microseconds_by_stack[_collapse_stack(frame)] += cpu_microseconds
+
+    def stop(self) -> Counter[str]:
+        """Stop sampling and get the CPU microseconds spent in each stack."""
+        self._stopped.set()
+        self._thread.join()
+        return self._cpu_microseconds_by_stack
+
+
+def configure_profiling(output_dir: str | None, sample_rate: float, token: str | None) -> None:
+    """Allow requests to be profiled into output_dir, or turn profiling off if output_dir is None."""
+    global _settings
+
+    if output_dir is None:
+        _settings = None
+        return
+
+    os.makedirs(output_dir, exist_ok=True)
+    _settings = _ProfilingSettings(output_dir, sample_rate, token)
+
+
+def _is_requested(settings: _ProfilingSettings) -> bool:
+    token = request.headers.get(PROFILE_TOKEN_HEADER)
+    return bool(token and settings.token and hmac.compare_digest(token.encode(), settings.token.encode()))
+
+
+def start_request_profile() -> None:
+    """Start profiling the request if it asked to be or was sampled. Registered as a before_request hook."""
+    settings = _settings
+    if settings is None:
+        return
+
+    requested = _is_requested(settings)
+    if not (requested or random.random() < settings.sample_rate):
+        return
+
+    if not _profiling_slots.acquire(blocking=False):
+        logger.warning("Not profiling %s %s, %d requests are already being profiled",
+                       request.method, request.path, PROFILING_MAX_CONCURRENT_REQUESTS)
+        return
+
+    route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    filename = "{}-{}-{}-{}.collapsed".format(
+        datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S"),
+        os.getpid(),
+        request.method.lower() + _ROUTE_SLUG_PATTERN.sub("-", route).rstrip("-"),
+        os.urandom(4).hex(),
+    )
+
+    sampler = RequestSampler(threading.get_ident())
+    sampler.start()
+    g.profile = (sampler, os.path.join(settings.output_dir, filename), requested)
+
+
+def end_request_profile(response: Response) -> Response:
+    """
+    Stop profiling the request and write out its profile. Registered as an after_request hook;
+    streamed responses are profiled until their stream closes.
+    """
+    profile = g.pop("profile", None)
+    if profile is None:
+        return response
+
+    sampler, path, requested = profile
+    if requested:
+        # Let whoever asked for the profile find it
+        response.headers[PROFILE_FILE_HEADER] = os.path.basename(path)
+
+    def end():
+        try:
+            _write_profile(sampler.stop(), path)
+        finally:
+            _profiling_slots.release()
+
+    if response.is_streamed:
+        response.call_on_close(end)
+    else:
+        end()
+
+    return response
+
+
+def _write_profile(cpu_microseconds_by_stack: Counter[str], path: str) -> None:
+    try:
+        with open(path, "w") as profile_file:
+            for stack, cpu_microseconds in cpu_microseconds_by_stack.most_common():
+                profile_file.write(f"{stack} {cpu_microseconds}\n")
+
+    except OSError as e:
+        logger.error("Error writing request profile %s: %s", path, str(e))
+        return
+
+    logger.info("Wrote request profile %s (%d us of CPU)", path, sum(cpu_microseconds_by_stack.values()))
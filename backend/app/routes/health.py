@@ -0,0 +1,25 @@
+"""
+API routes for load balancer health checks.
+"""
+from flask import Blueprint, current_app
+
+from app.config.constants import ERROR_NOT_READY
+from app.utils.responses import success_response, service_unavailable_error
+
+health_bp = Blueprint("health", __name__)
+
+
+@health_bp.route("/ready", methods=["GET"])
+def ready():
+    """
+    Report whether this worker has finished warming up, retrying any warmup steps that failed.
+    Returns 503 until it has, so the load balancer doesn't send user traffic to a cold worker.
+    """
+    warmup = current_app.warmup
+    is_ready = warmup.retry_if_due()
+    checks = warmup.status()
+
+    if not is_ready:
+        return service_unavailable_error(ERROR_NOT_READY, details={"ready": False, "checks": checks})
+
+    return success_response(data={"ready": True, "checks": checks})
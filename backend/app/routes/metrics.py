@@ -0,0 +1,30 @@
+"""
+API route for Prometheus to scrape metrics from.
+"""
+import hmac
+
+from flask import Blueprint, Response, current_app, request
+
+from app.config.constants import ERROR_INVALID_TOKEN
+from app.metrics import render_metrics
+from app.utils.responses import authentication_error, not_found_error
+
+metrics_bp = Blueprint("metrics", __name__)
+
+
+@metrics_bp.route("/metrics", methods=["GET"])
+def metrics():
+    """
+    Serve every worker's metrics in the Prometheus text format.
+    Only available when METRICS_TOKEN is set, and only to scrapers sending it as a bearer token.
+    """
+    metrics_token = current_app.config.get("METRICS_TOKEN")
+    if not metrics_token:
+        return not_found_error()
+
+    auth_header = request.headers.get("Authorization", "")
+    if not hmac.compare_digest(auth_header.encode(), f"Bearer {metrics_token}".encode()):
+        return authentication_error(ERROR_INVALID_TOKEN)
+
+    body, content_type = render_metrics()
+    return Response(body, content_type=content_type)
@@ -7,6 +7,7 @@ import json
 
 from flask import (
     Blueprint,
+    g,
     request,
     current_app,
     Response,
@@ -14,16 +15,50 @@ from flask import (
     send_from_directory,
 )
 
+from app.config.constants import MAX_MESSAGE_HISTORY_PAGE_SIZE
 from app.config.paths import RULEBOOKS_PATH
-from app.utils.decorators import check_daily_token_limit, validate_auth_token, validate_json_body
+from app.utils.decorators import (
+    check_daily_token_limit,
+    check_user_admission,
+    validate_auth_token,
+    validate_json_body,
+)
 from app.utils.responses import success_response, validation_error, not_found_error, internal_error
 
-logging.basicConfig(level=logging.INFO)
+# trace_context is added to every record by app.tracing, which the decorators import
+logging.basicConfig(level=logging.INFO, format="%(levelname)s:%(name)s:%(message)s%(trace_context)s")
 logger = logging.getLogger(__name__)
 
 orchestrator_bp = Blueprint("orchestrator", __name__)
 
 
+def _get_optional_int_field(
+    data: dict,
+    field: str,
+    minimum: int,
+    maximum: int | None = None,
+) -> int | None:
+    """
+    Get an optional integer field from a request body.
+    Raises ValueError if the field is present but isn't an integer within the given bounds.
+    """
+    value = data.get(field)
+
+    if value is None:
+        return None
+
+    if not isinstance(value, int) or isinstance(value, bool):
+        raise ValueError(f"{field} must be an integer")
+
+    if value < minimum:
+        raise ValueError(f"{field} must be at least {minimum}")
+
+    if maximum is not None and value > maximum:
+        raise ValueError(f"{field} must be at most {maximum}")
+
+    return value
+
+
 @orchestrator_bp.route("/known-board-games", methods=["GET"])
 @validate_auth_token
 def get_known_board_games():
@@ -43,10 +78,23 @@ def get_message_history():
         data = request.get_json()
         board_game = data["board_game"]
 
-        if board_game not in current_app.orchestrator.get_known_board_games():
+        if not current_app.orchestrator.is_known_board_game(board_game):
             return validation_error("Unrecognised board game")
 
-        message_history = current_app.orchestrator.get_message_history(request.user_id, board_game)
+        try:
+            limit = _get_optional_int_field(data, "limit", minimum=1, maximum=MAX_MESSAGE_HISTORY_PAGE_SIZE)
+            before = _get_optional_int_field(data, "before", minimum=0)
+            since = _get_optional_int_field(data, "since", minimum=0)
+        except ValueError as e:
+            return validation_error(str(e))
+
+        message_history = current_app.orchestrator.get_message_history(
+            g.user_id,
+            board_game,
+            limit=limit,
+            before=before,
+            since=since,
+        )
 
         return success_response(data=message_history)
     except Exception as e:
@@ -102,12 +150,13 @@ def serve_pdf(filepath: str):
 @orchestrator_bp.route("/determine-board-game", methods=["POST"])
 @validate_json_body(question=str)
 @check_daily_token_limit
+@check_user_admission("determine_board_game")
 @validate_auth_token
 def determine_board_game():
     try:
         data = request.get_json()
         question = data["question"]
-        board_game = current_app.orchestrator.determine_board_game(request.user_id, question)
+        board_game = current_app.orchestrator.determine_board_game(g.user_id, question)
 
         return success_response(data=board_game)
     except Exception as e:
@@ -118,6 +167,7 @@ def determine_board_game():
 @orchestrator_bp.route("/ask-question", methods=["POST"])
 @validate_json_body(question=str, board_game=str)
 @check_daily_token_limit
+@check_user_admission("ask_question")
 @validate_auth_token
 def ask_question():
     try:
@@ -125,12 +175,12 @@ def ask_question():
         question = data["question"]
         board_game = data["board_game"]
 
-        if board_game not in current_app.orchestrator.get_known_board_games():
+        if not current_app.orchestrator.is_known_board_game(board_game):
             return validation_error("Unrecognised board game")
 
-        logger.info("Received question from user %s for %s", request.user_id, board_game)
+        logger.info("Received question from user %s for %s", g.user_id, board_game)
 
-        iterator = current_app.orchestrator.ask_question(request.user_id, board_game, question)
+        iterator = current_app.orchestrator.ask_question(g.user_id, board_game, question)
 
         def generate():
             for chunk in iterator:
@@ -161,13 +211,13 @@ def delete_messages_from_index():
         board_game = data["board_game"]
         index = data["index"]
 
-        if board_game not in current_app.orchestrator.get_known_board_games():
+        if not current_app.orchestrator.is_known_board_game(board_game):
             return validation_error("Unrecognised board game")
 
         if index < 0:
             return validation_error("Index must be non-negative")
 
-        current_app.orchestrator.delete_messages_from_index(request.user_id, board_game, index)
+        current_app.orchestrator.delete_messages_from_index(g.user_id, board_game, index)
 
         return success_response()
     except Exception as e:
@@ -183,10 +233,10 @@ def clear_message_history():
         data = request.get_json()
         board_game = data["board_game"]
 
-        if board_game not in current_app.orchestrator.get_known_board_games():
+        if not current_app.orchestrator.is_known_board_game(board_game):
             return validation_error("Unrecognised board game")
 
-        current_app.orchestrator.clear_message_history(request.user_id, board_game)
+        current_app.orchestrator.clear_message_history(g.user_id, board_game)
 
         return success_response()
     except Exception as e:
@@ -204,7 +254,7 @@ def submit_feedback():
         email = data.get("email")
 
         current_app.orchestrator.submit_feedback(
-            request.user_id,
+            g.user_id,
             content,
             email,
         )
@@ -219,7 +269,7 @@ def submit_feedback():
 @validate_auth_token
 def get_user_theme():
     try:
-        theme = current_app.orchestrator.get_user_theme(request.user_id)
+        theme = current_app.orchestrator.get_user_theme(g.user_id)
         return success_response(data=theme)
     except Exception as e:
         logger.error("Error getting user theme: %s", str(e))
@@ -234,7 +284,7 @@ def set_user_theme():
         data = request.get_json()
         theme = data["theme"]
 
-        current_app.orchestrator.set_user_theme(request.user_id, theme)
+        current_app.orchestrator.set_user_theme(g.user_id, theme)
 
         return success_response()
     except Exception as e:
@@ -0,0 +1,334 @@
+"""
+Lightweight request tracing.
+
+Every request gets a trace, with a root span for the request and child spans for the steps it goes
+through: auth and admission decorators, orchestrator steps, MongoDB operations and OpenAI calls.
+Spans are kept in memory until the request finishes, including the whole of a streamed answer.
+A trace is then written out if it was sampled, if the request was slow, or if it failed, so
+tail-latency requests can always be inspected even at a low sample rate.
+
+Traces are appended to TRACING_EXPORT_PATH in the OTLP/JSON format, one ExportTraceServiceRequest
+per line. That is the format read by the OpenTelemetry Collector's otlpjsonfile receiver, and each
+line can also be posted as-is to an OTLP/HTTP endpoint's /v1/traces.
+
+The trace and span IDs of the current span are added to every log record, as trace_context.
+An incoming W3C traceparent header is continued, and its sampled flag respected.
+"""
+import functools
+import inspect
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Iterator
+
+from flask import Response, g, request
+
+from app.config.constants import TRACING_MAX_SPANS_PER_TRACE
+
+logger = logging.getLogger(__name__)
+
+# OTLP span kinds
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+
+_STATUS_CODE_ERROR = 2
+
+_TRACEPARENT_PATTERN = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+_current_span: ContextVar["Span | None"] = ContextVar("current_span", default=None)
+
+
+class _TracingSettings:
+    def __init__(self, export_path: str, sample_rate: float, slow_request_seconds: float, service_name: str):
+        self.export_path = export_path
+        self.sample_rate = sample_rate
+        self.slow_request_seconds = slow_request_seconds
+        self.service_name = service_name
+
+
+_settings: _TracingSettings | None = None
+_export_lock = threading.Lock()
+
+
+class _Trace:
+    """The spans recorded so far for one request."""
+
+    def __init__(self, trace_id: str, sampled: bool):
+        self.trace_id = trace_id
+        self.sampled = sampled
+        self.spans: list[Span] = []
+        self.dropped_spans = 0
+        self._lock = threading.Lock()
+
+    def add(self, span: "Span") -> None:
+        with self._lock:
+            if len(self.spans) < TRACING_MAX_SPANS_PER_TRACE:
+                self.spans.append(span)
+            else:
+                self.dropped_spans += 1
+
+
+class Span:
+    """A timed step of a request. Created by span(), start_span() or traced()."""
+
+    __slots__ = ("trace", "span_id", "parent_span_id", "name", "kind", "attributes",
+                 "start_time_ns", "end_time_ns", "error")
+
+    def __init__(self, trace: _Trace, name: str, parent_span_id: str | None, kind: int, attributes: dict):
+        self.trace = trace
+        self.span_id = os.urandom(8).hex()
+        self.parent_span_id = parent_span_id
+        self.name = name
+        self.kind = kind
+        self.attributes = attributes
+        self.start_time_ns = time.time_ns()
+        self.end_time_ns: int | None = None
+        self.error: str | None = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def record_error(self, error: BaseException) -> None:
+        self.error = f"{type(error).__name__}: {error}"
+
+    def end(self) -> None:
+        """Finish the span. Only the first call has any effect."""
+        if self.end_time_ns is None:
+            self.end_time_ns = time.time_ns()
+            self.trace.add(self)
+
+    def to_otlp(self) -> dict:
+        otlp_span = {
+            "traceId": self.trace.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_time_ns),
+            "endTimeUnixNano": str(self.end_time_ns),
+            "attributes": _to_otlp_attributes(self.attributes),
+        }
+        if self.parent_span_id:
+            otlp_span["parentSpanId"] = self.parent_span_id
+        if self.error:
+            otlp_span["status"] = {"code": _STATUS_CODE_ERROR, "message": self.error}
+
+        return otlp_span
+
+
+def _to_otlp_value(value: Any) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _to_otlp_attributes(attributes: dict) -> list[dict]:
+    return [{"key": key, "value": _to_otlp_value(value)} for key, value in attributes.items()]
+
+
+def configure_tracing(
+    export_path: str | None,
+    sample_rate: float,
+    slow_request_seconds: float,
+    service_name: str = "bgchat-backend",
+) -> None:
+    """Turn tracing on, writing traces to export_path, or off if export_path is None."""
+    global _settings
+
+    if export_path is None:
+        _settings = None
+        return
+
+    _settings = _TracingSettings(export_path, sample_rate, slow_request_seconds, service_name)
+
+
+def start_span(name: str, kind: int = SPAN_KIND_INTERNAL, **attributes: Any) -> Span | None:
+    """
+    Start a child of the current span without making it current, for work that runs interleaved with
+    other spans, such as consuming a stream. The caller must end() it. Returns None outside a trace.
+    """
+    parent = _current_span.get()
+    if parent is None:
+        return None
+
+    return Span(parent.trace, name, parent.span_id, kind, attributes)
+
+
+@contextmanager
+def span(name: str, kind: int = SPAN_KIND_INTERNAL, **attributes: Any) -> Iterator[Span | None]:
+    """Time a block as a child of the current span, and make it current. Yields None outside a trace."""
+    child = start_span(name, kind, **attributes)
+    if child is None:
+        yield None
+        return
+
+    parent = _current_span.get()
+    _current_span.set(child)
+    try:
+        yield child
+    except GeneratorExit:
+        # A client disconnecting from a stream isn't an error in the step it interrupted
+        child.set_attribute("cancelled", True)
+        raise
+    except BaseException as e:
+        child.record_error(e)
+        raise
+    finally:
+        # Restored rather than reset with a token, since a generator can be closed from another context
+        _current_span.set(parent)
+        child.end()
+
+
+def traced(name: str | None = None, kind: int = SPAN_KIND_INTERNAL) -> Callable:
+    """
+    Decorator that runs a function in a span named after it. For a generator function, the span lasts
+    until the generator is exhausted or closed, so it covers the whole of a streamed answer.
+    """
+    def decorator(function: Callable) -> Callable:
+        span_name = name or function.__qualname__
+
+        if inspect.isgeneratorfunction(function):
+            @functools.wraps(function)
+            def generator_wrapper(*args, **kwargs):
+                if _current_span.get() is None:
+                    return (yield from function(*args, **kwargs))
+                with span(span_name, kind):
+                    return (yield from function(*args, **kwargs))
+
+            return generator_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _current_span.get() is None:
+                return function(*args, **kwargs)
+            with span(span_name, kind):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def _parse_traceparent(header: str | None) -> tuple[str, str, bool] | None:
+    match = _TRACEPARENT_PATTERN.match(header.strip().lower()) if header else None
+    if match is None or match.group(1) == "0" * 32 or match.group(2) == "0" * 16:
+        return None
+
+    trace_id, parent_span_id, flags = match.groups()
+    return trace_id, parent_span_id, bool(int(flags, 16) & 1)
+
+
+def start_request_trace() -> None:
+    """Start a trace with a root span for the request, if tracing is on. Registered as a before_request hook."""
+    settings = _settings
+    if settings is None:
+        return
+
+    traceparent = _parse_traceparent(request.headers.get("traceparent"))
+    if traceparent is not None:
+        trace_id, parent_span_id, sampled = traceparent
+    else:
+        trace_id, parent_span_id = os.urandom(16).hex(), None
+        sampled = random.random() < settings.sample_rate
+
+    root_span = Span(
+        _Trace(trace_id, sampled),
+        f"{request.method} {request.url_rule.rule if request.url_rule is not None else 'unmatched'}",
+        parent_span_id,
+        SPAN_KIND_SERVER,
+        {"http.request.method": request.method, "url.path": request.path},
+    )
+    g.root_span = root_span
+    _current_span.set(root_span)
+
+
+def end_request_trace(response: Response) -> Response:
+    """
+    End the request's root span and write out its trace if it should be kept. Registered as an
+    after_request hook; streamed responses are ended when their stream closes.
+    """
+    root_span = g.pop("root_span", None)
+    if root_span is None:
+        return response
+
+    root_span.set_attribute("http.response.status_code", response.status_code)
+    if response.status_code >= 500:
+        root_span.error = f"HTTP {response.status_code}"
+
+    def end():
+        _current_span.set(None)
+        root_span.end()
+        _export_if_kept(root_span)
+
+    if response.is_streamed:
+        response.call_on_close(end)
+    else:
+        end()
+
+    return response
+
+
+def _export_if_kept(root_span: Span) -> None:
+    settings = _settings
+    if settings is None:
+        return
+
+    duration_seconds = (root_span.end_time_ns - root_span.start_time_ns) / 1e9
+    if not (root_span.trace.sampled or root_span.error or duration_seconds >= settings.slow_request_seconds):
+        return
+
+    try:
+        export_trace(root_span.trace, settings)
+    except Exception as e:
+        logger.error("Error exporting trace %s: %s", root_span.trace.trace_id, str(e))
+
+
+def export_trace(trace: _Trace, settings: _TracingSettings) -> None:
+    """Append a trace to the export file as one line of OTLP/JSON."""
+    resource_attributes = {"service.name": settings.service_name, "process.pid": os.getpid()}
+    if trace.dropped_spans:
+        resource_attributes["bgchat.dropped_spans"] = trace.dropped_spans
+
+    line = json.dumps({
+        "resourceSpans": [{
+            "resource": {"attributes": _to_otlp_attributes(resource_attributes)},
+            "scopeSpans": [{
+                "scope": {"name": __name__},
+                "spans": [span.to_otlp() for span in trace.spans],
+            }],
+        }],
+    }, separators=(",", ":")) + "\n"
+
+    # A single write to a file opened for appending, so lines from different workers don't interleave
+    with _export_lock:
+        fd = os.open(settings.export_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line.encode())
+        finally:
+            os.close(fd)
+
+
+def _make_log_record_factory(previous_factory: Callable) -> Callable:
+    def record_factory(*args, **kwargs) -> logging.LogRecord:
+        record = previous_factory(*args, **kwargs)
+        current = _current_span.get()
+        record.trace_context = (
+            f" [trace_id={current.trace.trace_id} span_id={current.span_id}]" if current is not None else ""
+        )
+        return record
+
+    return record_factory
+
+
+# Installed on import, so every record has trace_context before any handler formats it
+logging.setLogRecordFactory(_make_log_record_factory(logging.getLogRecordFactory()))
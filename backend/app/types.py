@@ -5,14 +5,37 @@ class Message(TypedDict):
     role: Literal["user", "assistant"]
     content: str
 
+class StoredMessage(Message):
+    """Type definition for a chat message as stored in the database, with its index in the conversation."""
+    seq: int
+
 class RulebookPage(TypedDict):
     """Type definition for a rulebook page."""
     rulebook_name: str
     page_num: int
     text: str
 
+class CatalogRulebook(TypedDict):
+    """Type definition for a rulebook in the board game catalog."""
+    name: str
+    page_count: int
+
+class BoardGame(TypedDict):
+    """Type definition for a board game in the board game catalog."""
+    name: str
+    rulebooks: list[CatalogRulebook]
+    page_count: int
+    version: int
+
 class TokenUsage(TypedDict):
     """Type definition for token usage for a single model."""
     input_tokens: int
     output_tokens: int
     web_searches: int
+
+class AdmissionState(TypedDict):
+    """Type definition for a user's request budget and open stream leases."""
+    tokens_usd: float
+    updated_at: float
+    # Lease ID to the time the lease expires
+    streams: dict[str, float]
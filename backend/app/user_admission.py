@@ -0,0 +1,236 @@
+import json
+import logging
+import math
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Iterator
+
+from app.config.constants import (
+    ERROR_REQUEST_BUDGET_EXCEEDED,
+    ERROR_TOO_MANY_CONCURRENT_STREAMS,
+    USER_ADMISSION_PURGE_INTERVAL_SECONDS,
+    USER_STREAM_LEASE_SECONDS,
+    USER_STREAM_RETRY_AFTER_SECONDS,
+)
+from app.types import AdmissionState
+from app.utils.sqlite import SharedSQLiteDatabase, sqlite_path_from_uri
+
+logger = logging.getLogger(__name__)
+
+# Allows for floating point error when comparing sums of dollar amounts
+_USD_TOLERANCE = 1e-12
+
+_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS user_admission (
+        user_id TEXT PRIMARY KEY,
+        tokens_usd REAL NOT NULL,
+        updated_at REAL NOT NULL,
+        streams TEXT NOT NULL
+    ) WITHOUT ROWID;
+"""
+
+
+class AdmissionDeniedError(Exception):
+    """
+    Raised when a user has to wait before making another request.
+    reason is "request_budget" or "concurrent_streams".
+    """
+    def __init__(self, message: str, retry_after_seconds: int, reason: str):
+        super().__init__(message)
+        self.message = message
+        self.retry_after_seconds = retry_after_seconds
+        self.reason = reason
+
+
+class _MemoryAdmissionStore:
+    """Admission state for the current process only."""
+
+    def __init__(self):
+        self._states: dict[str, AdmissionState] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def transaction(self, user_id: str, initial_state: AdmissionState) -> Iterator[AdmissionState]:
+        with self._lock:
+            stored_state = self._states.get(user_id)
+            if stored_state is None:
+                state = initial_state
+            else:
+                state = {**stored_state, "streams": dict(stored_state["streams"])}
+            yield state
+            self._states[user_id] = state
+
+    def purge(self, before: float) -> None:
+        with self._lock:
+            for user_id in [user_id for user_id, state in self._states.items() if state["updated_at"] <= before]:
+                del self._states[user_id]
+
+
+class _SQLiteAdmissionStore:
+    """Admission state in a SQLite database shared by every worker process on the host."""
+
+    def __init__(self, path: str):
+        self._database = SharedSQLiteDatabase(path, _SCHEMA)
+
+    @contextmanager
+    def transaction(self, user_id: str, initial_state: AdmissionState) -> Iterator[AdmissionState]:
+        with self._database.transaction() as connection:
+            row = connection.execute(
+                "SELECT tokens_usd, updated_at, streams FROM user_admission WHERE user_id = ?",
+                (user_id,),
+            ).fetchone()
+
+            state = initial_state if row is None else {
+                "tokens_usd": row[0],
+                "updated_at": row[1],
+                "streams": json.loads(row[2]),
+            }
+            yield state
+
+            connection.execute(
+                "INSERT OR REPLACE INTO user_admission (user_id, tokens_usd, updated_at, streams) VALUES (?, ?, ?, ?)",
+                (user_id, state["tokens_usd"], state["updated_at"], json.dumps(state["streams"])),
+            )
+
+    def purge(self, before: float) -> None:
+        self._database.connection().execute("DELETE FROM user_admission WHERE updated_at <= ?", (before,))
+
+
+class UserAdmissionControl:
+    """
+    Decides whether a user may start another expensive request.
+
+    Each user has a token bucket holding up to budget_usd dollars, refilled at refill_usd_per_hour.
+    A request is admitted if the bucket holds its estimated cost, which is taken out straight away,
+    and charge() settles the difference once the request's actual cost is known. Streaming requests
+    also need one of the user's max_concurrent_streams slots, held until release().
+
+    storage_uri is either sqlite:///<path>, to share state between the worker processes on a host,
+    or memory:// for state private to the process.
+
+    If the state can't be read or written, requests are admitted: the daily cost limit still applies.
+    """
+
+    def __init__(
+        self,
+        storage_uri: str,
+        budget_usd: float,
+        refill_usd_per_hour: float,
+        max_concurrent_streams: int,
+    ):
+        if storage_uri == "memory://":
+            self._store = _MemoryAdmissionStore()
+        else:
+            self._store = _SQLiteAdmissionStore(sqlite_path_from_uri(storage_uri))
+
+        self._budget_usd = budget_usd
+        self._refill_usd_per_second = refill_usd_per_hour / 3600
+        self._max_concurrent_streams = max_concurrent_streams
+        self._next_purge_at = 0.0
+
+    @contextmanager
+    def _transaction(self, user_id: str) -> Iterator[AdmissionState]:
+        """Read-modify-write a user's state, with the bucket refilled and expired stream leases dropped."""
+        now = time.time()
+        self._purge_idle_users_if_due(now)
+
+        initial_state = {"tokens_usd": self._budget_usd, "updated_at": now, "streams": {}}
+        with self._store.transaction(user_id, initial_state) as state:
+            elapsed_seconds = max(0.0, now - state["updated_at"])
+            state["tokens_usd"] = min(
+                self._budget_usd,
+                state["tokens_usd"] + elapsed_seconds * self._refill_usd_per_second,
+            )
+            state["updated_at"] = now
+            state["streams"] = {
+                lease_id: expires_at
+                for lease_id, expires_at in state["streams"].items()
+                if expires_at > now
+            }
+            yield state
+
+    def _purge_idle_users_if_due(self, now: float) -> None:
+        if now < self._next_purge_at:
+            return
+
+        self._next_purge_at = now + USER_ADMISSION_PURGE_INTERVAL_SECONDS
+
+        # Once a user's bucket has refilled and their leases have expired, their state is the same as a new user's
+        idle_seconds = max(self._budget_usd / self._refill_usd_per_second, USER_STREAM_LEASE_SECONDS)
+        try:
+            self._store.purge(before=now - idle_seconds)
+        except Exception as e:
+            logger.error("Error purging idle user admission state: %s", str(e))
+
+    def acquire(self, user_id: str, cost_usd: float, stream: bool = False) -> str | None:
+        """
+        Admit a request with an estimated cost, taking the cost from the user's bucket.
+        For a streaming request, returns the ID of the stream slot to release once it finishes.
+        Raises AdmissionDeniedError if the user has to wait first.
+        """
+        # A request can never cost more than a full bucket, or it would never be admitted
+        cost_usd = min(cost_usd, self._budget_usd)
+
+        try:
+            with self._transaction(user_id) as state:
+                if stream and len(state["streams"]) >= self._max_concurrent_streams:
+                    raise AdmissionDeniedError(
+                        ERROR_TOO_MANY_CONCURRENT_STREAMS,
+                        USER_STREAM_RETRY_AFTER_SECONDS,
+                        reason="concurrent_streams",
+                    )
+
+                shortfall_usd = cost_usd - state["tokens_usd"]
+                if shortfall_usd > _USD_TOLERANCE:
+                    retry_after_seconds = math.ceil((shortfall_usd - _USD_TOLERANCE) / self._refill_usd_per_second)
+                    raise AdmissionDeniedError(
+                        ERROR_REQUEST_BUDGET_EXCEEDED,
+                        retry_after_seconds,
+                        reason="request_budget",
+                    )
+
+                state["tokens_usd"] -= cost_usd
+
+                lease_id = None
+                if stream:
+                    lease_id = uuid.uuid4().hex
+                    state["streams"][lease_id] = state["updated_at"] + USER_STREAM_LEASE_SECONDS
+
+                return lease_id
+
+        except AdmissionDeniedError:
+            raise
+
+        except Exception as e:
+            logger.error("Error checking admission for user %s, admitting request: %s", user_id, str(e))
+            return None
+
+    def release(self, user_id: str, lease_id: str | None = None, refund_usd: float = 0.0) -> None:
+        """Free a stream slot, and return refund_usd to the user's bucket for a request that didn't run."""
+        if lease_id is None and refund_usd == 0:
+            return
+
+        try:
+            with self._transaction(user_id) as state:
+                state["streams"].pop(lease_id, None)
+                state["tokens_usd"] = min(self._budget_usd, state["tokens_usd"] + refund_usd)
+
+        except Exception as e:
+            logger.error("Error releasing admission for user %s: %s", user_id, str(e))
+
+    def charge(self, user_id: str, cost_usd: float) -> None:
+        """
+        Take cost_usd from the user's bucket, or return it if negative. The bucket may go into debt,
+        delaying the user's next request until it has refilled.
+        """
+        if cost_usd == 0:
+            return
+
+        try:
+            with self._transaction(user_id) as state:
+                state["tokens_usd"] = min(self._budget_usd, state["tokens_usd"] - cost_usd)
+
+        except Exception as e:
+            logger.error("Error charging request budget for user %s: %s", user_id, str(e))
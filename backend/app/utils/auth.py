@@ -1,11 +1,13 @@
+import hashlib
 import json
+import logging
+import os
 import time
 import threading
 import re
 
 import jwt
-import requests
-from flask import request, current_app
+from flask import g, request, current_app
 
 from app.config.constants import (
     DEFAULT_TIMEOUT_SECONDS,
@@ -20,16 +22,45 @@ from app.config.constants import (
     ERROR_INVALID_USER_ID,
     ERROR_INVALID_HEADER_NO_KID,
     ERROR_UNABLE_TO_FIND_APPROPRIATE_KEY,
+    ERROR_SIGNING_KEYS_NOT_LOADED,
     ERROR_INVALID_TOKEN,
     ERROR_AUTH0_CONFIGURATION_NOT_PROPERLY_SET_UP,
-    ERROR_ERROR_EXTRACTING_USER_ID,
 )
+from app.utils.cache import TTLCache
+from app.utils.lazy_import import LazyModule
 
+# Only used to fetch signing keys, which happens off the request path
+requests = LazyModule("requests")
+
+logger = logging.getLogger(__name__)
 
 _jwks_cache = {}
 _jwks_cache_lock = threading.Lock()
 JWKS_CACHE_DURATION = 3600
 
+# With background refresh, keys are renewed this long after they were fetched, well before
+# JWKS_CACHE_DURATION, and failed refreshes are retried after JWKS_REFRESH_RETRY_INTERVAL
+JWKS_REFRESH_INTERVAL = 900
+JWKS_REFRESH_RETRY_INTERVAL = 30
+# A token with an unknown kid forces a refresh at most once per this many seconds
+JWKS_FORCED_REFRESH_MIN_INTERVAL = 60
+# Requests that arrive before any keys have been loaded are asked to retry after this long
+JWKS_NOT_LOADED_RETRY_AFTER_SECONDS = 5
+_jwks_refresh_lock = threading.Lock()
+_jwks_refreshes_in_progress = set()
+_jwks_refresher_pids = {}
+_jwks_last_forced_refresh = {}
+
+# Verified claims are cached until the token expires, but for no longer than this,
+# so tokens signed by a key that has since been rotated out stop being accepted soon after
+VERIFIED_CLAIMS_CACHE_MAX_ENTRIES = 10000
+VERIFIED_CLAIMS_CACHE_MAX_SECONDS = 300
+_verified_claims_cache = TTLCache(
+    max_entries=VERIFIED_CLAIMS_CACHE_MAX_ENTRIES,
+    ttl_seconds=VERIFIED_CLAIMS_CACHE_MAX_SECONDS,
+    name="verified_claims",
+)
+
 # User ID validation pattern - Auth0 user IDs are typically in format: auth0|1234567890abcdef
 USER_ID_PATTERN = re.compile(r'^[a-zA-Z0-9_\-|]+$')
 MAX_USER_ID_LENGTH = 128
@@ -42,6 +73,13 @@ class AuthenticationError(Exception):
         self.message = message
 
 
+class SigningKeysUnavailableError(AuthenticationError):
+    """Raised when a token can't be verified because no signing keys have been loaded yet."""
+    def __init__(self, message: str, retry_after_seconds: int):
+        super().__init__(message)
+        self.retry_after_seconds = retry_after_seconds
+
+
 def _validate_user_id(user_id: str) -> None:
     """
     Validate user ID format and length.
@@ -62,56 +100,235 @@ def _get_cached_jwks(auth0_domain: str) -> dict | None:
     Get JWKS from cache if it's still valid, otherwise return None.
     Thread-safe implementation.
     """
+    cached_data = _get_cached_jwks_entry(auth0_domain)
+    return cached_data['jwks'] if cached_data else None
+
+
+def _get_cached_signing_keys(auth0_domain: str) -> dict | None:
+    """
+    Get the public keys parsed from the cached JWKS, keyed by kid, if it's still valid,
+    otherwise return None.
+    Thread-safe implementation.
+    """
+    cached_data = _get_cached_jwks_entry(auth0_domain)
+    return cached_data['signing_keys'] if cached_data else None
+
+
+def _get_cached_jwks_entry(auth0_domain: str, allow_stale: bool = False) -> dict | None:
     with _jwks_cache_lock:
         if auth0_domain in _jwks_cache:
             cached_data = _jwks_cache[auth0_domain]
-            if time.time() - cached_data['timestamp'] < JWKS_CACHE_DURATION:
-                return cached_data['jwks']
+            if allow_stale or time.time() - cached_data['timestamp'] < JWKS_CACHE_DURATION:
+                return cached_data
             del _jwks_cache[auth0_domain]
     return None
 
 
-def _set_cached_jwks(auth0_domain: str, jwks: dict):
+def _parse_signing_keys(jwks: dict) -> dict:
+    """
+    Build ready-to-use public keys for every RSA signing key in a JWKS, keyed by kid.
+    Keys that can't be parsed are skipped, so one bad key doesn't lock out every user.
+    """
+    signing_keys = {}
+
+    for key in jwks.get("keys", []):
+        if key.get("kty") != "RSA" or key.get("use", "sig") != "sig" or "kid" not in key:
+            continue
+
+        try:
+            signing_keys[key["kid"]] = jwt.algorithms.RSAAlgorithm.from_jwk(key)
+        except Exception as e:
+            logger.warning("Skipping JWKS key '%s' that could not be parsed: %s", key["kid"], str(e))
+
+    return signing_keys
+
+
+def _set_cached_jwks(auth0_domain: str, jwks: dict) -> dict:
     """
-    Store JWKS in cache with current timestamp.
+    Store JWKS in cache with current timestamp, along with its parsed public keys.
+    Returns the parsed public keys, keyed by kid.
     Thread-safe implementation.
     """
+    signing_keys = _parse_signing_keys(jwks)
+
     with _jwks_cache_lock:
         _jwks_cache[auth0_domain] = {
             'jwks': jwks,
+            'signing_keys': signing_keys,
             'timestamp': time.time()
         }
 
+    return signing_keys
+
 
-def get_user_id_from_auth_header() -> str:
+def refresh_jwks(auth0_domain: str) -> dict:
     """
-    Extract the user's ID from the token in the request's Authorization header.
-    Does not validate the token, so must only be used after validate_jwt has been called.
-    Raises AuthenticationError if validation fails.
+    Fetch the JWKS from Auth0 and cache it.
+    Returns the parsed public keys, keyed by kid.
     """
-    try:
-        token = get_token_from_auth_header()
-        unverified_claims = jwt.decode(
-            token,
-            options={"verify_signature": False}
-        )
+    jwks_url = f"https://{auth0_domain}/.well-known/jwks.json"
+    jwks_response = requests.get(jwks_url, timeout=DEFAULT_TIMEOUT_SECONDS)
+    jwks_response.raise_for_status()
+
+    return _set_cached_jwks(auth0_domain, jwks_response.json())
+
+
+def load_jwks_from_file(auth0_domain: str, jwks_file: str) -> dict:
+    """
+    Cache a JWKS saved to a local file, e.g. so keys are available at boot without calling Auth0.
+    Returns the parsed public keys, keyed by kid.
+    """
+    with open(jwks_file, encoding="utf-8") as file:
+        jwks = json.load(file)
+
+    return _set_cached_jwks(auth0_domain, jwks)
 
-        if "sub" not in unverified_claims:
-            raise AuthenticationError(ERROR_TOKEN_DOES_NOT_CONTAIN_USER_ID)
 
-        user_id = unverified_claims["sub"]
+def _refresh_jwks_in_background(auth0_domain: str) -> None:
+    """Refresh the JWKS on a separate thread, unless a refresh is already in progress."""
+    with _jwks_refresh_lock:
+        if auth0_domain in _jwks_refreshes_in_progress:
+            return
+        _jwks_refreshes_in_progress.add(auth0_domain)
 
+    def refresh():
         try:
-            _validate_user_id(user_id)
-        except ValueError as e:
-            raise AuthenticationError(f"{ERROR_INVALID_USER_ID}: {str(e)}")
+            refresh_jwks(auth0_domain)
+        except Exception as e:
+            logger.warning("Failed to refresh JWKS for %s: %s", auth0_domain, str(e))
+        finally:
+            with _jwks_refresh_lock:
+                _jwks_refreshes_in_progress.discard(auth0_domain)
 
-        return user_id
+    threading.Thread(target=refresh, name="jwks-refresh", daemon=True).start()
 
-    except AuthenticationError:
-        raise
-    except Exception as e:
-        raise AuthenticationError(f"{ERROR_ERROR_EXTRACTING_USER_ID}: {str(e)}")
+
+def _force_jwks_refresh(auth0_domain: str) -> None:
+    """
+    Refresh the JWKS in the background after seeing a token with an unknown kid (e.g. after a key
+    rotation), at most once per JWKS_FORCED_REFRESH_MIN_INTERVAL so bogus tokens can't flood Auth0.
+    """
+    with _jwks_refresh_lock:
+        last_forced_refresh = _jwks_last_forced_refresh.get(auth0_domain)
+        now = time.monotonic()
+        if last_forced_refresh is not None and now - last_forced_refresh < JWKS_FORCED_REFRESH_MIN_INTERVAL:
+            return
+        _jwks_last_forced_refresh[auth0_domain] = now
+
+    _refresh_jwks_in_background(auth0_domain)
+
+
+def _run_jwks_refresher(auth0_domain: str) -> None:
+    """Keep the cached JWKS fresh by refreshing it JWKS_REFRESH_INTERVAL after each fetch."""
+    while True:
+        cached_data = _get_cached_jwks_entry(auth0_domain, allow_stale=True)
+
+        if cached_data is not None:
+            age = time.time() - cached_data['timestamp']
+            if age < JWKS_REFRESH_INTERVAL:
+                time.sleep(JWKS_REFRESH_INTERVAL - age)
+                continue
+
+        try:
+            refresh_jwks(auth0_domain)
+        except Exception as e:
+            logger.warning("Failed to refresh JWKS for %s, retrying: %s", auth0_domain, str(e))
+            time.sleep(JWKS_REFRESH_RETRY_INTERVAL)
+
+
+def start_jwks_refresher(auth0_domain: str) -> None:
+    """
+    Start the background JWKS refresher for this process if it isn't already running.
+    Threads don't survive a fork, so each worker process starts its own.
+    """
+    with _jwks_refresh_lock:
+        if _jwks_refresher_pids.get(auth0_domain) == os.getpid():
+            return
+        _jwks_refresher_pids[auth0_domain] = os.getpid()
+
+    threading.Thread(
+        target=_run_jwks_refresher,
+        args=(auth0_domain,),
+        name="jwks-refresher",
+        daemon=True,
+    ).start()
+
+
+def initialise_jwks(auth0_domain: str, jwks_file: str | None = None, background_refresh: bool = True) -> None:
+    """
+    Load signing keys at boot, from jwks_file if given or otherwise from Auth0,
+    and start refreshing them in the background.
+    Failing to fetch keys from Auth0 here is logged rather than raised, as the refresher keeps retrying.
+    """
+    if jwks_file:
+        load_jwks_from_file(auth0_domain, jwks_file)
+        logger.info("Loaded JWKS for %s from %s", auth0_domain, jwks_file)
+
+    elif background_refresh:
+        try:
+            refresh_jwks(auth0_domain)
+        except Exception as e:
+            logger.warning("Failed to fetch JWKS for %s at startup: %s", auth0_domain, str(e))
+
+    if background_refresh:
+        start_jwks_refresher(auth0_domain)
+
+
+def warm_up_jwks(auth0_domain: str, background_refresh: bool = True) -> None:
+    """
+    Make sure this process has signing keys, fetching them now if it has none,
+    and that it is refreshing them in the background if enabled.
+    """
+    if _get_cached_jwks_entry(auth0_domain, allow_stale=True) is None:
+        refresh_jwks(auth0_domain)
+
+    if background_refresh:
+        start_jwks_refresher(auth0_domain)
+
+
+def _get_signing_keys(auth0_domain: str, background_refresh: bool) -> dict:
+    """
+    Get the public keys to verify tokens with, keyed by kid.
+
+    With background refresh, requests never wait on Auth0: expired keys keep being served while
+    they are refreshed in the background, and SigningKeysUnavailableError is raised if no keys
+    have been loaded yet. Otherwise, expired or missing keys are fetched inline.
+    """
+    if not background_refresh:
+        signing_keys = _get_cached_signing_keys(auth0_domain)
+        if signing_keys is None:
+            signing_keys = refresh_jwks(auth0_domain)
+        return signing_keys
+
+    start_jwks_refresher(auth0_domain)
+    cached_data = _get_cached_jwks_entry(auth0_domain, allow_stale=True)
+
+    if cached_data is None:
+        _refresh_jwks_in_background(auth0_domain)
+        raise SigningKeysUnavailableError(ERROR_SIGNING_KEYS_NOT_LOADED, JWKS_NOT_LOADED_RETRY_AFTER_SECONDS)
+
+    if time.time() - cached_data['timestamp'] >= JWKS_CACHE_DURATION:
+        _refresh_jwks_in_background(auth0_domain)
+
+    return cached_data['signing_keys']
+
+
+def get_user_id_from_claims(claims: dict) -> str:
+    """
+    Get the user's ID from a token's claims.
+    Raises AuthenticationError if the claims don't contain a valid user ID.
+    """
+    if "sub" not in claims:
+        raise AuthenticationError(ERROR_TOKEN_DOES_NOT_CONTAIN_USER_ID)
+
+    user_id = claims["sub"]
+
+    try:
+        _validate_user_id(user_id)
+    except ValueError as e:
+        raise AuthenticationError(f"{ERROR_INVALID_USER_ID}: {str(e)}")
+
+    return user_id
 
 
 def get_token_from_auth_header() -> str:
@@ -136,10 +353,33 @@ def get_token_from_auth_header() -> str:
     return parts[1]
 
 
-def validate_jwt(token: str) -> None:
+def _cache_verified_claims(cache_key: tuple, claims: dict) -> None:
+    """Cache a token's verified claims until it expires, or for VERIFIED_CLAIMS_CACHE_MAX_SECONDS if sooner."""
+    expires_at = claims.get("exp")
+
+    # Tokens without an expiry are verified every time
+    if not isinstance(expires_at, (int, float)):
+        return
+
+    ttl_seconds = min(expires_at - time.time(), VERIFIED_CLAIMS_CACHE_MAX_SECONDS)
+    if ttl_seconds > 0:
+        _verified_claims_cache.set(cache_key, claims, ttl_seconds=ttl_seconds)
+
+
+def get_auth_cache_stats() -> dict[str, dict[str, float]]:
+    """Get hit rate statistics for this process's authentication caches."""
+    return {
+        "verified_claims": _verified_claims_cache.stats(),
+    }
+
+
+def validate_jwt(token: str) -> dict:
     """
-    Validates the JWT token against the Auth0 JWKS.
+    Validates the JWT token against the Auth0 JWKS and returns its verified claims.
     Raises AuthenticationError if the token is invalid.
+
+    Verified claims are cached by a hash of the token, so repeat requests with the same token
+    skip signature verification until it expires.
     """
     auth0_domain = current_app.config.get('AUTH0_DOMAIN')
     auth0_audience = current_app.config.get('AUTH0_AUDIENCE')
@@ -148,42 +388,58 @@ def validate_jwt(token: str) -> None:
     if not auth0_domain or not auth0_audience:
         raise Exception(ERROR_AUTH0_CONFIGURATION_NOT_PROPERLY_SET_UP)
 
-    jwks = _get_cached_jwks(auth0_domain)
+    cache_key = (auth0_domain, auth0_audience, hashlib.sha256(token.encode()).hexdigest())
+    claims = _verified_claims_cache.get(cache_key)
 
-    if jwks is None:
-        jwks_url = f"https://{auth0_domain}/.well-known/jwks.json"
-        jwks_response = requests.get(jwks_url, timeout=DEFAULT_TIMEOUT_SECONDS)
-        jwks_response.raise_for_status()
-        jwks = jwks_response.json()
+    if claims is not None:
+        return claims
 
-        _set_cached_jwks(auth0_domain, jwks)
+    background_refresh = current_app.config.get('JWKS_BACKGROUND_REFRESH', True)
+    signing_keys = _get_signing_keys(auth0_domain, background_refresh)
 
     unverified_header = jwt.get_unverified_header(token)
     if "kid" not in unverified_header:
         raise AuthenticationError(ERROR_INVALID_HEADER_NO_KID)
 
-    rsa_key = {}
-    for key in jwks["keys"]:
-        if key["kid"] == unverified_header["kid"]:
-            rsa_key = {
-                "kty": key["kty"],
-                "kid": key["kid"],
-                "use": key["use"],
-                "n": key["n"],
-                "e": key["e"]
-            }
-            break
-
-    if not rsa_key:
+    signing_key = signing_keys.get(unverified_header["kid"])
+
+    if signing_key is None:
+        if background_refresh:
+            _force_jwks_refresh(auth0_domain)
         raise AuthenticationError(ERROR_UNABLE_TO_FIND_APPROPRIATE_KEY)
 
     try:
-        jwt.decode(
+        claims = jwt.decode(
             token,
-            jwt.algorithms.RSAAlgorithm.from_jwk(json.dumps(rsa_key)),
+            signing_key,
             algorithms=[algorithm],
             audience=auth0_audience,
             issuer=f"https://{auth0_domain}/"
         )
     except Exception as e:
         raise AuthenticationError(f"{ERROR_INVALID_TOKEN}: {str(e)}")
+
+    _cache_verified_claims(cache_key, claims)
+
+    return claims
+
+
+def authenticate_request() -> str:
+    """
+    Authenticate the current request and return the user's ID.
+
+    The token is parsed and verified, and the user ID validated, once per request. The verified
+    claims and user ID are stored on flask.g (as auth_claims and user_id) for decorators and routes,
+    and later calls during the same request return the stored user ID.
+    Raises AuthenticationError if authentication fails.
+    """
+    if "user_id" in g:
+        return g.user_id
+
+    claims = validate_jwt(get_token_from_auth_header())
+    user_id = get_user_id_from_claims(claims)
+
+    g.auth_claims = claims
+    g.user_id = user_id
+
+    return user_id
@@ -0,0 +1,141 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+from app.metrics import CACHE_LOOKUPS
+
+
+class TTLCache:
+    """
+    Thread-safe, size-bounded LRU cache whose entries expire after a time-to-live.
+    Tracks hits and misses so hit rates can be reported, and exports them as metrics if named.
+
+    If group_key is given, keys are indexed by group_key(key), so every entry in a group
+    (e.g. every conversation of one user) can be invalidated without scanning the cache.
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        ttl_seconds: float,
+        name: str | None = None,
+        group_key: Callable[[Hashable], Hashable] | None = None,
+    ):
+        self._max_entries = max_entries
+        self._ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[Hashable, tuple[Any, float]] = OrderedDict()
+        self._group_key = group_key
+        self._keys_by_group: dict[Hashable, set[Hashable]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._hit_counter = CACHE_LOOKUPS.labels(cache=name, result="hit") if name else None
+        self._miss_counter = CACHE_LOOKUPS.labels(cache=name, result="miss") if name else None
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Get the value for a key, or default if it is missing or has expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is not None and time.monotonic() >= entry[1]:
+                self._remove(key)
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+
+        counter = self._miss_counter if entry is None else self._hit_counter
+        if counter is not None:
+            counter.inc()
+
+        return default if entry is None else entry[0]
+
+    def peek(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Get the value for a key like get(), but without counting a hit or miss or marking it recently used,
+        for internal bookkeeping that shouldn't skew hit rates.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+
+        if entry is None or time.monotonic() >= entry[1]:
+            return default
+
+        return entry[0]
+
+    def set(self, key: Hashable, value: Any, ttl_seconds: float | None = None) -> None:
+        """
+        Store a value, evicting the least recently used entry if the cache is full.
+        ttl_seconds overrides the cache's default time-to-live for this entry.
+        """
+        if ttl_seconds is None:
+            ttl_seconds = self._ttl_seconds
+
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl_seconds)
+            self._entries.move_to_end(key)
+
+            if self._group_key is not None:
+                self._keys_by_group.setdefault(self._group_key(key), set()).add(key)
+
+            while len(self._entries) > self._max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def update(self, key: Hashable, update_value: Callable[[Any], Any]) -> bool:
+        """
+        Replace the value of an existing, unexpired entry with update_value(value)
+        without extending its lifetime. Returns False if there was no such entry.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None or time.monotonic() >= entry[1]:
+                return False
+
+            self._entries[key] = (update_value(entry[0]), entry[1])
+            return True
+
+    def _remove(self, key: Hashable) -> None:
+        """Remove a key and its group index entry. The lock must be held."""
+        if self._entries.pop(key, None) is None or self._group_key is None:
+            return
+
+        group = self._group_key(key)
+        group_keys = self._keys_by_group.get(group)
+        if group_keys is not None:
+            group_keys.discard(key)
+            if not group_keys:
+                del self._keys_by_group[group]
+
+    def invalidate(self, key: Hashable) -> None:
+        """Remove a key from the cache if present."""
+        with self._lock:
+            self._remove(key)
+
+    def invalidate_group(self, group: Hashable) -> None:
+        """Remove every key in a group. Requires the cache to have been created with a group_key."""
+        with self._lock:
+            for key in self._keys_by_group.pop(group, ()):
+                self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        """Remove every entry from the cache."""
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_group.clear()
+
+    def stats(self) -> dict[str, float]:
+        """Get the number of hits, misses and entries, and the hit ratio."""
+        with self._lock:
+            lookups = self.hits + self.misses
+
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+            }
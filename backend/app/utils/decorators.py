@@ -2,10 +2,19 @@ from functools import wraps
 from typing import Callable, Type
 import re
 
-from flask import current_app, request
-
-from app.utils.auth import get_token_from_auth_header, get_user_id_from_auth_header, validate_jwt, AuthenticationError
-from app.utils.responses import validation_error, authentication_error, authorization_error
+from flask import current_app, g, request
+
+from app.metrics import REQUEST_REJECTIONS
+from app.tracing import span
+from app.user_admission import AdmissionDeniedError
+from app.utils.auth import authenticate_request, AuthenticationError, SigningKeysUnavailableError
+from app.utils.responses import (
+    validation_error,
+    authentication_error,
+    authorization_error,
+    rate_limit_error,
+    service_unavailable_error,
+)
 from app.config.constants import (
     ERROR_BOARD_GAME_NAME_CANNOT_BE_EMPTY,
     ERROR_BOARD_GAME_NAME_TOO_LONG,
@@ -96,7 +105,7 @@ def _validate_content(value: str) -> str:
 
     if not sanitized:
         raise ValueError(ERROR_CONTENT_CANNOT_BE_EMPTY)
-    
+
     if len(sanitized) > MAX_CONTENT_LENGTH:
         raise ValueError(f"{ERROR_CONTENT_TOO_LONG} (max {MAX_CONTENT_LENGTH} characters)")
 
@@ -106,15 +115,17 @@ def _validate_content(value: str) -> str:
 def validate_auth_token(f):
     """
     Decorator to check if the request has a valid auth token.
+    The authenticated user's ID is available to the route as flask.g.user_id.
     Raises AuthenticationError if the token is invalid or missing.
     """
     @wraps(f)
     def decorated(*args, **kwargs):
         try:
-            token = get_token_from_auth_header()
-            validate_jwt(token)
-            request.user_id = get_user_id_from_auth_header()
+            with span("validate_auth_token"):
+                authenticate_request()
             return f(*args, **kwargs)
+        except SigningKeysUnavailableError as e:
+            return service_unavailable_error(e.message, retry_after_seconds=e.retry_after_seconds)
         except AuthenticationError as e:
             return authentication_error(e.message)
         except Exception as e:
@@ -125,10 +136,10 @@ def validate_auth_token(f):
 
 def validate_json_body(**field_types: Type) -> Callable:
     """
-    Decorator to check that a request contains a valid JSON body 
+    Decorator to check that a request contains a valid JSON body
     with required fields of correct types.
     Raises ValidationError if validation fails.
-    
+
     Args:
         **field_types: Keyword arguments mapping field names to their expected types.
                       Example: validate_json_body(name=str, age=int, scores=list)
@@ -168,7 +179,7 @@ def validate_json_body(**field_types: Type) -> Callable:
                             data[field] = _validate_email(value)
                         else:
                             data[field] = _validate_content(value)
-            
+
                     except ValueError as e:
                         type_errors[field] = str(e)
 
@@ -190,13 +201,77 @@ def check_daily_token_limit(f):
     @wraps(f)
     def decorated(*args, **kwargs):
         try:
-            user_id = get_user_id_from_auth_header()
-            if current_app.orchestrator.user_has_exceeded_daily_token_limit(user_id):
-                return authorization_error("You have run out of free messages for today. Please come back again tomorrow.")
+            with span("check_daily_token_limit"):
+                user_id = authenticate_request()
+                has_exceeded_limit = current_app.orchestrator.user_has_exceeded_daily_token_limit(user_id)
+            if has_exceeded_limit:
+                REQUEST_REJECTIONS.labels(reason="daily_cost_limit").inc()
+                return authorization_error(
+                    "You have run out of free messages for today. Please come back again tomorrow."
+                )
             return f(*args, **kwargs)
+        except SigningKeysUnavailableError as e:
+            return service_unavailable_error(e.message, retry_after_seconds=e.retry_after_seconds)
         except AuthenticationError as e:
             return authentication_error(e.message)
         except Exception as e:
             return authentication_error(f"Authentication error: {str(e)}")
 
     return decorated
+
+
+def check_user_admission(operation: str) -> Callable:
+    """
+    Decorator to admit a request for an expensive orchestrator operation against the user's
+    request budget, and for streaming operations their limit on concurrent streams.
+    Returns a 429 with Retry-After if the user has to wait first.
+
+    Args:
+        operation: The orchestrator operation the route performs, e.g. "ask_question".
+    """
+    def decorator(f: Callable) -> Callable:
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            try:
+                user_id = authenticate_request()
+            except SigningKeysUnavailableError as e:
+                return service_unavailable_error(e.message, retry_after_seconds=e.retry_after_seconds)
+            except AuthenticationError as e:
+                return authentication_error(e.message)
+            except Exception as e:
+                return authentication_error(f"Authentication error: {str(e)}")
+
+            orchestrator = current_app.orchestrator
+            try:
+                with span("check_user_admission", operation=operation):
+                    lease_id = orchestrator.admit_request(user_id, operation)
+            except AdmissionDeniedError as e:
+                REQUEST_REJECTIONS.labels(reason=e.reason).inc()
+                return rate_limit_error(e.message, e.retry_after_seconds)
+
+            # The orchestrator sets model_called once it calls OpenAI. Kept hold of here since a
+            # stream is closed after its request has ended
+            request_globals = g._get_current_object()
+
+            def release():
+                # Requests that never reached the model don't use up the user's budget
+                refund = not request_globals.get("model_called", False)
+                orchestrator.release_request(user_id, operation, lease_id=lease_id, refund=refund)
+
+            try:
+                response = current_app.make_response(f(*args, **kwargs))
+            except BaseException:
+                release()
+                raise
+
+            if response.is_streamed:
+                # Hold the stream slot until the answer has finished or the client has gone
+                response.call_on_close(release)
+            else:
+                release()
+
+            return response
+
+        return decorated
+
+    return decorator
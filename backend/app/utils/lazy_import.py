@@ -0,0 +1,33 @@
+import importlib
+import threading
+from types import ModuleType
+
+
+class LazyModule:
+    """
+    Stands in for a module that is only imported when one of its attributes is first used.
+
+    Heavy client libraries are wrapped in this so importing the app, and serving routes that
+    never call them, doesn't pay for their import. Bind it to the module's usual name,
+    e.g. openai = LazyModule("openai"), so call sites and test patches are unchanged.
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module: ModuleType | None = None
+        self._lock = threading.Lock()
+
+    def _load(self) -> ModuleType:
+        if self._module is None:
+            # The import lock would serialise this anyway; holding our own keeps the fast path lock-free
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attribute: str):
+        return getattr(self._load(), attribute)
+
+    def __repr__(self) -> str:
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<LazyModule '{self._name}' ({state})>"
@@ -0,0 +1,167 @@
+import sqlite3
+import time
+from math import floor
+
+from limits.storage import Storage
+from limits.storage.base import SlidingWindowCounterSupport, TimestampedSlidingWindow
+
+from app.config.constants import RATE_LIMIT_STORAGE_PURGE_INTERVAL_SECONDS
+from app.utils.sqlite import SharedSQLiteDatabase, sqlite_path_from_uri
+
+_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS rate_limit_counters (
+        key TEXT PRIMARY KEY,
+        count INTEGER NOT NULL,
+        expires_at REAL NOT NULL
+    ) WITHOUT ROWID;
+"""
+
+# Counters are created or reset when their window has expired, and incremented otherwise,
+# in a single statement so concurrent processes can't lose each other's hits
+_INCREMENT = """
+    INSERT INTO rate_limit_counters (key, count, expires_at) VALUES (:key, :amount, :expires_at)
+    ON CONFLICT (key) DO UPDATE SET
+        count = CASE WHEN expires_at <= :now THEN :amount ELSE count + :amount END,
+        expires_at = CASE WHEN expires_at <= :now THEN :expires_at ELSE expires_at END
+    RETURNING count
+"""
+
+
+class SQLiteStorage(Storage, SlidingWindowCounterSupport, TimestampedSlidingWindow):
+    """
+    Rate limit storage in a SQLite database in WAL mode, shared by every worker process on a host.
+
+    Registered with flask-limiter as the sqlite:// scheme, using the SQLAlchemy convention for
+    paths: sqlite:///relative/path.db or sqlite:////absolute/path.db. Supports the fixed-window and
+    sliding-window-counter strategies.
+    """
+
+    STORAGE_SCHEME = ["sqlite"]
+
+    def __init__(self, uri: str, wrap_exceptions: bool = False, **options):
+        self._database = SharedSQLiteDatabase(sqlite_path_from_uri(uri), _SCHEMA)
+        self._next_purge_at = 0.0
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+
+    @property
+    def base_exceptions(self) -> type[Exception]:
+        return sqlite3.Error
+
+    def _connection(self) -> sqlite3.Connection:
+        return self._database.connection()
+
+    def _purge_expired_if_due(self, connection: sqlite3.Connection, now: float) -> None:
+        if now < self._next_purge_at:
+            return
+
+        self._next_purge_at = now + RATE_LIMIT_STORAGE_PURGE_INTERVAL_SECONDS
+        connection.execute("DELETE FROM rate_limit_counters WHERE expires_at <= ?", (now,))
+
+    def _incr(self, connection: sqlite3.Connection, key: str, expiry: float, amount: int, now: float) -> int:
+        row = connection.execute(
+            _INCREMENT,
+            {"key": key, "amount": amount, "expires_at": now + expiry, "now": now},
+        ).fetchone()
+        return row[0]
+
+    def _get(self, connection: sqlite3.Connection, key: str, now: float) -> int:
+        row = connection.execute(
+            "SELECT count FROM rate_limit_counters WHERE key = ? AND expires_at > ?",
+            (key, now),
+        ).fetchone()
+        return row[0] if row else 0
+
+    def incr(self, key: str, expiry: float, amount: int = 1) -> int:
+        """
+        Increment the counter for a rate limit key, starting a new window of expiry seconds if it has expired.
+        Returns the counter's new value.
+        """
+        connection = self._connection()
+        now = time.time()
+        self._purge_expired_if_due(connection, now)
+        return self._incr(connection, key, expiry, amount, now)
+
+    def get(self, key: str) -> int:
+        """Get the counter for a rate limit key, or 0 if it has expired."""
+        return self._get(self._connection(), key, time.time())
+
+    def get_expiry(self, key: str) -> float:
+        """Get the time at which a rate limit key's window ends, or now if it has expired."""
+        now = time.time()
+        row = self._connection().execute(
+            "SELECT expires_at FROM rate_limit_counters WHERE key = ? AND expires_at > ?",
+            (key, now),
+        ).fetchone()
+        return row[0] if row else now
+
+    def clear(self, key: str) -> None:
+        """Reset the counter for a rate limit key."""
+        self._connection().execute("DELETE FROM rate_limit_counters WHERE key = ?", (key,))
+
+    def reset(self) -> int:
+        """Reset every counter. Returns the number of counters removed."""
+        return self._connection().execute("DELETE FROM rate_limit_counters").rowcount
+
+    def check(self) -> bool:
+        """Check the database can be queried."""
+        try:
+            self._connection().execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def acquire_sliding_window_entry(self, key: str, limit: int, expiry: int, amount: int = 1) -> bool:
+        """
+        Record a hit in the sliding window for a rate limit key, unless it would exceed limit.
+
+        The window is read and incremented in one write transaction, so unlike the in-memory storage a
+        hit never has to be rolled back after losing a race with another process.
+        """
+        if amount > limit:
+            return False
+
+        now = time.time()
+        previous_key, current_key = self.sliding_window_keys(key, expiry, now)
+
+        with self._database.transaction() as connection:
+            previous_count, previous_ttl, current_count, _ = self._get_sliding_window_info(
+                connection, previous_key, current_key, expiry, now
+            )
+            weighted_count = previous_count * previous_ttl / expiry + current_count
+            acquired = floor(weighted_count) + amount <= limit
+            if acquired:
+                # The current window's counter becomes the previous window's once it ends, so it lives for two windows
+                self._incr(connection, current_key, 2 * expiry, amount, now)
+
+        return acquired
+
+    def _get_sliding_window_info(
+        self,
+        connection: sqlite3.Connection,
+        previous_key: str,
+        current_key: str,
+        expiry: int,
+        now: float,
+    ) -> tuple[int, float, int, float]:
+        previous_count = self._get(connection, previous_key, now)
+        current_count = self._get(connection, current_key, now)
+
+        if previous_count == 0:
+            previous_ttl = 0.0
+        else:
+            previous_ttl = (1 - (((now - expiry) / expiry) % 1)) * expiry
+        current_ttl = (1 - ((now / expiry) % 1)) * expiry + expiry
+
+        return previous_count, previous_ttl, current_count, current_ttl
+
+    def get_sliding_window(self, key: str, expiry: int) -> tuple[int, float, int, float]:
+        """Get (previous count, previous TTL, current count, current TTL) for a rate limit key's sliding window."""
+        now = time.time()
+        previous_key, current_key = self.sliding_window_keys(key, expiry, now)
+        return self._get_sliding_window_info(self._connection(), previous_key, current_key, expiry, now)
+
+    def clear_sliding_window(self, key: str, expiry: int) -> None:
+        """Reset the sliding window for a rate limit key."""
+        previous_key, current_key = self.sliding_window_keys(key, expiry, time.time())
+        self.clear(previous_key)
+        self.clear(current_key)
@@ -52,3 +52,23 @@ def not_found_error(message: str = "Resource not found") -> Response:
 def internal_error(message: str = "Internal server error") -> Response:
     """Create an internal server error response."""
     return error_response(message, 500)
+
+
+def service_unavailable_error(
+    message: str = "Service unavailable",
+    details: Optional[Dict[str, Any]] = None,
+    retry_after_seconds: int | None = None
+) -> Response:
+    """Create a service unavailable error response, telling the client when to retry if known."""
+    response, status_code = error_response(message, 503, details)
+    if retry_after_seconds is not None:
+        response.headers['Retry-After'] = str(retry_after_seconds)
+    return response, status_code
+
+
+def rate_limit_error(message: str = "Rate limit exceeded", retry_after_seconds: int | None = None) -> Response:
+    """Create a rate limit error response, telling the client when to retry if known."""
+    response, status_code = error_response(message, 429)
+    if retry_after_seconds is not None:
+        response.headers['Retry-After'] = str(retry_after_seconds)
+    return response, status_code
@@ -0,0 +1,71 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+
+from app.config.constants import SQLITE_BUSY_TIMEOUT_SECONDS
+
+
+def sqlite_path_from_uri(uri: str) -> str:
+    """
+    Get the database path from a sqlite:// URI, using the SQLAlchemy convention:
+    sqlite:///relative/path.db or sqlite:////absolute/path.db.
+    Raises ValueError if the URI has no path.
+    """
+    path = uri[len("sqlite:///"):] if uri.startswith("sqlite:///") else ""
+    if not path:
+        raise ValueError(f"SQLite URI needs a database path, e.g. sqlite:////tmp/bgchat.db, got '{uri}'")
+
+    return path
+
+
+class SharedSQLiteDatabase:
+    """
+    A SQLite database in WAL mode that every worker process on a host can read and write concurrently.
+
+    Each thread of each process gets its own connection, since SQLite connections can't be shared
+    between threads or carried across a fork. Connections are in autocommit mode, so each statement
+    is its own transaction unless it runs inside transaction().
+    """
+
+    def __init__(self, path: str, schema: str):
+        self._path = path
+        self._schema = schema
+        self._local = threading.local()
+
+    def connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is not None and self._local.pid == os.getpid():
+            return connection
+
+        connection = sqlite3.connect(
+            self._path,
+            timeout=SQLITE_BUSY_TIMEOUT_SECONDS,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        connection.execute("PRAGMA journal_mode=WAL")
+        # The data doesn't need to survive a power cut, so skip the fsync on every commit
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.executescript(self._schema)
+
+        self._local.connection = connection
+        self._local.pid = os.getpid()
+        return connection
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """
+        Run statements in a write transaction that holds the database's write lock from the start,
+        so a read-modify-write can't interleave with another process's.
+        """
+        connection = self.connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+            connection.execute("COMMIT")
+
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
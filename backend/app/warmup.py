@@ -0,0 +1,93 @@
+import logging
+import os
+import threading
+import time
+from typing import Callable
+
+from app.config.constants import WARMUP_RETRY_INTERVAL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class Warmup:
+    """
+    Primes a worker process's clients and caches before it serves traffic, and tracks whether it is ready.
+
+    Each step is run until it succeeds once in the current process. Steps that failed, e.g. because
+    MongoDB was unreachable at boot, are retried by later calls to run(). After a fork, every step is
+    run again in the child, since connections aren't inherited even when caches are.
+    """
+
+    def __init__(self, steps: dict[str, Callable[[], None]]):
+        self._steps = steps
+        self._succeeded: set[str] = set()
+        self._failed: set[str] = set()
+        self._pid = None
+        self._last_run_at = None
+        self._lock = threading.Lock()
+
+    def run(self, blocking: bool = True) -> bool:
+        """
+        Run every step that hasn't succeeded in this process yet. Returns whether the process is ready.
+        If blocking is False and another thread is already running the steps, returns straight away.
+        """
+        if not self._lock.acquire(blocking=blocking):
+            return self.is_ready()
+
+        try:
+            if self._pid != os.getpid():
+                self._succeeded = set()
+                self._failed = set()
+                self._pid = os.getpid()
+
+            for name, step in self._steps.items():
+                if name in self._succeeded:
+                    continue
+
+                started_at = time.perf_counter()
+                try:
+                    step()
+                    self._succeeded.add(name)
+                    self._failed.discard(name)
+                    logger.info("Warmed up %s in %.0f ms", name, (time.perf_counter() - started_at) * 1000)
+
+                except Exception as e:
+                    self._failed.add(name)
+                    logger.warning("Failed to warm up %s: %s", name, str(e))
+
+            self._last_run_at = time.monotonic()
+            return self.is_ready()
+
+        finally:
+            self._lock.release()
+
+    def retry_if_due(self) -> bool:
+        """
+        Retry failed or pending steps, at most once per WARMUP_RETRY_INTERVAL_SECONDS so frequent
+        readiness probes don't pile onto a struggling dependency. Returns whether the process is ready.
+        """
+        if self.is_ready():
+            return True
+
+        if (
+            self._pid == os.getpid() and
+            self._last_run_at is not None and
+            time.monotonic() - self._last_run_at < WARMUP_RETRY_INTERVAL_SECONDS
+        ):
+            return False
+
+        return self.run(blocking=False)
+
+    def is_ready(self) -> bool:
+        """Whether every step has succeeded in this process."""
+        return self._pid == os.getpid() and len(self._succeeded) == len(self._steps)
+
+    def status(self) -> dict[str, str]:
+        """Get each step's status in this process: "ok", "failed" or "pending"."""
+        if self._pid != os.getpid():
+            return {name: "pending" for name in self._steps}
+
+        return {
+            name: "ok" if name in self._succeeded else "failed" if name in self._failed else "pending"
+            for name in self._steps
+        }
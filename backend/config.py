@@ -1,4 +1,5 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 
 
@@ -25,14 +26,77 @@ class Config:
         self.MONGODB_USERNAME = os.environ.get('MONGODB_USERNAME')
         self.MONGODB_PASSWORD = os.environ.get('MONGODB_PASSWORD')
         self.MONGODB_DB_NAME = os.environ.get('MONGODB_DB_NAME')
+        self.MONGODB_MAX_POOL_SIZE = int(os.environ.get('MONGODB_MAX_POOL_SIZE', 100))
+        self.MONGODB_MIN_POOL_SIZE = int(os.environ.get('MONGODB_MIN_POOL_SIZE', 0))
+        self.MONGODB_CONNECT_TIMEOUT_MS = int(os.environ.get('MONGODB_CONNECT_TIMEOUT_MS', 10000))
+        self.MONGODB_SOCKET_TIMEOUT_MS = int(os.environ.get('MONGODB_SOCKET_TIMEOUT_MS', 30000))
+        self.MONGODB_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get('MONGODB_SERVER_SELECTION_TIMEOUT_MS', 10000))
+        mongodb_compressors = os.environ.get('MONGODB_COMPRESSORS', '')
+        self.MONGODB_COMPRESSORS = [
+            compressor.strip() for compressor in mongodb_compressors.split(',') if compressor.strip()
+        ]
+        self.MONGODB_CREATE_INDEXES_ON_STARTUP = (
+            os.environ.get('MONGODB_CREATE_INDEXES_ON_STARTUP', 'false').lower() == 'true'
+        )
+        # 'auto' uses change streams, falling back to 'poll' where they're unavailable
+        self.CACHE_INVALIDATION_MODE = os.environ.get('CACHE_INVALIDATION_MODE', 'auto').lower()
 
         # OpenAI
         self.OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY')
+        # Connections each worker process may hold open to OpenAI. Should be at least GUNICORN_THREADS
+        self.OPENAI_MAX_CONNECTIONS = int(os.environ.get('OPENAI_MAX_CONNECTIONS', 100))
+
+        # Chat history sent to the model with each question
+        self.CHAT_HISTORY_MAX_TURNS = int(os.environ.get('CHAT_HISTORY_MAX_TURNS', 10))
+        self.CHAT_HISTORY_MAX_TOKENS = int(os.environ.get('CHAT_HISTORY_MAX_TOKENS', 20000))
 
         # Auth0
         self.AUTH0_DOMAIN = os.environ.get('AUTH0_DOMAIN')
         self.AUTH0_AUDIENCE = os.environ.get('AUTH0_AUDIENCE')
         self.ALGORITHM = os.environ.get('ALGORITHM', 'RS256')
+        # Optional path to a saved JWKS to load signing keys from at boot instead of calling Auth0
+        self.JWKS_FILE = os.environ.get('JWKS_FILE') or None
+        self.JWKS_BACKGROUND_REFRESH = (
+            os.environ.get('JWKS_BACKGROUND_REFRESH', 'true').lower() == 'true'
+        )
+
+        # Prime clients and caches in create_app, so a worker's first requests aren't slow
+        self.WARMUP_ON_STARTUP = os.environ.get('WARMUP_ON_STARTUP', 'true').lower() == 'true'
+
+        # Bearer token Prometheus must send to scrape /metrics. Unset disables the endpoint
+        self.METRICS_TOKEN = os.environ.get('METRICS_TOKEN') or None
+
+        # Tracing. Traces are appended to TRACING_EXPORT_PATH as OTLP/JSON lines; unset disables tracing.
+        # A sampled fraction of requests is kept, plus every failed request and every one slower than the threshold
+        self.TRACING_EXPORT_PATH = os.environ.get('TRACING_EXPORT_PATH') or None
+        self.TRACING_SAMPLE_RATE = float(os.environ.get('TRACING_SAMPLE_RATE', 0.01))
+        self.TRACING_SLOW_REQUEST_SECONDS = float(os.environ.get('TRACING_SLOW_REQUEST_SECONDS', 30))
+
+        # CPU profiling of individual requests into PROFILING_OUTPUT_DIR; unset disables profiling.
+        # Requests sending PROFILING_TOKEN in the X-Profile-Token header are profiled, plus a sampled fraction
+        self.PROFILING_OUTPUT_DIR = os.environ.get('PROFILING_OUTPUT_DIR') or None
+        self.PROFILING_TOKEN = os.environ.get('PROFILING_TOKEN') or None
+        self.PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', 0))
+
+        # Rate limiting. The default SQLite file is shared by every worker process on the host;
+        # a mongodb:// URI shares limits between hosts
+        self.RATE_LIMIT_STORAGE_URI = (
+            os.environ.get('RATE_LIMIT_STORAGE_URI')
+            or f"sqlite:///{os.path.join(tempfile.gettempdir(), 'bgchat-rate-limits.db')}"
+        )
+        self.RATE_LIMIT_STRATEGY = os.environ.get('RATE_LIMIT_STRATEGY', 'fixed-window').lower()
+
+        # Per-user admission for requests that call the model: a token bucket of dollars, and a cap on
+        # concurrent answer streams. Shared by the workers on a host through the same SQLite file by default
+        self.USER_ADMISSION_STORAGE_URI = (
+            os.environ.get('USER_ADMISSION_STORAGE_URI')
+            or f"sqlite:///{os.path.join(tempfile.gettempdir(), 'bgchat-rate-limits.db')}"
+        )
+        self.USER_REQUEST_BUDGET_USD = float(os.environ.get('USER_REQUEST_BUDGET_USD', 0.005))
+        self.USER_REQUEST_BUDGET_REFILL_USD_PER_HOUR = float(
+            os.environ.get('USER_REQUEST_BUDGET_REFILL_USD_PER_HOUR', 0.02)
+        )
+        self.USER_MAX_CONCURRENT_STREAMS = int(os.environ.get('USER_MAX_CONCURRENT_STREAMS', 2))
 
     def _validate_env_vars(self):
         """Validate environment variables."""
@@ -53,16 +117,67 @@ class Config:
             missing_vars.append('MONGODB_PASSWORD')
         if not self.MONGODB_DB_NAME:
             missing_vars.append('MONGODB_DB_NAME')
+        if self.MONGODB_MIN_POOL_SIZE > self.MONGODB_MAX_POOL_SIZE:
+            raise ValueError("MONGODB_MIN_POOL_SIZE must not be greater than MONGODB_MAX_POOL_SIZE")
+        unsupported_compressors = set(self.MONGODB_COMPRESSORS) - {'zstd', 'snappy', 'zlib'}
+        if unsupported_compressors:
+            raise ValueError(f"Unsupported MONGODB_COMPRESSORS: {', '.join(sorted(unsupported_compressors))}")
+        if self.CACHE_INVALIDATION_MODE not in ('auto', 'poll', 'off'):
+            raise ValueError("CACHE_INVALIDATION_MODE must be one of 'auto', 'poll' or 'off'")
 
         # OpenAI configuration
         if not self.OPENAI_API_KEY:
             missing_vars.append('OPENAI_API_KEY')
+        if self.OPENAI_MAX_CONNECTIONS < 1:
+            raise ValueError("OPENAI_MAX_CONNECTIONS must be at least 1")
+        if self.CHAT_HISTORY_MAX_TURNS < 0:
+            raise ValueError("CHAT_HISTORY_MAX_TURNS must not be negative")
+        if self.CHAT_HISTORY_MAX_TOKENS < 0:
+            raise ValueError("CHAT_HISTORY_MAX_TOKENS must not be negative")
 
         # Auth0 configuration
         if not self.AUTH0_DOMAIN:
             missing_vars.append('AUTH0_DOMAIN')
         if not self.AUTH0_AUDIENCE:
             missing_vars.append('AUTH0_AUDIENCE')
+        if self.JWKS_FILE and not os.path.isfile(self.JWKS_FILE):
+            raise ValueError(f"JWKS_FILE does not exist: {self.JWKS_FILE}")
+
+        # Tracing configuration
+        if not 0 <= self.TRACING_SAMPLE_RATE <= 1:
+            raise ValueError("TRACING_SAMPLE_RATE must be between 0 and 1")
+        if self.TRACING_SLOW_REQUEST_SECONDS <= 0:
+            raise ValueError("TRACING_SLOW_REQUEST_SECONDS must be positive")
+
+        # Profiling configuration
+        if not 0 <= self.PROFILING_SAMPLE_RATE <= 1:
+            raise ValueError("PROFILING_SAMPLE_RATE must be between 0 and 1")
+        if self.PROFILING_TOKEN and len(self.PROFILING_TOKEN) < 32:
+            raise ValueError("PROFILING_TOKEN must be at least 32 characters long")
+
+        # Rate limiting configuration
+        if self.RATE_LIMIT_STRATEGY not in ('fixed-window', 'sliding-window-counter', 'moving-window'):
+            raise ValueError(
+                "RATE_LIMIT_STRATEGY must be one of 'fixed-window', 'sliding-window-counter' or 'moving-window'"
+            )
+        # The SQLite store only implements the fixed and sliding window counter strategies
+        if self.RATE_LIMIT_STRATEGY == 'moving-window' and not self.RATE_LIMIT_STORAGE_URI.startswith(
+            ('memory://', 'mongodb://', 'mongodb+srv://', 'redis://', 'rediss://')
+        ):
+            raise ValueError(
+                "RATE_LIMIT_STRATEGY 'moving-window' needs a memory://, mongodb:// or redis:// RATE_LIMIT_STORAGE_URI"
+            )
+        if not (
+            self.USER_ADMISSION_STORAGE_URI == 'memory://' or
+            self.USER_ADMISSION_STORAGE_URI.startswith('sqlite:///')
+        ):
+            raise ValueError("USER_ADMISSION_STORAGE_URI must be a sqlite:/// URI or memory://")
+        if self.USER_REQUEST_BUDGET_USD <= 0:
+            raise ValueError("USER_REQUEST_BUDGET_USD must be positive")
+        if self.USER_REQUEST_BUDGET_REFILL_USD_PER_HOUR <= 0:
+            raise ValueError("USER_REQUEST_BUDGET_REFILL_USD_PER_HOUR must be positive")
+        if self.USER_MAX_CONCURRENT_STREAMS < 1:
+            raise ValueError("USER_MAX_CONCURRENT_STREAMS must be at least 1")
 
         if missing_vars:
             raise ValueError(f"Missing required environment variables: {', '.join(missing_vars)}")
@@ -99,6 +214,12 @@ class TestingConfig(Config):
         self.FLASK_ENV = 'testing'
         self.FLASK_DEBUG = False
         self.TESTING = True
+        # Fetch keys inline rather than from background threads, so tests control every request
+        self.JWKS_BACKGROUND_REFRESH = False
+        # Keep each test run's rate limit counters to itself
+        self.RATE_LIMIT_STORAGE_URI = 'memory://'
+        self.USER_ADMISSION_STORAGE_URI = 'memory://'
+        self.WARMUP_ON_STARTUP = False
 
 
 config = {
@@ -0,0 +1,62 @@
+"""
+Gunicorn configuration for production.
+
+Workers use the gthread worker class: each worker process serves up to GUNICORN_THREADS requests
+at once, so an answer stream that is waiting on OpenAI holds a thread rather than a whole process.
+Everything shared between a worker's requests is thread-safe: the MongoDB and OpenAI clients and
+their connection pools, the in-process caches, and the SQLite rate limit and admission stores,
+which use a connection per thread.
+
+gevent workers are not supported. tiktoken, SQLite and PDF parsing block in C code without
+yielding to the event loop, and the cache invalidation and JWKS refresh threads would need to run
+as greenlets.
+
+By default the app is loaded and warmed up in each worker after it forks. With
+GUNICORN_PRELOAD_APP=true it is loaded and warmed up once in the master instead, and workers
+inherit its caches. Clients and background threads are per process either way, so each worker
+opens its own connections in post_worker_init, before it accepts any requests.
+
+Metrics are written by each worker to files in PROMETHEUS_MULTIPROC_DIR, which is set here, before
+any worker imports the app, and emptied when gunicorn starts, so /metrics reports every worker.
+"""
+import os
+import shutil
+import tempfile
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:5000")
+workers = int(os.environ.get("GUNICORN_WORKERS", 4))
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", 32))
+preload_app = os.environ.get("GUNICORN_PRELOAD_APP", "false").lower() == "true"
+
+# With gthread, timeout only restarts workers that stop responding to the master, not slow requests
+timeout = 120
+graceful_timeout = 30
+keepalive = 5
+
+# Set before the app is imported, since prometheus_client reads it at import
+os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR",
+    os.path.join(tempfile.gettempdir(), "bgchat-metrics"),
+)
+
+
+def on_starting(server):
+    """Start with no metrics, rather than counting on from samples left by a previous run's workers."""
+    metrics_dir = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir)
+
+
+def post_worker_init(worker):
+    """Warm up the worker's own connections before it accepts requests. A no-op if create_app already did."""
+    warmup = getattr(worker.wsgi, "warmup", None)
+    if warmup is not None and worker.wsgi.config.get("WARMUP_ON_STARTUP"):
+        warmup.run()
+
+
+def child_exit(server, worker):
+    """Stop counting a dead worker's open streams. Its counters and histograms are kept."""
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
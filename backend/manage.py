@@ -0,0 +1,69 @@
+"""
+Maintenance commands for the BGChat database.
+
+Usage:
+    python manage.py migrate-messages
+    python manage.py migrate-token-usage
+    python manage.py ensure-indexes
+    python manage.py verify-indexes
+    python manage.py rebuild-catalog
+"""
+import argparse
+
+from setup import get_environment_config, initialise_mongodb_client, print_bold
+
+
+def migrate_messages(mongodb_client):
+    print_bold("Migrating embedded message histories to the messages collection...")
+    migrated_conversations = mongodb_client.migrate_embedded_messages()
+    print(f"Migrated {migrated_conversations} conversations\n")
+
+
+def migrate_token_usage(mongodb_client):
+    print_bold("Migrating embedded token usage to the token_usage collection...")
+    migrated_days = mongodb_client.migrate_embedded_token_usage()
+    print(f"Migrated {migrated_days} days of token usage\n")
+
+
+def ensure_indexes(mongodb_client):
+    print_bold("Creating missing indexes...")
+    created_indexes = mongodb_client.ensure_indexes()
+    print(f"Created {len(created_indexes)} indexes: {', '.join(created_indexes) or 'none'}\n")
+
+
+def verify_indexes(mongodb_client):
+    print_bold("Verifying indexes...")
+    missing_indexes = mongodb_client.verify_indexes()
+    if missing_indexes:
+        print(f"Missing indexes: {', '.join(missing_indexes)}\n")
+        raise SystemExit(1)
+    print("All indexes exist\n")
+
+
+def rebuild_catalog(mongodb_client):
+    print_bold("Rebuilding the board game catalog from stored rulebook pages...")
+    board_game_count = mongodb_client.rebuild_board_game_catalog()
+    print(f"Catalog contains {board_game_count} board games\n")
+
+
+COMMANDS = {
+    "migrate-messages": migrate_messages,
+    "migrate-token-usage": migrate_token_usage,
+    "ensure-indexes": ensure_indexes,
+    "verify-indexes": verify_indexes,
+    "rebuild-catalog": rebuild_catalog,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="BGChat database maintenance commands")
+    parser.add_argument("command", choices=COMMANDS.keys())
+    args = parser.parse_args()
+
+    env_config = get_environment_config()
+    mongodb_client = initialise_mongodb_client(env_config)
+
+    try:
+        COMMANDS[args.command](mongodb_client)
+    finally:
+        mongodb_client.close()
@@ -0,0 +1,198 @@
+"""
+Measure how many answer streams one gunicorn worker process can serve at once.
+
+By default this starts gunicorn with a single worker for each worker mode in turn and opens
+--clients concurrent streams against a stub endpoint. The stub streams --stream-seconds of
+server-sent events, spending its time waiting the way a real answer waits on OpenAI. The stub keeps
+MongoDB and OpenAI out of the measurement, so only the worker model is compared.
+
+Peak concurrency is the largest number of streams that were sending data at the same moment.
+
+Usage (from the backend directory):
+    python scripts/load_test_streams.py
+    python scripts/load_test_streams.py --clients 64 --threads 32 --stream-seconds 5
+    python scripts/load_test_streams.py --url https://bgchat.example.com/ask-question --token <JWT> --clients 8
+
+With --url, a running deployment is tested instead. Every stream is a real question that is
+charged to the token's user, so keep --clients small.
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+import requests
+
+STUB_STREAM_SECONDS_ENV = "LOAD_TEST_STREAM_SECONDS"
+STUB_CHUNKS = 20
+
+
+def stub_app(environ, start_response):
+    """WSGI app that streams an answer in STUB_CHUNKS chunks over LOAD_TEST_STREAM_SECONDS seconds."""
+    interval_seconds = float(os.environ.get(STUB_STREAM_SECONDS_ENV, 5)) / STUB_CHUNKS
+
+    start_response("200 OK", [
+        ("Content-Type", "text/event-stream"),
+        ("Cache-Control", "no-cache, no-transform"),
+    ])
+
+    def generate():
+        for chunk in range(STUB_CHUNKS):
+            time.sleep(interval_seconds)
+            yield f"data: {json.dumps({'chunk': f'chunk {chunk} '})}\n\n".encode()
+        yield f"data: {json.dumps({'done': True})}\n\n".encode()
+
+    return generate()
+
+
+def _get_free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for_port(port: int, timeout_seconds: float = 30) -> None:
+    deadline = time.monotonic() + timeout_seconds
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"gunicorn did not start listening on port {port}")
+
+
+def _open_stream(url: str, headers: dict, body: dict, timeout_seconds: float, results: list, lock: threading.Lock):
+    started_at = time.monotonic()
+    first_byte_at = None
+
+    try:
+        with requests.post(url, json=body, headers=headers, stream=True, timeout=timeout_seconds) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if line and first_byte_at is None:
+                    first_byte_at = time.monotonic()
+        error = None
+
+    except requests.RequestException as e:
+        error = str(e)
+
+    with lock:
+        results.append({
+            "started_at": started_at,
+            "first_byte_at": first_byte_at,
+            "finished_at": time.monotonic(),
+            "error": error,
+        })
+
+
+def run_clients(url: str, clients: int, headers: dict, body: dict, timeout_seconds: float) -> dict:
+    """Open concurrent streams and summarise how they were served."""
+    results = []
+    lock = threading.Lock()
+    threads = [
+        threading.Thread(target=_open_stream, args=(url, headers, body, timeout_seconds, results, lock))
+        for _ in range(clients)
+    ]
+
+    started_at = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall_seconds = time.monotonic() - started_at
+
+    served = [result for result in results if result["error"] is None and result["first_byte_at"] is not None]
+
+    # Sweep over stream start and end events to find the most streams sending at once
+    events = sorted(
+        [(result["first_byte_at"], 1) for result in served] +
+        [(result["finished_at"], -1) for result in served]
+    )
+    concurrent_streams = peak_concurrent_streams = 0
+    for _, change in events:
+        concurrent_streams += change
+        peak_concurrent_streams = max(peak_concurrent_streams, concurrent_streams)
+
+    time_to_first_byte = [result["first_byte_at"] - result["started_at"] for result in served]
+
+    return {
+        "served": len(served),
+        "errors": len(results) - len(served),
+        "wall_seconds": wall_seconds,
+        "peak_concurrent_streams": peak_concurrent_streams,
+        "median_ttfb_seconds": statistics.median(time_to_first_byte) if time_to_first_byte else None,
+        "max_ttfb_seconds": max(time_to_first_byte) if time_to_first_byte else None,
+    }
+
+
+def run_against_gunicorn(worker_class: str, threads: int, args) -> dict:
+    port = _get_free_port()
+    backend_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+    env = {**os.environ, STUB_STREAM_SECONDS_ENV: str(args.stream_seconds)}
+
+    server = subprocess.Popen(
+        [
+            sys.executable, "-m", "gunicorn",
+            "--bind", f"127.0.0.1:{port}",
+            "--workers", "1",
+            "--worker-class", worker_class,
+            "--threads", str(threads),
+            "--timeout", "120",
+            "--log-level", "warning",
+            "scripts.load_test_streams:stub_app",
+        ],
+        cwd=backend_dir,
+        env=env,
+    )
+
+    try:
+        _wait_for_port(port)
+        return run_clients(f"http://127.0.0.1:{port}/ask-question", args.clients, {}, {}, args.timeout)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def _print_row(label: str, summary: dict) -> None:
+    median_ttfb = summary["median_ttfb_seconds"]
+    max_ttfb = summary["max_ttfb_seconds"]
+    print(
+        f"{label:<22} {summary['served']:>6} {summary['errors']:>6} {summary['peak_concurrent_streams']:>8} "
+        f"{summary['wall_seconds']:>9.1f} "
+        f"{'-' if median_ttfb is None else f'{median_ttfb:.2f}':>10} "
+        f"{'-' if max_ttfb is None else f'{max_ttfb:.2f}':>9}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=32, help="concurrent streams to open (default: 32)")
+    parser.add_argument("--threads", type=int, default=32, help="threads for the gthread worker (default: 32)")
+    parser.add_argument("--stream-seconds", type=float, default=5, help="length of each stub stream (default: 5)")
+    parser.add_argument("--timeout", type=float, default=300, help="per-stream timeout in seconds (default: 300)")
+    parser.add_argument("--url", help="test a running deployment's /ask-question endpoint instead")
+    parser.add_argument("--token", help="bearer token for --url")
+    parser.add_argument("--board-game", default="Wingspan", help="board game to ask about with --url")
+    parser.add_argument("--question", default="How many eggs can a bird hold?", help="question to ask with --url")
+    args = parser.parse_args()
+
+    print(f"{'server':<22} {'served':>6} {'errors':>6} {'peak':>8} {'wall (s)':>9} {'ttfb p50':>10} {'ttfb max':>9}")
+
+    if args.url:
+        headers = {"Authorization": f"Bearer {args.token}"} if args.token else {}
+        body = {"board_game": args.board_game, "question": args.question}
+        _print_row(args.url[:22], run_clients(args.url, args.clients, headers, body, args.timeout))
+        return
+
+    _print_row("sync", run_against_gunicorn("sync", 1, args))
+    _print_row(f"gthread x{args.threads}", run_against_gunicorn("gthread", args.threads, args))
+
+
+if __name__ == "__main__":
+    main()
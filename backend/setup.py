@@ -95,6 +95,8 @@ def process_and_store_rulebook_text(
 ):
     print_bold("Processing and storing text from rulebooks...")
     for board_game in BOARD_GAMES:
+        catalog_rulebooks = []
+
         for rulebook in board_game["rulebooks"]:
             print_bold(f'\n{board_game["name"]} - {rulebook["name"]}')
 
@@ -142,9 +144,15 @@ def process_and_store_rulebook_text(
                             continue
 
                 mongodb_client.store_rulebook_pages(pages_to_store)
+                stored_page_count = len(pages_to_store)
 
             else:
                 print("This rulebook already exists in the database")
+                stored_page_count = page_count
+
+            catalog_rulebooks.append({"name": rulebook["name"], "page_count": stored_page_count})
+
+        mongodb_client.upsert_board_game(board_game["name"], catalog_rulebooks)
     print()
 
 
@@ -155,4 +163,7 @@ if __name__ == "__main__":
     mongodb_client = initialise_mongodb_client(env_config)
     openai_client = initialise_openai_client(env_config)
 
-    process_and_store_rulebook_text(mongodb_client, openai_client)
+    try:
+        process_and_store_rulebook_text(mongodb_client, openai_client)
+    finally:
+        mongodb_client.close()
@@ -92,12 +92,11 @@ def valid_jwt_token():
 @pytest.fixture(scope='function')
 def auth_headers(valid_jwt_token):
     """Generate authorization headers with valid JWT."""
-    with patch('app.utils.decorators.validate_jwt'):
-        with patch('app.utils.decorators.get_user_id_from_auth_header', return_value='test-user-123'):
-            yield {
-                'Authorization': f'Bearer {valid_jwt_token}',
-                'Content-Type': 'application/json',
-            }
+    with patch('app.utils.auth.validate_jwt', return_value={'sub': 'test-user-123'}):
+        yield {
+            'Authorization': f'Bearer {valid_jwt_token}',
+            'Content-Type': 'application/json',
+        }
 
 
 @pytest.fixture(autouse=True)
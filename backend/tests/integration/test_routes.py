@@ -3,7 +3,16 @@ Integration tests for API routes.
 """
 import json
 from unittest.mock import Mock, patch
-from flask import Response
+
+import pytest
+from flask import Response, g
+from prometheus_client import REGISTRY
+
+from app.config.constants import ERROR_REQUEST_BUDGET_EXCEEDED, ERROR_TOO_MANY_CONCURRENT_STREAMS
+from app.tracing import configure_tracing
+from app.user_admission import AdmissionDeniedError
+from app.utils.auth import SigningKeysUnavailableError
+from app.warmup import Warmup
 
 
 class TestKnownBoardGames:
@@ -25,6 +34,14 @@ class TestKnownBoardGames:
         response = client.get('/known-board-games')
         assert response.status_code == 401
 
+    def test_get_known_board_games_signing_keys_not_loaded(self, client, app, valid_jwt_token):
+        """Test that requests arriving before signing keys have loaded get a 503 with Retry-After."""
+        with patch('app.utils.auth.validate_jwt', side_effect=SigningKeysUnavailableError("Keys not loaded", 5)):
+            response = client.get('/known-board-games', headers={'Authorization': f'Bearer {valid_jwt_token}'})
+
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "5"
+
     def test_get_known_board_games_internal_error(self, client, app, auth_headers):
         """Test internal error handling."""
         app.orchestrator.get_known_board_games = Mock(side_effect=Exception("Database error"))
@@ -43,7 +60,7 @@ class TestMessageHistory:
             {"role": "user", "content": "Question"},
             {"role": "assistant", "content": "Answer"},
         ]
-        app.orchestrator.get_known_board_games = Mock(return_value=["Wingspan"])
+        app.orchestrator.is_known_board_game = Mock(side_effect=lambda board_game: board_game == "Wingspan")
         app.orchestrator.get_message_history = Mock(return_value=mock_messages)
 
         response = client.post(
@@ -56,9 +73,67 @@ class TestMessageHistory:
         data = json.loads(response.data)
         assert data == mock_messages
 
+    def test_get_message_history_paginated(self, client, app, auth_headers):
+        """Test that pagination and delta-sync cursors are passed through to the orchestrator."""
+        app.orchestrator.is_known_board_game = Mock(side_effect=lambda board_game: board_game == "Wingspan")
+        app.orchestrator.get_message_history = Mock(return_value=[])
+
+        response = client.post(
+            '/message-history',
+            json={"board_game": "Wingspan", "limit": 20, "before": 40, "since": 10},
+            headers=auth_headers
+        )
+
+        assert response.status_code == 200
+        app.orchestrator.get_message_history.assert_called_once_with(
+            'test-user-123',
+            'Wingspan',
+            limit=20,
+            before=40,
+            since=10,
+        )
+
+    def test_get_message_history_without_cursors(self, client, app, auth_headers):
+        """Test that omitting the cursors requests the full history."""
+        app.orchestrator.is_known_board_game = Mock(side_effect=lambda board_game: board_game == "Wingspan")
+        app.orchestrator.get_message_history = Mock(return_value=[])
+
+        response = client.post(
+            '/message-history',
+            json={"board_game": "Wingspan"},
+            headers=auth_headers
+        )
+
+        assert response.status_code == 200
+        app.orchestrator.get_message_history.assert_called_once_with(
+            'test-user-123',
+            'Wingspan',
+            limit=None,
+            before=None,
+            since=None,
+        )
+
+    def test_get_message_history_invalid_cursors(self, client, app, auth_headers):
+        """Test error for out of range or non-integer cursors."""
+        app.orchestrator.is_known_board_game = Mock(side_effect=lambda board_game: board_game == "Wingspan")
+        app.orchestrator.get_message_history = Mock(return_value=[])
+
+        invalid_bodies = [
+            {"board_game": "Wingspan", "limit": 0},
+            {"board_game": "Wingspan", "limit": 10_000},
+            {"board_game": "Wingspan", "before": -1},
+            {"board_game": "Wingspan", "since": "5"},
+            {"board_game": "Wingspan", "since": True},
+        ]
+        for body in invalid_bodies:
+            response = client.post('/message-history', json=body, headers=auth_headers)
+            assert response.status_code == 400
+
+        app.orchestrator.get_message_history.assert_not_called()
+
     def test_get_message_history_invalid_game(self, client, app, auth_headers):
         """Test error for unrecognised board game."""
-        app.orchestrator.get_known_board_games = Mock(return_value=["Wingspan"])
+        app.orchestrator.is_known_board_game = Mock(side_effect=lambda board_game: board_game == "Wingspan")
 
         response = client.post(
             '/message-history',
@@ -88,7 +163,7 @@ class TestMessageHistory:
 
     def test_get_message_history_internal_error(self, client, app, auth_headers):
         """Test internal error handling."""
-        app.orchestrator.get_known_board_games = Mock(return_value=["Wingspan"])
+        app.orchestrator.is_known_board_game = Mock(side_effect=lambda board_game: board_game == "Wingspan")
         app.orchestrator.get_message_history = Mock(side_effect=Exception("Database error"))
 
         response = client.post(
@@ -101,7 +176,7 @@ class TestMessageHistory:
 
     def test_clear_message_history_success(self, client, app, auth_headers):
         """Test successful clearing of message history."""
-        app.orchestrator.get_known_board_games = Mock(return_value=["Wingspan"])
+        app.orchestrator.is_known_board_game = Mock(side_effect=lambda board_game: board_game == "Wingspan")
         app.orchestrator.clear_message_history = Mock()
 
         response = client.post(
@@ -115,7 +190,7 @@ class TestMessageHistory:
 
     def test_clear_message_history_invalid_game(self, client, app, auth_headers):
         """Test error for unrecognised board game."""
-        app.orchestrator.get_known_board_games = Mock(return_value=["Wingspan"])
+        app.orchestrator.is_known_board_game = Mock(side_effect=lambda board_game: board_game == "Wingspan")
 
         response = client.post(
             '/clear-message-history',
@@ -145,7 +220,7 @@ class TestMessageHistory:
 
     def test_clear_message_history_internal_error(self, client, app, auth_headers):
         """Test internal error handling."""
-        app.orchestrator.get_known_board_games = Mock(return_value=["Wingspan"])
+        app.orchestrator.is_known_board_game = Mock(side_effect=lambda board_game: board_game == "Wingspan")
         app.orchestrator.clear_message_history = Mock(side_effect=Exception("Database error"))
 
         response = client.post(
@@ -158,7 +233,7 @@ class TestMessageHistory:
 
     def test_delete_messages_from_index_success(self, client, app, auth_headers):
         """Test successful deletion of messages from index."""
-        app.orchestrator.get_known_board_games = Mock(return_value=["Wingspan"])
+        app.orchestrator.is_known_board_game = Mock(side_effect=lambda board_game: board_game == "Wingspan")
         app.orchestrator.delete_messages_from_index = Mock()
 
         response = client.post(
@@ -172,7 +247,7 @@ class TestMessageHistory:
 
     def test_delete_messages_negative_index(self, client, app, auth_headers):
         """Test error for negative index."""
-        app.orchestrator.get_known_board_games = Mock(return_value=["Wingspan"])
+        app.orchestrator.is_known_board_game = Mock(side_effect=lambda board_game: board_game == "Wingspan")
 
         response = client.post(
             '/delete-messages-from-index',
@@ -184,7 +259,7 @@ class TestMessageHistory:
 
     def test_delete_messages_invalid_game(self, client, app, auth_headers):
         """Test error for unrecognised board game."""
-        app.orchestrator.get_known_board_games = Mock(return_value=["Wingspan"])
+        app.orchestrator.is_known_board_game = Mock(side_effect=lambda board_game: board_game == "Wingspan")
 
         response = client.post(
             '/delete-messages-from-index',
@@ -214,7 +289,7 @@ class TestMessageHistory:
 
     def test_delete_messages_internal_error(self, client, app, auth_headers):
         """Test internal error handling."""
-        app.orchestrator.get_known_board_games = Mock(return_value=["Wingspan"])
+        app.orchestrator.is_known_board_game = Mock(side_effect=lambda board_game: board_game == "Wingspan")
         app.orchestrator.delete_messages_from_index = Mock(side_effect=Exception("Database error"))
 
         response = client.post(
@@ -298,7 +373,7 @@ class TestAskQuestion:
             yield "a test "
             yield "response."
 
-        app.orchestrator.get_known_board_games = Mock(return_value=["Wingspan"])
+        app.orchestrator.is_known_board_game = Mock(side_effect=lambda board_game: board_game == "Wingspan")
         app.orchestrator.ask_question = Mock(return_value=mock_stream())
         app.orchestrator.user_has_exceeded_daily_token_limit = Mock(return_value=False)
 
@@ -317,7 +392,7 @@ class TestAskQuestion:
 
     def test_ask_question_invalid_game(self, client, app, auth_headers):
         """Test error for unrecognised board game."""
-        app.orchestrator.get_known_board_games = Mock(return_value=["Wingspan"])
+        app.orchestrator.is_known_board_game = Mock(side_effect=lambda board_game: board_game == "Wingspan")
         app.orchestrator.user_has_exceeded_daily_token_limit = Mock(return_value=False)
 
         response = client.post(
@@ -351,7 +426,7 @@ class TestAskQuestion:
 
     def test_ask_question_token_limit_exceeded(self, client, app, auth_headers):
         """Test rate limiting when token limit exceeded."""
-        app.orchestrator.get_known_board_games = Mock(return_value=["Wingspan"])
+        app.orchestrator.is_known_board_game = Mock(side_effect=lambda board_game: board_game == "Wingspan")
         app.orchestrator.user_has_exceeded_daily_token_limit = Mock(return_value=True)
 
         response = client.post(
@@ -367,7 +442,7 @@ class TestAskQuestion:
 
     def test_ask_question_internal_error(self, client, app, auth_headers):
         """Test internal error handling."""
-        app.orchestrator.get_known_board_games = Mock(return_value=["Wingspan"])
+        app.orchestrator.is_known_board_game = Mock(side_effect=lambda board_game: board_game == "Wingspan")
         app.orchestrator.user_has_exceeded_daily_token_limit = Mock(return_value=False)
         app.orchestrator.ask_question = Mock(side_effect=Exception("AI service error"))
 
@@ -383,6 +458,267 @@ class TestAskQuestion:
         assert response.status_code == 500
 
 
+class TestUserAdmission:
+    """Test per-user admission for endpoints that call the model."""
+
+    def test_ask_question_over_budget(self, client, app, auth_headers):
+        """Test that users who have to wait get a 429 with Retry-After."""
+        app.orchestrator.user_has_exceeded_daily_token_limit = Mock(return_value=False)
+        app.orchestrator.admit_request = Mock(
+            side_effect=AdmissionDeniedError(
+                ERROR_REQUEST_BUDGET_EXCEEDED, retry_after_seconds=42, reason="request_budget"
+            )
+        )
+        app.orchestrator.ask_question = Mock()
+
+        response = client.post(
+            '/ask-question',
+            json={"question": "How do I play?", "board_game": "Wingspan"},
+            headers=auth_headers
+        )
+
+        assert response.status_code == 429
+        assert response.headers["Retry-After"] == "42"
+        assert json.loads(response.data)["error"] == ERROR_REQUEST_BUDGET_EXCEEDED
+        app.orchestrator.admit_request.assert_called_once_with("test-user-123", "ask_question")
+        app.orchestrator.ask_question.assert_not_called()
+
+    def test_ask_question_releases_stream_slot_when_stream_closes(self, client, app, auth_headers):
+        """Test that a question's stream slot is held until its answer has been streamed."""
+        app.orchestrator.is_known_board_game = Mock(side_effect=lambda board_game: board_game == "Wingspan")
+        app.orchestrator.user_has_exceeded_daily_token_limit = Mock(return_value=False)
+        app.orchestrator.admit_request = Mock(return_value="lease-1")
+        app.orchestrator.release_request = Mock()
+
+        def answer():
+            g.model_called = True
+            yield "An answer"
+
+        app.orchestrator.ask_question = Mock(return_value=answer())
+
+        response = client.post(
+            '/ask-question',
+            json={"question": "How do I play?", "board_game": "Wingspan"},
+            headers=auth_headers,
+            buffered=False,
+        )
+
+        app.orchestrator.release_request.assert_not_called()
+        assert b"An answer" in response.get_data()
+        response.close()
+
+        app.orchestrator.release_request.assert_called_once_with(
+            "test-user-123", "ask_question", lease_id="lease-1", refund=False
+        )
+
+    def test_rejected_question_is_refunded(self, client, app, auth_headers):
+        """Test that a question rejected before reaching the model gives back its reserved cost."""
+        app.orchestrator.is_known_board_game = Mock(return_value=False)
+        app.orchestrator.user_has_exceeded_daily_token_limit = Mock(return_value=False)
+        app.orchestrator.admit_request = Mock(return_value="lease-1")
+        app.orchestrator.release_request = Mock()
+
+        response = client.post(
+            '/ask-question',
+            json={"question": "How do I play?", "board_game": "Not Wingspan"},
+            headers=auth_headers
+        )
+
+        assert response.status_code == 400
+        app.orchestrator.release_request.assert_called_once_with(
+            "test-user-123", "ask_question", lease_id="lease-1", refund=True
+        )
+
+
+    def test_failure_before_model_is_refunded(self, client, app, auth_headers):
+        """Test that a request failing with a server error before reaching the model gives back its reserved cost."""
+        app.orchestrator.user_has_exceeded_daily_token_limit = Mock(return_value=False)
+        app.orchestrator.admit_request = Mock(return_value="lease-1")
+        app.orchestrator.release_request = Mock()
+        app.orchestrator.determine_board_game = Mock(side_effect=Exception("Database error"))
+
+        response = client.post('/determine-board-game', json={"question": "How do I play?"}, headers=auth_headers)
+
+        assert response.status_code == 500
+        app.orchestrator.release_request.assert_called_once_with(
+            "test-user-123", "determine_board_game", lease_id="lease-1", refund=True
+        )
+
+    def test_failure_after_model_is_not_refunded(self, client, app, auth_headers):
+        """Test that a request failing after reaching the model keeps its reserved cost."""
+        def call_model(user_id, question):
+            g.model_called = True
+            raise ValueError("Received an unexpected response")
+
+        app.orchestrator.user_has_exceeded_daily_token_limit = Mock(return_value=False)
+        app.orchestrator.admit_request = Mock(return_value="lease-1")
+        app.orchestrator.release_request = Mock()
+        app.orchestrator.determine_board_game = Mock(side_effect=call_model)
+
+        response = client.post('/determine-board-game', json={"question": "How do I play?"}, headers=auth_headers)
+
+        assert response.status_code == 500
+        app.orchestrator.release_request.assert_called_once_with(
+            "test-user-123", "determine_board_game", lease_id="lease-1", refund=False
+        )
+
+
+class TestReadiness:
+    """Test /ready endpoint."""
+
+    @pytest.fixture
+    def warmup(self, app):
+        original_warmup = app.warmup
+        yield
+        app.warmup = original_warmup
+
+    def test_ready_after_warmup(self, client, app, warmup):
+        """Test that a warmed-up worker reports ready."""
+        app.warmup = Warmup({"mongodb": Mock(), "openai": Mock()})
+        app.warmup.run()
+
+        response = client.get('/ready')
+
+        assert response.status_code == 200
+        assert json.loads(response.data) == {"ready": True, "checks": {"mongodb": "ok", "openai": "ok"}}
+
+    def test_not_ready_while_step_failing(self, client, app, warmup):
+        """Test that a worker whose warmup failed reports unavailable, and retries the failed step."""
+        openai_step = Mock(side_effect=Exception("TLS handshake failed"))
+        app.warmup = Warmup({"mongodb": Mock(), "openai": openai_step})
+
+        response = client.get('/ready')
+
+        assert response.status_code == 503
+        assert json.loads(response.data)["checks"] == {"mongodb": "ok", "openai": "failed"}
+        openai_step.assert_called_once()
+
+    def test_ready_not_rate_limited(self, client, app, warmup):
+        """Test that frequent readiness probes aren't rejected by the rate limiter."""
+        app.warmup = Warmup({})
+
+        responses = [client.get('/ready') for _ in range(120)]
+
+        assert all(response.status_code == 200 for response in responses)
+
+
+class TestMetrics:
+    """Test /metrics endpoint."""
+
+    @pytest.fixture
+    def metrics_token(self, app):
+        app.config["METRICS_TOKEN"] = "test-metrics-token"
+        yield "test-metrics-token"
+        app.config["METRICS_TOKEN"] = None
+
+    @staticmethod
+    def _scrape(client, token):
+        response = client.get('/metrics', headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == 200
+        return response.get_data(as_text=True)
+
+    def test_disabled_without_token(self, client):
+        """Test that metrics aren't served unless a token has been configured."""
+        response = client.get('/metrics')
+
+        assert response.status_code == 404
+
+    def test_rejects_wrong_token(self, client, metrics_token):
+        """Test that scrapers without the token are refused."""
+        response = client.get('/metrics', headers={"Authorization": "Bearer not-the-token"})
+
+        assert response.status_code == 401
+
+    def test_requests_counted_by_route(self, client, app, metrics_token):
+        """Test that requests are counted and timed under their route rather than their path."""
+        app.orchestrator.get_known_board_games = Mock(return_value=["Wingspan"])
+        client.get('/known-board-games')
+
+        body = self._scrape(client, metrics_token)
+
+        assert 'bgchat_http_requests_total{method="GET",route="/known-board-games",status="200"}' in body
+        assert 'bgchat_http_request_duration_seconds_count{method="GET",route="/known-board-games"}' in body
+
+    def test_open_streams_counted(self, client, app, auth_headers, metrics_token):
+        """Test that an answer stream counts as active until it closes."""
+        app.orchestrator.is_known_board_game = Mock(return_value=True)
+        app.orchestrator.user_has_exceeded_daily_token_limit = Mock(return_value=False)
+        app.orchestrator.admit_request = Mock(return_value="lease-1")
+        app.orchestrator.release_request = Mock()
+        app.orchestrator.ask_question = Mock(return_value=iter(["An answer"]))
+        active_streams = REGISTRY.get_sample_value("bgchat_active_streams")
+
+        response = client.post(
+            '/ask-question',
+            json={"question": "How do I play?", "board_game": "Wingspan"},
+            headers=auth_headers,
+            buffered=False,
+        )
+
+        assert REGISTRY.get_sample_value("bgchat_active_streams") == active_streams + 1
+        response.get_data()
+        response.close()
+        assert REGISTRY.get_sample_value("bgchat_active_streams") == active_streams
+
+    def test_rejections_counted_by_reason(self, client, app, auth_headers, metrics_token):
+        """Test that requests refused by admission control are counted with the reason."""
+        app.orchestrator.user_has_exceeded_daily_token_limit = Mock(return_value=False)
+        app.orchestrator.admit_request = Mock(
+            side_effect=AdmissionDeniedError(ERROR_TOO_MANY_CONCURRENT_STREAMS, 5, reason="concurrent_streams")
+        )
+        rejections = REGISTRY.get_sample_value(
+            "bgchat_request_rejections_total", {"reason": "concurrent_streams"}
+        ) or 0
+
+        client.post(
+            '/ask-question',
+            json={"question": "How do I play?", "board_game": "Wingspan"},
+            headers=auth_headers
+        )
+
+        assert REGISTRY.get_sample_value(
+            "bgchat_request_rejections_total", {"reason": "concurrent_streams"}
+        ) == rejections + 1
+
+
+class TestTracing:
+    """Test that requests are traced through the route decorators."""
+
+    @pytest.fixture
+    def export_path(self, tmp_path):
+        export_path = tmp_path / "traces.jsonl"
+        configure_tracing(str(export_path), sample_rate=1.0, slow_request_seconds=30)
+        yield export_path
+        configure_tracing(None, sample_rate=0, slow_request_seconds=30)
+
+    def test_ask_question_traced(self, client, app, auth_headers, export_path):
+        """Test that a question's trace covers its auth and admission checks, and ends with its stream."""
+        app.orchestrator.is_known_board_game = Mock(return_value=True)
+        app.orchestrator.user_has_exceeded_daily_token_limit = Mock(return_value=False)
+        app.orchestrator.admit_request = Mock(return_value="lease-1")
+        app.orchestrator.release_request = Mock()
+        app.orchestrator.ask_question = Mock(return_value=iter(["An answer"]))
+
+        response = client.post(
+            '/ask-question',
+            json={"question": "How do I play?", "board_game": "Wingspan"},
+            headers=auth_headers,
+            buffered=False,
+        )
+        response.get_data()
+        assert not export_path.exists()
+        response.close()
+
+        [trace] = [json.loads(line) for line in export_path.read_text().splitlines()]
+        spans = trace["resourceSpans"][0]["scopeSpans"][0]["spans"]
+        assert {span["name"] for span in spans} == {
+            "POST /ask-question",
+            "check_daily_token_limit",
+            "check_user_admission",
+            "validate_auth_token",
+        }
+
+
 class TestPDFServing:
     """Test PDF serving endpoint."""
 
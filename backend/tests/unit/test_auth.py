@@ -1,21 +1,39 @@
 """
 Unit tests for authentication utilities.
 """
+import json
+import time
+
 import pytest
 from unittest.mock import Mock, patch
 import jwt
+from flask import g
 
 from app.utils.auth import (
     JWKS_CACHE_DURATION,
+    JWKS_NOT_LOADED_RETRY_AFTER_SECONDS,
     MAX_USER_ID_LENGTH,
     AuthenticationError,
+    SigningKeysUnavailableError,
     _validate_user_id,
     _get_cached_jwks,
+    _get_cached_signing_keys,
+    _parse_signing_keys,
     _set_cached_jwks,
+    authenticate_request,
     get_token_from_auth_header,
-    get_user_id_from_auth_header,
     validate_jwt,
     _jwks_cache,
+    _verified_claims_cache,
+    VERIFIED_CLAIMS_CACHE_MAX_SECONDS,
+    get_auth_cache_stats,
+    _force_jwks_refresh,
+    _jwks_last_forced_refresh,
+    _jwks_refresher_pids,
+    _refresh_jwks_in_background,
+    warm_up_jwks,
+    initialise_jwks,
+    start_jwks_refresher,
 )
 from app.config.constants import (
     ERROR_USER_ID_CANNOT_BE_EMPTY,
@@ -31,6 +49,7 @@ from app.config.constants import (
     ERROR_UNABLE_TO_FIND_APPROPRIATE_KEY,
     ERROR_INVALID_TOKEN,
     ERROR_AUTH0_CONFIGURATION_NOT_PROPERLY_SET_UP,
+    ERROR_SIGNING_KEYS_NOT_LOADED,
 )
 
 
@@ -104,6 +123,47 @@ class TestJWKSCache:
         assert _get_cached_jwks("test.auth0.com") is None
 
 
+class TestParseSigningKeys:
+    """Test building public keys from a JWKS."""
+
+    def test_keys_indexed_by_kid(self, mock_jwks_response):
+        """Test that RSA signing keys are parsed and indexed by kid."""
+        with patch('jwt.algorithms.RSAAlgorithm.from_jwk', side_effect=lambda key: f"parsed-{key['kid']}"):
+            signing_keys = _parse_signing_keys(mock_jwks_response)
+
+        assert signing_keys == {"test-key-id": "parsed-test-key-id"}
+
+    def test_skips_unusable_keys(self, mock_jwks_response):
+        """Test that encryption keys and keys that fail to parse are skipped."""
+        jwks = {
+            "keys": [
+                {"kty": "RSA", "kid": "encryption-key", "use": "enc", "n": "n", "e": "AQAB"},
+                {"kty": "RSA", "kid": "broken-key", "use": "sig", "n": "n", "e": "AQAB"},
+                *mock_jwks_response["keys"],
+            ]
+        }
+
+        def from_jwk(key):
+            if key["kid"] == "broken-key":
+                raise ValueError("Invalid key")
+            return f"parsed-{key['kid']}"
+
+        with patch('jwt.algorithms.RSAAlgorithm.from_jwk', side_effect=from_jwk):
+            signing_keys = _parse_signing_keys(jwks)
+
+        assert list(signing_keys) == ["test-key-id"]
+
+    def test_cached_with_jwks(self, mock_jwks_response):
+        """Test that parsed keys are cached alongside the JWKS."""
+        _jwks_cache.clear()
+
+        with patch('jwt.algorithms.RSAAlgorithm.from_jwk', return_value="parsed-key"):
+            _set_cached_jwks("test.auth0.com", mock_jwks_response)
+
+        assert _get_cached_signing_keys("test.auth0.com") == {"test-key-id": "parsed-key"}
+        assert _get_cached_jwks("test.auth0.com") == mock_jwks_response
+
+
 class TestGetTokenFromAuthHeader:
     """Test token extraction from Authorization header."""
 
@@ -139,21 +199,50 @@ class TestGetTokenFromAuthHeader:
             assert result == token
 
 
-class TestGetUserIdFromAuthHeader:
-    """Test user ID extraction from JWT token."""
+class TestAuthenticateRequest:
+    """Test authenticating a request and storing its user ID."""
+
+    @pytest.fixture(autouse=True)
+    def skip_signature_verification(self):
+        """Verify tokens without checking their signature, so tests can create their own."""
+        with patch(
+            'app.utils.auth.validate_jwt',
+            side_effect=lambda token: jwt.decode(token, options={"verify_signature": False}),
+        ) as mock_validate_jwt:
+            self.mock_validate_jwt = mock_validate_jwt
+            yield
 
     def test_valid_user_id_extraction(self, app, valid_jwt_token):
         """Test successful user ID extraction from valid token."""
         with app.test_request_context(headers={'Authorization': f'Bearer {valid_jwt_token}'}):
-            user_id = get_user_id_from_auth_header()
+            user_id = authenticate_request()
+
             assert user_id == "test-user-123"
+            assert g.user_id == "test-user-123"
+            assert g.auth_claims["sub"] == "test-user-123"
+
+    def test_authenticates_once_per_request(self, app, valid_jwt_token):
+        """Test that the token is only verified once however many times it's needed in a request."""
+        with app.test_request_context(headers={'Authorization': f'Bearer {valid_jwt_token}'}):
+            authenticate_request()
+            authenticate_request()
+
+        self.mock_validate_jwt.assert_called_once()
+
+    def test_missing_auth_header(self, app):
+        """Test error when the request has no token."""
+        with app.test_request_context():
+            with pytest.raises(AuthenticationError, match=ERROR_AUTHORIZATION_HEADER_EXPECTED_BUT_NOT_FOUND):
+                authenticate_request()
+
+            assert "user_id" not in g
 
     def test_missing_sub_claim(self, app):
         """Test error when token doesn't contain sub claim."""
         token_without_sub = jwt.encode({'aud': 'test'}, app.config["SECRET_KEY"], algorithm=app.config["ALGORITHM"])
         with app.test_request_context(headers={'Authorization': f'Bearer {token_without_sub}'}):
             with pytest.raises(AuthenticationError, match=ERROR_TOKEN_DOES_NOT_CONTAIN_USER_ID):
-                get_user_id_from_auth_header()
+                authenticate_request()
 
     def test_invalid_user_id_in_token(self, app):
         """Test error when token contains invalid user ID."""
@@ -161,7 +250,7 @@ class TestGetUserIdFromAuthHeader:
         invalid_token = jwt.encode(payload, app.config["SECRET_KEY"], algorithm=app.config["ALGORITHM"])
         with app.test_request_context(headers={'Authorization': f'Bearer {invalid_token}'}):
             with pytest.raises(AuthenticationError, match=ERROR_INVALID_USER_ID):
-                get_user_id_from_auth_header()
+                authenticate_request()
 
 
 class TestValidateJWT:
@@ -248,6 +337,25 @@ class TestValidateJWT:
                     validate_jwt("test-token")
                     assert mock_get.call_count == 1
 
+    @patch('requests.get')
+    def test_validate_jwt_parses_keys_once(self, mock_get, app, mock_jwks_response):
+        """Test that public keys are parsed when the JWKS is fetched, not on every request."""
+        _jwks_cache.clear()
+        self._setup_mock_jwks_response(mock_get, mock_jwks_response)
+        signing_key = Mock()
+
+        with patch('jwt.algorithms.RSAAlgorithm.from_jwk', return_value=signing_key) as mock_from_jwk:
+            with patch('jwt.decode') as mock_decode:
+                with patch('jwt.get_unverified_header') as mock_header:
+                    mock_header.return_value = {'kid': 'test-key-id'}
+
+                    with app.app_context():
+                        validate_jwt("test-token")
+                        validate_jwt("test-token")
+
+        mock_from_jwk.assert_called_once()
+        assert all(call[0][1] is signing_key for call in mock_decode.call_args_list)
+
     @patch('requests.get')
     def test_validate_jwt_expired_token(self, mock_get, app, mock_jwks_response):
         """Test error when token is expired."""
@@ -262,3 +370,259 @@ class TestValidateJWT:
                 with app.app_context():
                     with pytest.raises(AuthenticationError, match=ERROR_INVALID_TOKEN):
                         validate_jwt("test-token")
+
+
+class TestVerifiedClaimsCache:
+    """Test caching of verified token claims."""
+
+    @pytest.fixture(autouse=True)
+    def setup_jwks(self, mock_jwks_response):
+        """Serve the mock JWKS and start each test with empty caches."""
+        _jwks_cache.clear()
+        _verified_claims_cache.clear()
+
+        mock_response = Mock()
+        mock_response.json.return_value = mock_jwks_response
+
+        with patch('requests.get', return_value=mock_response):
+            with patch('jwt.get_unverified_header', return_value={'kid': 'test-key-id'}):
+                yield
+
+        _verified_claims_cache.clear()
+
+    @patch('jwt.decode')
+    def test_cache_hit_skips_verification(self, mock_decode, app):
+        """Test that a repeat token returns the cached claims without verifying the signature again."""
+        claims = {'sub': 'test-user-123', 'exp': time.time() + 3600}
+        mock_decode.return_value = claims
+
+        with app.app_context():
+            assert validate_jwt("test-token") == claims
+            assert validate_jwt("test-token") == claims
+
+        mock_decode.assert_called_once()
+        assert get_auth_cache_stats()["verified_claims"]["hits"] == 1
+
+    @patch('jwt.decode')
+    def test_different_tokens_verified_separately(self, mock_decode, app):
+        """Test that claims are cached per token."""
+        mock_decode.return_value = {'sub': 'test-user-123', 'exp': time.time() + 3600}
+
+        with app.app_context():
+            validate_jwt("test-token")
+            validate_jwt("another-test-token")
+
+        assert mock_decode.call_count == 2
+
+    @patch('jwt.decode')
+    def test_tokens_without_expiry_not_cached(self, mock_decode, app):
+        """Test that tokens without an exp claim are verified on every request."""
+        mock_decode.return_value = {'sub': 'test-user-123'}
+
+        with app.app_context():
+            validate_jwt("test-token")
+            validate_jwt("test-token")
+
+        assert mock_decode.call_count == 2
+
+    @patch('time.monotonic')
+    @patch('jwt.decode')
+    def test_entries_expire_with_token(self, mock_decode, mock_monotonic, app):
+        """Test that cached claims expire when the token does, if that is sooner than the cache limit."""
+        mock_monotonic.return_value = 0
+        mock_decode.return_value = {'sub': 'test-user-123', 'exp': time.time() + 10}
+
+        with app.app_context():
+            validate_jwt("test-token")
+
+            mock_monotonic.return_value = 11
+            validate_jwt("test-token")
+
+        assert mock_decode.call_count == 2
+
+    @patch('time.monotonic')
+    @patch('jwt.decode')
+    def test_entries_expire_after_cache_limit(self, mock_decode, mock_monotonic, app):
+        """Test that long-lived tokens are re-verified after VERIFIED_CLAIMS_CACHE_MAX_SECONDS."""
+        mock_monotonic.return_value = 0
+        mock_decode.return_value = {'sub': 'test-user-123', 'exp': time.time() + 24 * 3600}
+
+        with app.app_context():
+            validate_jwt("test-token")
+
+            mock_monotonic.return_value = VERIFIED_CLAIMS_CACHE_MAX_SECONDS
+            validate_jwt("test-token")
+
+        assert mock_decode.call_count == 2
+
+    @patch('jwt.decode')
+    def test_invalid_tokens_not_cached(self, mock_decode, app):
+        """Test that failed verifications are never cached."""
+        mock_decode.side_effect = jwt.InvalidSignatureError("Signature verification failed")
+
+        with app.app_context():
+            for _ in range(2):
+                with pytest.raises(AuthenticationError, match=ERROR_INVALID_TOKEN):
+                    validate_jwt("test-token")
+
+        assert mock_decode.call_count == 2
+
+
+class TestBackgroundJWKSRefresh:
+    """Test that, with background refresh, requests never wait on the JWKS endpoint."""
+
+    @pytest.fixture(autouse=True)
+    def background_refresh(self, app):
+        """Enable background refresh and start each test with no keys loaded."""
+        _jwks_cache.clear()
+        _verified_claims_cache.clear()
+        _jwks_last_forced_refresh.clear()
+        app.config['JWKS_BACKGROUND_REFRESH'] = True
+
+        with patch('app.utils.auth.start_jwks_refresher'), \
+                patch('app.utils.auth._refresh_jwks_in_background') as mock_refresh_in_background, \
+                patch('requests.get') as mock_get:
+            self.mock_refresh_in_background = mock_refresh_in_background
+            self.mock_get = mock_get
+            yield
+
+        app.config['JWKS_BACKGROUND_REFRESH'] = False
+        _jwks_cache.clear()
+        _jwks_last_forced_refresh.clear()
+
+    @staticmethod
+    def _cache_keys(mock_jwks_response, age_seconds=0):
+        with patch('jwt.algorithms.RSAAlgorithm.from_jwk', return_value="parsed-key"):
+            _set_cached_jwks("test.auth0.com", mock_jwks_response)
+        _jwks_cache["test.auth0.com"]['timestamp'] -= age_seconds
+
+    @patch('jwt.decode', return_value={'sub': 'test-user-123'})
+    @patch('jwt.get_unverified_header', return_value={'kid': 'test-key-id'})
+    def test_fresh_keys_used_without_refresh(self, mock_header, mock_decode, app, mock_jwks_response):
+        """Test that fresh keys are used as they are."""
+        self._cache_keys(mock_jwks_response)
+
+        with app.app_context():
+            validate_jwt("test-token")
+
+        self.mock_get.assert_not_called()
+        self.mock_refresh_in_background.assert_not_called()
+
+    @patch('jwt.decode', return_value={'sub': 'test-user-123'})
+    @patch('jwt.get_unverified_header', return_value={'kid': 'test-key-id'})
+    def test_stale_keys_served_while_revalidating(self, mock_header, mock_decode, app, mock_jwks_response):
+        """Test that expired keys keep being used while they are refreshed in the background."""
+        self._cache_keys(mock_jwks_response, age_seconds=JWKS_CACHE_DURATION + 1)
+
+        with app.app_context():
+            assert validate_jwt("test-token") == {'sub': 'test-user-123'}
+
+        self.mock_get.assert_not_called()
+        self.mock_refresh_in_background.assert_called_once_with("test.auth0.com")
+
+    def test_no_keys_loaded(self, app):
+        """Test that requests fail fast with a retry hint rather than waiting for keys to be fetched."""
+        with app.app_context():
+            with pytest.raises(SigningKeysUnavailableError, match=ERROR_SIGNING_KEYS_NOT_LOADED) as exc_info:
+                validate_jwt("test-token")
+
+        assert exc_info.value.retry_after_seconds == JWKS_NOT_LOADED_RETRY_AFTER_SECONDS
+
+        self.mock_get.assert_not_called()
+        self.mock_refresh_in_background.assert_called_once_with("test.auth0.com")
+
+    @patch('jwt.get_unverified_header', return_value={'kid': 'rotated-key-id'})
+    def test_unknown_kid_forces_rate_limited_refresh(self, mock_header, app, mock_jwks_response):
+        """Test that unknown kids trigger at most one forced refresh per interval."""
+        self._cache_keys(mock_jwks_response)
+
+        with app.app_context():
+            for _ in range(3):
+                with pytest.raises(AuthenticationError, match=ERROR_UNABLE_TO_FIND_APPROPRIATE_KEY):
+                    validate_jwt("test-token")
+
+        self.mock_get.assert_not_called()
+        self.mock_refresh_in_background.assert_called_once_with("test.auth0.com")
+
+    @patch('time.monotonic')
+    def test_forced_refresh_allowed_again_after_interval(self, mock_monotonic):
+        """Test that forced refreshes are allowed again once the interval has passed."""
+        mock_monotonic.return_value = 1000
+        _force_jwks_refresh("test.auth0.com")
+        _force_jwks_refresh("test.auth0.com")
+
+        mock_monotonic.return_value = 1060
+        _force_jwks_refresh("test.auth0.com")
+
+        assert self.mock_refresh_in_background.call_count == 2
+
+    def test_load_jwks_from_file(self, tmp_path, mock_jwks_response):
+        """Test that keys can be loaded from a local file at boot without calling Auth0."""
+        jwks_file = tmp_path / "jwks.json"
+        jwks_file.write_text(json.dumps(mock_jwks_response))
+
+        with patch('jwt.algorithms.RSAAlgorithm.from_jwk', return_value="parsed-key"):
+            initialise_jwks("test.auth0.com", jwks_file=str(jwks_file), background_refresh=True)
+
+        self.mock_get.assert_not_called()
+        assert _get_cached_signing_keys("test.auth0.com") == {"test-key-id": "parsed-key"}
+
+    def test_startup_fetch_failure_not_raised(self):
+        """Test that failing to reach Auth0 at boot doesn't stop the app from starting."""
+        self.mock_get.side_effect = Exception("Connection error")
+
+        initialise_jwks("test.auth0.com", background_refresh=True)
+
+        assert _get_cached_jwks("test.auth0.com") is None
+
+    def test_warm_up_fetches_missing_keys(self):
+        """Test that warming up fetches keys if none have been loaded, and raises if that fails."""
+        with patch('app.utils.auth.refresh_jwks', side_effect=Exception("Connection error")) as mock_refresh:
+            with pytest.raises(Exception):
+                warm_up_jwks("test.auth0.com")
+
+        mock_refresh.assert_called_once_with("test.auth0.com")
+
+    def test_warm_up_uses_loaded_keys(self, mock_jwks_response):
+        """Test that warming up doesn't fetch keys that are already loaded, even if stale."""
+        self._cache_keys(mock_jwks_response, age_seconds=JWKS_CACHE_DURATION + 1)
+
+        with patch('app.utils.auth.refresh_jwks') as mock_refresh:
+            warm_up_jwks("test.auth0.com")
+
+        mock_refresh.assert_not_called()
+
+
+class TestJWKSRefreshThreads:
+    """Test the threads used to refresh keys in the background."""
+
+    @patch('app.utils.auth.threading.Thread')
+    def test_background_refresh_single_flight(self, mock_thread):
+        """Test that only one background refresh runs at a time."""
+        _refresh_jwks_in_background("test.auth0.com")
+        _refresh_jwks_in_background("test.auth0.com")
+
+        mock_thread.assert_called_once()
+
+        # Let the refresh run and finish so another can start
+        with patch('app.utils.auth.refresh_jwks'):
+            mock_thread.call_args[1]["target"]()
+        _refresh_jwks_in_background("test.auth0.com")
+
+        assert mock_thread.call_count == 2
+
+    @patch('app.utils.auth.threading.Thread')
+    def test_refresher_started_once_per_process(self, mock_thread):
+        """Test that each process runs a single refresher thread."""
+        _jwks_refresher_pids.clear()
+
+        start_jwks_refresher("test.auth0.com")
+        start_jwks_refresher("test.auth0.com")
+        assert mock_thread.call_count == 1
+
+        # A forked child inherits its parent's state but not its threads
+        _jwks_refresher_pids["test.auth0.com"] = -1
+        start_jwks_refresher("test.auth0.com")
+        assert mock_thread.call_count == 2
+
+        _jwks_refresher_pids.clear()
@@ -0,0 +1,82 @@
+"""
+Unit tests for the in-memory board game catalog.
+"""
+import pytest
+from unittest.mock import Mock, patch
+
+from app.board_game_catalog import BoardGameCatalog
+
+
+def _board_game(name: str, version: int = 1) -> dict:
+    return {"name": name, "rulebooks": [{"name": "Rules", "page_count": 10}], "page_count": 10, "version": version}
+
+
+class TestBoardGameCatalog:
+    """Test board game catalog loading and refreshing."""
+
+    def test_membership_and_names(self):
+        """Test that board games can be looked up by name."""
+        catalog = BoardGameCatalog(Mock(return_value=[_board_game("Wingspan"), _board_game("Azul")]), ttl_seconds=60)
+
+        assert "Wingspan" in catalog
+        assert "Catan" not in catalog
+        assert catalog.names() == ["Azul", "Wingspan"]
+        assert catalog.get("Wingspan")["page_count"] == 10
+        assert catalog.get("Catan") is None
+
+    def test_loads_lazily_and_once(self):
+        """Test that the catalog is loaded on first use and then served from memory."""
+        load_board_games = Mock(return_value=[_board_game("Wingspan")])
+        catalog = BoardGameCatalog(load_board_games, ttl_seconds=60)
+
+        load_board_games.assert_not_called()
+
+        for _ in range(3):
+            assert "Wingspan" in catalog
+
+        load_board_games.assert_called_once()
+
+    @patch('time.monotonic')
+    def test_refreshes_after_ttl(self, mock_monotonic):
+        """Test that newly ingested board games appear once the TTL has passed."""
+        load_board_games = Mock(return_value=[_board_game("Wingspan")])
+        catalog = BoardGameCatalog(load_board_games, ttl_seconds=60)
+
+        mock_monotonic.return_value = 0
+        assert "Azul" not in catalog
+
+        load_board_games.return_value = [_board_game("Wingspan"), _board_game("Azul")]
+        mock_monotonic.return_value = 59
+        assert "Azul" not in catalog
+
+        mock_monotonic.return_value = 60
+        assert "Azul" in catalog
+
+    def test_invalidate(self):
+        """Test that invalidating the catalog reloads it on the next lookup."""
+        load_board_games = Mock(return_value=[_board_game("Wingspan")])
+        catalog = BoardGameCatalog(load_board_games, ttl_seconds=60)
+        catalog.names()
+
+        load_board_games.return_value = [_board_game("Azul")]
+        catalog.invalidate()
+
+        assert catalog.names() == ["Azul"]
+
+    def test_serves_previous_catalog_when_refresh_fails(self):
+        """Test that a failed refresh keeps serving the last loaded catalog."""
+        load_board_games = Mock(return_value=[_board_game("Wingspan")])
+        catalog = BoardGameCatalog(load_board_games, ttl_seconds=60)
+        catalog.names()
+
+        load_board_games.side_effect = Exception("Database error")
+        catalog.invalidate()
+
+        assert "Wingspan" in catalog
+
+    def test_initial_load_failure_raises(self):
+        """Test that failing to load the catalog for the first time is an error."""
+        catalog = BoardGameCatalog(Mock(side_effect=Exception("Database error")), ttl_seconds=60)
+
+        with pytest.raises(Exception, match="Database error"):
+            catalog.names()
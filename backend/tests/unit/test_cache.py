@@ -0,0 +1,155 @@
+"""
+Unit tests for the in-process TTL cache.
+"""
+from unittest.mock import patch
+
+from prometheus_client import REGISTRY
+
+from app.utils.cache import TTLCache
+
+
+class TestTTLCache:
+    """Test TTL cache behaviour."""
+
+    def test_get_missing_key(self):
+        """Test that missing keys return the default value."""
+        cache = TTLCache(max_entries=10, ttl_seconds=60)
+
+        assert cache.get("missing") is None
+        assert cache.get("missing", "default") == "default"
+
+    def test_set_and_get(self):
+        """Test that stored values are returned."""
+        cache = TTLCache(max_entries=10, ttl_seconds=60)
+        cache.set("key", "value")
+
+        assert cache.get("key") == "value"
+
+    @patch('time.monotonic')
+    def test_entries_expire(self, mock_monotonic):
+        """Test that entries expire after the TTL."""
+        cache = TTLCache(max_entries=10, ttl_seconds=60)
+
+        mock_monotonic.return_value = 0
+        cache.set("key", "value")
+
+        mock_monotonic.return_value = 59
+        assert cache.get("key") == "value"
+
+        mock_monotonic.return_value = 60
+        assert cache.get("key") is None
+
+    @patch('time.monotonic')
+    def test_per_entry_ttl(self, mock_monotonic):
+        """Test that a per-entry TTL overrides the default."""
+        cache = TTLCache(max_entries=10, ttl_seconds=60)
+
+        mock_monotonic.return_value = 0
+        cache.set("key", "value", ttl_seconds=5)
+
+        mock_monotonic.return_value = 5
+        assert cache.get("key") is None
+
+    def test_evicts_least_recently_used(self):
+        """Test that the least recently used entry is evicted when full."""
+        cache = TTLCache(max_entries=2, ttl_seconds=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        assert cache.get("a") == 1
+        assert cache.get("b") is None
+        assert cache.get("c") == 3
+
+    @patch('time.monotonic')
+    def test_update(self, mock_monotonic):
+        """Test that update changes existing entries without extending their lifetime."""
+        cache = TTLCache(max_entries=10, ttl_seconds=60)
+
+        mock_monotonic.return_value = 0
+        cache.set("key", 1)
+
+        mock_monotonic.return_value = 30
+        assert cache.update("key", lambda value: value + 1) is True
+        assert cache.update("missing", lambda value: value + 1) is False
+        assert cache.get("key") == 2
+        assert cache.get("missing") is None
+
+        mock_monotonic.return_value = 60
+        assert cache.get("key") is None
+        assert cache.update("key", lambda value: value + 1) is False
+
+    def test_peek_not_counted(self):
+        """Test that peeking returns live values without counting hits or misses."""
+        cache = TTLCache(max_entries=10, ttl_seconds=60)
+        cache.set("key", "value")
+
+        assert cache.peek("key") == "value"
+        assert cache.peek("missing") is None
+        assert cache.stats()["hits"] == 0
+        assert cache.stats()["misses"] == 0
+
+    def test_invalidate(self):
+        """Test that invalidated keys are removed."""
+        cache = TTLCache(max_entries=10, ttl_seconds=60)
+        cache.set("key", "value")
+        cache.invalidate("key")
+        cache.invalidate("never-set")
+
+        assert cache.get("key") is None
+
+    def test_invalidate_group(self):
+        """Test that every key in a group is removed, and keys in other groups kept."""
+        cache = TTLCache(max_entries=10, ttl_seconds=60, group_key=lambda key: key[0])
+        cache.set(("user-1", "Root"), 1)
+        cache.set(("user-1", "Arcs"), 2)
+        cache.set(("user-2", "Root"), 3)
+
+        cache.invalidate_group("user-1")
+        cache.invalidate_group("never-set")
+
+        assert cache.get(("user-1", "Root")) is None
+        assert cache.get(("user-1", "Arcs")) is None
+        assert cache.get(("user-2", "Root")) == 3
+
+    def test_group_index_forgets_removed_keys(self):
+        """Test that evicted and invalidated keys are dropped from the group index, so it stays bounded."""
+        cache = TTLCache(max_entries=2, ttl_seconds=60, group_key=lambda key: key[0])
+        cache.set(("user-1", "Root"), 1)
+        cache.set(("user-2", "Root"), 2)
+        cache.set(("user-3", "Root"), 3)
+        cache.invalidate(("user-2", "Root"))
+
+        assert cache._keys_by_group == {"user-3": {("user-3", "Root")}}
+
+    def test_stats(self):
+        """Test that hits and misses are counted."""
+        cache = TTLCache(max_entries=10, ttl_seconds=60)
+        cache.set("key", "value")
+        cache.get("key")
+        cache.get("key")
+        cache.get("missing")
+
+        stats = cache.stats()
+
+        assert stats["hits"] == 2
+        assert stats["misses"] == 1
+        assert stats["hit_ratio"] == 2 / 3
+        assert stats["entries"] == 1
+
+    def test_named_cache_exports_lookups(self):
+        """Test that a named cache counts its hits and misses as metrics."""
+        def lookups(result):
+            return REGISTRY.get_sample_value(
+                "bgchat_cache_lookups_total", {"cache": "test_named", "result": result}
+            ) or 0
+
+        hits, misses = lookups("hit"), lookups("miss")
+        cache = TTLCache(max_entries=10, ttl_seconds=60, name="test_named")
+        cache.set("key", "value")
+        cache.get("key")
+        cache.get("missing")
+
+        assert lookups("hit") == hits + 1
+        assert lookups("miss") == misses + 1
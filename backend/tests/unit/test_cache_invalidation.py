@@ -0,0 +1,156 @@
+"""
+Unit tests for the cross-process cache invalidation bus.
+"""
+from unittest.mock import MagicMock, Mock, patch
+
+from pymongo.errors import OperationFailure
+
+from app.cache_invalidation import CacheInvalidationBus
+
+
+def _event(event_id: str, topic: str, source: str = "another-process") -> dict:
+    return {"_id": event_id, "topic": topic, "source": source}
+
+
+def _create_bus(mode: str = "poll") -> tuple[CacheInvalidationBus, MagicMock]:
+    """Create a started bus whose background thread is never run, so tests can drive it directly."""
+    collection = MagicMock()
+    bus = CacheInvalidationBus(lambda: collection, mode=mode)
+
+    with patch('app.cache_invalidation.threading.Thread'):
+        bus.start()
+
+    return bus, collection
+
+
+class TestCacheInvalidationBus:
+    """Test publishing and receiving cache invalidations."""
+
+    def test_publish_queues_event_without_writing(self):
+        """Test that publishing doesn't touch the database on the calling thread."""
+        bus, collection = _create_bus()
+
+        bus.publish("user", "test-user-123")
+
+        collection.insert_one.assert_not_called()
+        collection.insert_many.assert_not_called()
+
+    def test_flush_writes_queued_events_in_one_batch(self):
+        """Test that queued topics are written with a single insert, once each however often published."""
+        bus, collection = _create_bus()
+
+        bus.publish("user", "test-user-123")
+        bus.publish("user", "test-user-123")
+        bus.publish("catalog")
+        bus.flush()
+        bus.flush()
+
+        collection.insert_many.assert_called_once()
+        events = collection.insert_many.call_args[0][0]
+        assert sorted(event["topic"] for event in events) == ["catalog", "user:test-user-123"]
+        assert {event["source"] for event in events} == {bus._source}
+
+    def test_publish_failure_is_not_raised(self):
+        """Test that failing to publish doesn't fail the publisher thread."""
+        bus, collection = _create_bus()
+        collection.insert_many.side_effect = Exception("Database error")
+
+        bus.publish("catalog")
+        bus.flush()
+
+    def test_publisher_thread_flushes_queued_events(self):
+        """Test that the publisher thread writes queued events, including those left when it is stopped."""
+        bus, collection = _create_bus()
+
+        bus.publish("catalog")
+        bus._stop.set()
+        bus._run_publisher()
+
+        assert [event["topic"] for event in collection.insert_many.call_args[0][0]] == ["catalog"]
+
+    def test_stop_publishes_queued_events(self):
+        """Test that events published just before stopping are written before stop() returns."""
+        bus, collection = _create_bus()
+
+        bus.publish("catalog")
+        bus.stop()
+
+        assert [event["topic"] for event in collection.insert_many.call_args[0][0]] == ["catalog"]
+
+    def test_off_mode_does_nothing(self):
+        """Test that the bus neither publishes nor starts listening when turned off."""
+        bus, collection = _create_bus(mode="off")
+
+        bus.publish("catalog")
+        bus.flush()
+
+        collection.insert_many.assert_not_called()
+        collection.find.assert_not_called()
+
+    def test_dispatches_to_namespace_handlers(self):
+        """Test that handlers receive the key of topics in their namespace."""
+        bus, _ = _create_bus()
+        user_handler = Mock()
+        catalog_handler = Mock()
+        bus.subscribe("user", user_handler)
+        bus.subscribe("catalog", catalog_handler)
+
+        bus._handle_event(_event("event-1", "user:test-user-123"))
+        bus._handle_event(_event("event-2", "catalog"))
+
+        user_handler.assert_called_once_with("test-user-123")
+        catalog_handler.assert_called_once_with(None)
+
+    def test_ignores_own_and_duplicate_events(self):
+        """Test that a process skips its own events and events it has already handled."""
+        bus, _ = _create_bus()
+        handler = Mock()
+        bus.subscribe("catalog", handler)
+
+        bus._handle_event(_event("event-1", "catalog", source=bus._source))
+        bus._handle_event(_event("event-2", "catalog"))
+        bus._handle_event(_event("event-2", "catalog"))
+
+        handler.assert_called_once()
+
+    def test_handler_errors_are_isolated(self):
+        """Test that one failing handler doesn't stop others from running."""
+        bus, _ = _create_bus()
+        failing_handler = Mock(side_effect=Exception("Handler error"))
+        handler = Mock()
+        bus.subscribe("catalog", failing_handler)
+        bus.subscribe("catalog", handler)
+
+        bus._handle_event(_event("event-1", "catalog"))
+
+        handler.assert_called_once_with(None)
+
+    def test_poll_dispatches_recent_events(self):
+        """Test that polling dispatches events published since the last poll."""
+        bus, collection = _create_bus()
+        handler = Mock()
+        bus.subscribe("user", handler)
+        collection.find.return_value.sort.return_value = [
+            _event("event-1", "user:test-user-123"),
+            _event("event-2", "user:test-user-456"),
+        ]
+
+        bus._poll()
+
+        assert [call[0][0] for call in handler.call_args_list] == ["test-user-123", "test-user-456"]
+        assert "$gt" in collection.find.call_args[0][0]["created_at"]
+
+    def test_falls_back_to_polling_without_change_streams(self):
+        """Test that auto mode polls when the server doesn't support change streams."""
+        bus, collection = _create_bus(mode="auto")
+        collection.watch.side_effect = OperationFailure("The $changeStream stage is only supported on replica sets")
+        collection.find.return_value.sort.return_value = [_event("event-1", "catalog")]
+        handler = Mock()
+        bus.subscribe("catalog", handler)
+
+        # Run a single iteration of the receive loop
+        bus._stop.wait = Mock(side_effect=lambda timeout: bus._stop.set())
+        bus._run()
+
+        collection.watch.assert_called_once()
+        handler.assert_called_once_with(None)
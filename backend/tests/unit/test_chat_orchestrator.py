@@ -0,0 +1,377 @@
+"""
+Unit tests for the chat orchestrator.
+"""
+import os
+
+import pytest
+from types import SimpleNamespace
+from unittest.mock import Mock, patch
+
+from flask import Flask, g
+from prometheus_client import REGISTRY
+from pymongo.errors import ServerSelectionTimeoutError
+
+from app.chat_orchestrator import ChatOrchestrator
+from app.config.constants import MAX_COST_PER_USER_PER_DAY_USD
+from app.config.models import OPENAI_CHAT_MODEL, OPENAI_EMBEDDING_MODEL
+from app.config.prompts import SYSTEM_PROMPT
+
+# The session-wide app fixture stubs out ChatOrchestrator.__init__, so keep hold of the real one
+_chat_orchestrator_init = ChatOrchestrator.__init__
+
+
+@pytest.fixture
+def mock_config():
+    """Mock configuration for the chat orchestrator."""
+    config = Mock()
+    config.OPENAI_API_KEY = "sk-test-key-1234567890"
+    config.OPENAI_MAX_CONNECTIONS = 100
+    config.MONGODB_CREATE_INDEXES_ON_STARTUP = False
+    config.CHAT_HISTORY_MAX_TURNS = 2
+    config.CHAT_HISTORY_MAX_TOKENS = 20
+    config.USER_ADMISSION_STORAGE_URI = "memory://"
+    config.USER_REQUEST_BUDGET_USD = 0.005
+    config.USER_REQUEST_BUDGET_REFILL_USD_PER_HOUR = 0.02
+    config.USER_MAX_CONCURRENT_STREAMS = 2
+    return config
+
+
+@pytest.fixture
+def orchestrator(mock_config):
+    """Create a chat orchestrator with mocked MongoDB, OpenAI and tiktoken clients."""
+    with patch('app.chat_orchestrator.MongoDBClient'), \
+            patch('app.chat_orchestrator.openai'), \
+            patch('app.chat_orchestrator.tiktoken') as mock_tiktoken:
+        mock_tiktoken.encoding_for_model.return_value.encode.side_effect = lambda text: text.split()
+        orchestrator = ChatOrchestrator.__new__(ChatOrchestrator)
+        _chat_orchestrator_init(orchestrator, config=mock_config)
+        yield orchestrator
+
+
+def _usage_costing(cost_usd: float) -> dict:
+    """Build a token usage for the chat model that costs the given amount."""
+    one_million_input_tokens = 0.15
+    return {OPENAI_CHAT_MODEL: {"input_tokens": round(cost_usd / one_million_input_tokens * 1_000_000)}}
+
+
+class TestDailyTokenLimit:
+    """Test the daily token limit check and its per-worker spend cache."""
+
+    def test_under_limit(self, orchestrator):
+        """Test that users under the limit are allowed."""
+        orchestrator._mongodb_client.get_todays_token_usage.return_value = {}
+
+        assert orchestrator.user_has_exceeded_daily_token_limit("test-user-123") is False
+
+    def test_over_limit(self, orchestrator):
+        """Test that users over the limit are rejected."""
+        orchestrator._mongodb_client.get_todays_token_usage.return_value = _usage_costing(
+            MAX_COST_PER_USER_PER_DAY_USD * 2
+        )
+
+        assert orchestrator.user_has_exceeded_daily_token_limit("test-user-123") is True
+
+    def test_low_spend_skips_database(self, orchestrator):
+        """Test that a cached spend comfortably under the limit short-circuits the database read."""
+        orchestrator._mongodb_client.get_todays_token_usage.return_value = {}
+
+        for _ in range(3):
+            assert orchestrator.user_has_exceeded_daily_token_limit("test-user-123") is False
+
+        orchestrator._mongodb_client.get_todays_token_usage.assert_called_once()
+
+    def test_spend_near_limit_rereads_database(self, orchestrator):
+        """Test that users close to the limit are always checked against the database."""
+        orchestrator._mongodb_client.get_todays_token_usage.return_value = _usage_costing(
+            MAX_COST_PER_USER_PER_DAY_USD * 0.9
+        )
+
+        orchestrator.user_has_exceeded_daily_token_limit("test-user-123")
+        orchestrator.user_has_exceeded_daily_token_limit("test-user-123")
+
+        assert orchestrator._mongodb_client.get_todays_token_usage.call_count == 2
+
+    def test_recorded_usage_updates_cached_spend(self, orchestrator):
+        """Test that usage recorded by this worker is added to the cached spend."""
+        orchestrator._mongodb_client.get_todays_token_usage.return_value = {}
+        orchestrator.user_has_exceeded_daily_token_limit("test-user-123")
+
+        orchestrator._record_turn("test-user-123", _usage_costing(MAX_COST_PER_USER_PER_DAY_USD * 0.6))
+        orchestrator._mongodb_client.get_todays_token_usage.return_value = _usage_costing(
+            MAX_COST_PER_USER_PER_DAY_USD * 0.6
+        )
+        orchestrator.user_has_exceeded_daily_token_limit("test-user-123")
+
+        # The cached spend is no longer comfortably under the limit, so it is re-read
+        assert orchestrator._mongodb_client.get_todays_token_usage.call_count == 2
+
+    def test_remote_invalidation_drops_cached_spend(self, orchestrator):
+        """Test that usage recorded by another worker makes this one re-read the user's spend."""
+        orchestrator._mongodb_client.get_todays_token_usage.return_value = {}
+        orchestrator.user_has_exceeded_daily_token_limit("test-user-123")
+        orchestrator.user_has_exceeded_daily_token_limit("test-user-456")
+        handlers = {
+            call[0][0]: call[0][1] for call in orchestrator._mongodb_client.invalidation_bus.subscribe.call_args_list
+        }
+
+        handlers["user"]("test-user-123")
+        orchestrator.user_has_exceeded_daily_token_limit("test-user-123")
+        orchestrator.user_has_exceeded_daily_token_limit("test-user-456")
+
+        assert orchestrator._mongodb_client.get_todays_token_usage.call_count == 3
+
+
+class TestOpenAIClient:
+    """Test the per-process OpenAI client."""
+
+    def test_client_created_once_per_process(self, orchestrator):
+        """Test that the client is created on first use, reused, and recreated in a forked child."""
+        with patch('app.chat_orchestrator.openai') as mock_openai, \
+                patch('app.chat_orchestrator.os.getpid', return_value=100) as mock_getpid:
+            mock_openai.OpenAI.side_effect = [Mock(), Mock()]
+
+            first_client = orchestrator._openai_client
+            assert orchestrator._openai_client is first_client
+
+            mock_getpid.return_value = 101
+            assert orchestrator._openai_client is not first_client
+
+        assert mock_openai.OpenAI.call_count == 2
+        assert mock_openai.OpenAI.call_args[1]["api_key"] == "sk-test-key-1234567890"
+
+
+class TestWarmupSteps:
+    """Test the steps that prime a worker's clients and caches."""
+
+    def test_warmup_steps_prime_clients(self, orchestrator):
+        """Test that the steps connect to MongoDB, load the catalog, search and reach OpenAI."""
+        orchestrator._board_game_catalog = Mock()
+        orchestrator._board_game_catalog.names.return_value = ["Catan", "Wingspan"]
+
+        with patch('app.chat_orchestrator.openai') as mock_openai:
+            for step in orchestrator.get_warmup_steps().values():
+                step()
+
+        orchestrator._mongodb_client.connect.assert_called_once()
+        board_game, embedding = orchestrator._mongodb_client.get_similar_rulebook_pages.call_args[0]
+        assert board_game == "Catan"
+        assert sum(value * value for value in embedding) == pytest.approx(1.0)
+        mock_openai.OpenAI.return_value.models.retrieve.assert_called_once_with(OPENAI_CHAT_MODEL)
+
+    def test_unreachable_mongodb_at_startup_checked_during_warmup(self, mock_config):
+        """Test that MongoDB being unreachable at boot doesn't fail startup, and the index check is retried."""
+        with patch('app.chat_orchestrator.MongoDBClient') as mock_mongodb_client_class:
+            mock_mongodb_client = mock_mongodb_client_class.return_value
+            mock_mongodb_client.verify_indexes.side_effect = [ServerSelectionTimeoutError("unreachable"), []]
+
+            orchestrator = ChatOrchestrator.__new__(ChatOrchestrator)
+            _chat_orchestrator_init(orchestrator, config=mock_config)
+            orchestrator.get_warmup_steps()["indexes"]()
+            orchestrator.get_warmup_steps()["indexes"]()
+
+        assert mock_mongodb_client.verify_indexes.call_count == 2
+
+    def test_vector_search_skipped_without_board_games(self, orchestrator):
+        """Test that an empty catalog doesn't fail warmup."""
+        orchestrator._board_game_catalog = Mock()
+        orchestrator._board_game_catalog.names.return_value = []
+
+        orchestrator.get_warmup_steps()["vector_search"]()
+
+        orchestrator._mongodb_client.get_similar_rulebook_pages.assert_not_called()
+
+
+class TestUserAdmission:
+    """Test admitting requests against each user's request budget."""
+
+    def test_streaming_operation_takes_a_stream_slot(self, orchestrator):
+        """Test that asking a question reserves its estimated cost and a stream slot."""
+        orchestrator._user_admission = Mock()
+
+        orchestrator.admit_request("test-user-123", "ask_question")
+
+        orchestrator._user_admission.acquire.assert_called_once_with(
+            "test-user-123",
+            orchestrator._estimated_costs_usd["ask_question"],
+            stream=True,
+        )
+
+    def test_release_refunds_estimate(self, orchestrator):
+        """Test that releasing a request rejected before reaching the model returns its estimated cost."""
+        orchestrator._user_admission = Mock()
+
+        orchestrator.release_request("test-user-123", "determine_board_game", refund=True)
+
+        orchestrator._user_admission.release.assert_called_once_with(
+            "test-user-123",
+            lease_id=None,
+            refund_usd=orchestrator._estimated_costs_usd["determine_board_game"],
+        )
+
+    def test_model_call_marked_on_request(self, orchestrator):
+        """Test that calling OpenAI is recorded on the request, so its admitted cost isn't refunded."""
+        orchestrator._openai_client_instance = Mock()
+        orchestrator._openai_client_pid = os.getpid()
+
+        with Flask(__name__).test_request_context():
+            assert "model_called" not in g
+            orchestrator._call_openai_model([{"role": "user", "content": "A question?"}], stream=True)
+            assert g.model_called is True
+
+    def test_recorded_usage_settles_estimate(self, orchestrator):
+        """Test that recording a turn charges the difference between its actual and estimated cost."""
+        orchestrator._user_admission = Mock()
+
+        orchestrator._record_turn("test-user-123", _usage_costing(0.002), estimated_cost_usd=0.0015)
+
+        charged_user_id, charged_cost_usd = orchestrator._user_admission.charge.call_args[0]
+        assert charged_user_id == "test-user-123"
+        assert charged_cost_usd == pytest.approx(0.0005, abs=1e-6)
+
+
+def _stored_messages(*contents: str) -> list[dict]:
+    """Build a stored conversation alternating user and assistant messages."""
+    return [
+        {"seq": seq, "role": "user" if seq % 2 == 0 else "assistant", "content": content}
+        for seq, content in enumerate(contents)
+    ]
+
+
+class TestRecentMessageHistory:
+    """Test the window of conversation history sent to the model."""
+
+    def test_requests_only_the_turn_window(self, orchestrator):
+        """Test that only the configured number of turns is fetched."""
+        orchestrator._mongodb_client.get_recent_messages.return_value = _stored_messages("q1", "a1")
+
+        message_history, is_first_message = orchestrator._get_recent_message_history("test-user-123", "Wingspan")
+
+        orchestrator._mongodb_client.get_recent_messages.assert_called_once_with("test-user-123", "Wingspan", 4)
+        assert message_history == [{"content": "q1", "role": "user"}, {"content": "a1", "role": "assistant"}]
+        assert is_first_message is False
+
+    def test_empty_conversation(self, orchestrator):
+        """Test that an empty conversation is reported as such."""
+        orchestrator._mongodb_client.get_recent_messages.return_value = []
+
+        assert orchestrator._get_recent_message_history("test-user-123", "Wingspan") == ([], True)
+
+    def test_drops_oldest_turns_over_token_budget(self, orchestrator):
+        """Test that whole turns are dropped from the start until the history fits the token budget."""
+        orchestrator._mongodb_client.get_recent_messages.return_value = _stored_messages(
+            "a long first question " * 3,
+            "a long first answer " * 2,
+            "second question",
+            "second answer",
+        )
+
+        message_history, is_first_message = orchestrator._get_recent_message_history("test-user-123", "Wingspan")
+
+        assert message_history == [
+            {"content": "second question", "role": "user"},
+            {"content": "second answer", "role": "assistant"},
+        ]
+        assert is_first_message is False
+
+    def test_history_starts_with_user_message(self, orchestrator):
+        """Test that a window starting part-way through a turn is aligned to the next user message."""
+        orchestrator._mongodb_client.get_recent_messages.return_value = _stored_messages(
+            "q1", "a1", "q2", "a2",
+        )[1:]
+
+        message_history, _ = orchestrator._get_recent_message_history("test-user-123", "Wingspan")
+
+        assert [message["content"] for message in message_history] == ["q2", "a2"]
+
+
+class TestAskQuestion:
+    """Test answering questions."""
+
+    @staticmethod
+    def _setup_answer(orchestrator, deltas):
+        orchestrator._get_embedding_and_token_count = Mock(return_value=([0.1] * 1536, 7))
+        orchestrator._mongodb_client.get_similar_rulebook_pages.return_value = [
+            {"rulebook_name": "Rules", "page_num": 1, "text": "Some rules"},
+        ]
+        orchestrator._mongodb_client.get_recent_messages.return_value = []
+        orchestrator._call_openai_model = Mock(return_value=iter([
+            SimpleNamespace(type="response.output_text.delta", delta=delta)
+            for delta in deltas
+        ]))
+
+    def test_records_turn_once(self, orchestrator):
+        """Test that messages and usage for both models are recorded in a single call."""
+        self._setup_answer(orchestrator, ["An ", "answer"])
+
+        chunks = list(orchestrator.ask_question("test-user-123", "Wingspan", "A question?"))
+
+        assert "".join(chunks) == "An answer"
+        orchestrator._mongodb_client.record_turn.assert_called_once()
+        call_kwargs = orchestrator._mongodb_client.record_turn.call_args[1]
+        assert set(call_kwargs["model_token_usages"]) == {OPENAI_EMBEDDING_MODEL, OPENAI_CHAT_MODEL}
+        assert [message["role"] for message in call_kwargs["messages"]] == ["user", "assistant"]
+
+    def test_system_prompt_prepended_once(self, orchestrator):
+        """Test that the system prompt is stored with the first message and re-sent when it falls out of the window."""
+        self._setup_answer(orchestrator, ["An answer"])
+        list(orchestrator.ask_question("test-user-123", "Wingspan", "A question?"))
+
+        stored_user_message = orchestrator._mongodb_client.record_turn.call_args[1]["messages"][0]
+        assert stored_user_message["content"].startswith(SYSTEM_PROMPT)
+
+        self._setup_answer(orchestrator, ["An answer"])
+        orchestrator._mongodb_client.get_recent_messages.return_value = _stored_messages("q2", "a2")
+        list(orchestrator.ask_question("test-user-123", "Wingspan", "A question?"))
+
+        sent_messages = orchestrator._call_openai_model.call_args[1]["messages"]
+        stored_user_message = orchestrator._mongodb_client.record_turn.call_args[1]["messages"][0]
+        assert sent_messages[0]["content"] == SYSTEM_PROMPT + "q2"
+        assert not stored_user_message["content"].startswith(SYSTEM_PROMPT)
+
+    def test_records_embedding_usage_on_disconnect(self, orchestrator):
+        """Test that the embedding is still accounted for if the client disconnects mid-answer."""
+        self._setup_answer(orchestrator, ["An ", "answer"])
+
+        stream = orchestrator.ask_question("test-user-123", "Wingspan", "A question?")
+        next(stream)
+        stream.close()
+
+        orchestrator._mongodb_client.record_turn.assert_called_once_with(
+            user_id="test-user-123",
+            model_token_usages={OPENAI_EMBEDDING_MODEL: {"input_tokens": 7}},
+            board_game=None,
+            messages=None,
+        )
+
+
+class TestOpenAIMetrics:
+    """Test the metrics recorded for OpenAI calls."""
+
+    def test_streamed_response_observed(self, orchestrator):
+        """Test that a streamed response's time to first token, duration and tokens are observed."""
+        def sample(name, **labels):
+            return REGISTRY.get_sample_value(name, {"model": OPENAI_CHAT_MODEL, **labels}) or 0
+
+        ttft_count = sample("bgchat_openai_time_to_first_token_seconds_count")
+        duration_count = sample("bgchat_openai_request_duration_seconds_count", operation="response_stream")
+        output_tokens = sample("bgchat_openai_tokens_total", type="output")
+
+        orchestrator._openai_client_instance = Mock()
+        orchestrator._openai_client_pid = os.getpid()
+        orchestrator._openai_client_instance.responses.create.return_value = iter([
+            SimpleNamespace(type="response.created"),
+            SimpleNamespace(type="response.output_text.delta", delta="An "),
+            SimpleNamespace(type="response.output_text.delta", delta="answer"),
+        ])
+        orchestrator._get_embedding_and_token_count = Mock(return_value=([0.1] * 1536, 7))
+        orchestrator._mongodb_client.get_similar_rulebook_pages.return_value = []
+        orchestrator._mongodb_client.get_recent_messages.return_value = []
+
+        list(orchestrator.ask_question("test-user-123", "Wingspan", "A question?"))
+
+        assert sample("bgchat_openai_time_to_first_token_seconds_count") == ttft_count + 1
+        assert sample(
+            "bgchat_openai_request_duration_seconds_count", operation="response_stream"
+        ) == duration_count + 1
+        # The test tokenizer splits on whitespace
+        assert sample("bgchat_openai_tokens_total", type="output") == output_tokens + 2
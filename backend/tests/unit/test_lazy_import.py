@@ -0,0 +1,60 @@
+"""
+Unit tests for lazily imported modules.
+"""
+import os
+import subprocess
+import sys
+
+from app.utils.lazy_import import LazyModule
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+LAZILY_IMPORTED_MODULES = ["openai", "tiktoken", "httpx", "requests"]
+
+
+def _run_python(*args: str) -> subprocess.CompletedProcess:
+    """Run python in a fresh interpreter from the backend directory, so nothing is already imported."""
+    return subprocess.run(
+        [sys.executable, *args],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+
+class TestLazyModule:
+    """Test the stand-in for modules imported on first use."""
+
+    def test_module_imported_on_first_attribute_access(self):
+        """Test that the module is only imported once one of its attributes is used."""
+        with_lazy_module = (
+            "import sys\n"
+            "from app.utils.lazy_import import LazyModule\n"
+            "colorsys = LazyModule('colorsys')\n"
+            "print('colorsys' in sys.modules)\n"
+            "colorsys.rgb_to_hsv(0, 0, 0)\n"
+            "print('colorsys' in sys.modules)\n"
+        )
+
+        assert _run_python("-c", with_lazy_module).stdout.split() == ["False", "True"]
+
+    def test_attributes_come_from_module(self):
+        """Test that attributes are those of the real module."""
+        lazy_json = LazyModule("json")
+
+        assert lazy_json.dumps({"a": 1}) == '{"a": 1}'
+        assert lazy_json.JSONDecodeError is __import__("json").JSONDecodeError
+
+
+class TestAppImport:
+    """Test that importing the app stays cheap."""
+
+    def test_heavy_dependencies_not_imported(self):
+        """Test that importing the app doesn't import client libraries only needed to answer questions."""
+        result = _run_python(
+            "-c",
+            f"import sys, app; print(' '.join(m for m in {LAZILY_IMPORTED_MODULES!r} if m in sys.modules))",
+        )
+
+        assert result.stdout.split() == []
@@ -0,0 +1,55 @@
+"""
+Unit tests for metrics shared between worker processes.
+"""
+import os
+import subprocess
+import sys
+
+from prometheus_client import multiprocess
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+# A worker that serves one request and leaves an answer stream open, then reports its PID
+SERVE_REQUEST = (
+    "import os\n"
+    "HTTP_REQUESTS.labels(method='GET', route='/ready', status='200').inc()\n"
+    "ACTIVE_STREAMS.inc()\n"
+    "print(os.getpid())\n"
+)
+
+
+def _run_worker(metrics_dir, code: str) -> str:
+    """Run code in a fresh process writing metrics to metrics_dir, as a gunicorn worker would."""
+    return subprocess.run(
+        [sys.executable, "-c", f"from app.metrics import *\n{code}"],
+        cwd=BACKEND_DIR,
+        env={**os.environ, "PROMETHEUS_MULTIPROC_DIR": str(metrics_dir)},
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+
+
+class TestMultiProcessMetrics:
+    """Test that a scrape reports every worker's metrics."""
+
+    def test_samples_aggregated_across_workers(self, tmp_path):
+        """Test that counters and open streams from every worker are summed, whichever worker renders them."""
+        _run_worker(tmp_path, SERVE_REQUEST)
+        _run_worker(tmp_path, SERVE_REQUEST)
+
+        body = _run_worker(tmp_path, "print(render_metrics()[0].decode())")
+
+        assert 'bgchat_http_requests_total{method="GET",route="/ready",status="200"} 2.0' in body
+        assert "bgchat_active_streams 2.0" in body
+
+    def test_dead_workers_streams_not_counted(self, tmp_path):
+        """Test that once gunicorn marks a worker dead, its open streams stop counting but its requests don't."""
+        dead_worker_pid = int(_run_worker(tmp_path, SERVE_REQUEST))
+        _run_worker(tmp_path, SERVE_REQUEST)
+
+        multiprocess.mark_process_dead(dead_worker_pid, str(tmp_path))
+        body = _run_worker(tmp_path, "print(render_metrics()[0].decode())")
+
+        assert 'bgchat_http_requests_total{method="GET",route="/ready",status="200"} 2.0' in body
+        assert "bgchat_active_streams 1.0" in body
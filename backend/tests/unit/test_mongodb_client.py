@@ -4,8 +4,11 @@ Unit tests for MongoDB client.
 import pytest
 from unittest.mock import Mock, MagicMock, patch
 from datetime import datetime, timezone
-from pymongo.errors import ConnectionFailure
+from prometheus_client import REGISTRY
+from pymongo.errors import ConnectionFailure, DuplicateKeyError, OperationFailure
 
+from app.config.constants import LAST_ACTIVE_DEBOUNCE_SECONDS
+from app.config.indexes import MONGODB_INDEXES, VECTOR_SEARCH_INDEX_NAME
 from app.mongodb_client import MongoDBClient
 
 
@@ -17,6 +20,13 @@ def mock_config():
     config.MONGODB_PASSWORD = "test_password"
     config.MONGODB_HOST = "test-host.mongodb.net"
     config.MONGODB_DB_NAME = "test_db"
+    config.MONGODB_MAX_POOL_SIZE = 50
+    config.MONGODB_MIN_POOL_SIZE = 5
+    config.MONGODB_CONNECT_TIMEOUT_MS = 10000
+    config.MONGODB_SOCKET_TIMEOUT_MS = 30000
+    config.MONGODB_SERVER_SELECTION_TIMEOUT_MS = 10000
+    config.MONGODB_COMPRESSORS = ["zstd", "snappy"]
+    config.CACHE_INVALIDATION_MODE = "off"
     return config
 
 
@@ -49,41 +59,192 @@ class TestMongoDBClientConnection:
             assert "test_password" in uri
             assert "test-host.mongodb.net" in uri
 
-    def test_connection_retry_logic(self, mock_config):
-        """Test that connection retries on failure."""
+    def test_connection_failure_raised_without_retrying(self, mock_config):
+        """Test that a failed connection is raised straight away, without sleeping, and its client closed."""
         with patch('app.mongodb_client.MongoClient') as mock_client_class:
             mock_client = MagicMock()
-
-            # Fail twice, then succeed
-            mock_client.admin.command.side_effect = [
-                ConnectionFailure("Failed"),
-                ConnectionFailure("Failed"),
-                None,  # Success
-            ]
+            mock_client.admin.command.side_effect = ConnectionFailure("Failed")
             mock_client_class.return_value = mock_client
 
-            with patch('time.sleep'):  # Speed up the test
-                _ = MongoDBClient(config=mock_config)
-                assert mock_client.admin.command.call_count == 3
+            with patch('time.sleep') as mock_sleep:
+                with pytest.raises(ConnectionFailure):
+                    MongoDBClient(config=mock_config).connect()
+
+            mock_client_class.assert_called_once()
+            mock_client.close.assert_called_once()
+            mock_sleep.assert_not_called()
 
-    def test_connection_failure_after_retries(self, mock_config):
-        """Test that connection raises error after max retries."""
+    def test_connection_retried_on_next_use(self, mock_config):
+        """Test that after a failed connection, the next use of the database connects again."""
         with patch('app.mongodb_client.MongoClient') as mock_client_class:
-            mock_client = MagicMock()
-            mock_client.admin.command.side_effect = ConnectionFailure("Failed")
-            mock_client_class.return_value = mock_client
+            failed_client = MagicMock()
+            failed_client.admin.command.side_effect = ConnectionFailure("Failed")
+            connected_client = MagicMock()
+            mock_client_class.side_effect = [failed_client, connected_client]
 
-            with patch('time.sleep'):
-                with pytest.raises(ConnectionFailure):
-                    MongoDBClient(config=mock_config)
+            client = MongoDBClient(config=mock_config)
+            with pytest.raises(ConnectionFailure):
+                _ = client.db
+
+            assert client.client is connected_client
+
+    def test_connects_lazily(self, mock_config):
+        """Test that no connection is made until the database is first used."""
+        with patch('app.mongodb_client.MongoClient') as mock_client_class:
+            client = MongoDBClient(config=mock_config)
+            mock_client_class.assert_not_called()
+
+            _ = client.db
+            _ = client.db
+            mock_client_class.assert_called_once()
 
-    def test_ensure_connection_reconnects(self, mongodb_client):
-        """Test that _ensure_connection reconnects on failure."""
-        mongodb_client.client.admin.command.side_effect = ConnectionFailure("Lost connection")
+    def test_client_options_from_config(self, mock_config):
+        """Test that pool, timeout and compression settings are passed to the MongoClient."""
+        with patch('app.mongodb_client.MongoClient') as mock_client_class:
+            MongoDBClient(config=mock_config).connect()
+
+            options = mock_client_class.call_args[1]
+            assert options["maxPoolSize"] == 50
+            assert options["minPoolSize"] == 5
+            assert options["connectTimeoutMS"] == 10000
+            assert options["socketTimeoutMS"] == 30000
+            assert options["serverSelectionTimeoutMS"] == 10000
+            assert options["compressors"] == ["zstd", "snappy"]
+            assert options["retryReads"] is True
+            assert options["retryWrites"] is True
+
+    def test_no_compressors_by_default(self, mock_config):
+        """Test that compression is only requested when configured."""
+        mock_config.MONGODB_COMPRESSORS = []
+        with patch('app.mongodb_client.MongoClient') as mock_client_class:
+            MongoDBClient(config=mock_config).connect()
+
+            assert "compressors" not in mock_client_class.call_args[1]
+
+    def test_new_client_after_fork(self, mock_config):
+        """Test that a forked process creates its own MongoClient rather than reusing the parent's."""
+        with patch('app.mongodb_client.MongoClient') as mock_client_class:
+            parent_client = MagicMock()
+            child_client = MagicMock()
+            mock_client_class.side_effect = [parent_client, child_client]
+
+            client = MongoDBClient(config=mock_config)
+            with patch('os.getpid', return_value=1000):
+                assert client.client is parent_client
+
+            with patch('os.getpid', return_value=1001):
+                assert client.client is child_client
+                assert client.client is child_client
+
+            assert mock_client_class.call_count == 2
+
+    def test_connection_failure_raised_without_reconnecting(self, mongodb_client, mock_mongodb):
+        """Test that an operation failing with a connection error is re-raised, leaving recovery to the driver."""
+        mock_mongodb['db'].user_data.find_one.side_effect = ConnectionFailure("Lost connection")
 
         with patch.object(mongodb_client, '_connect') as mock_connect:
-            mongodb_client._ensure_connection()
-            mock_connect.assert_called_once()
+            with pytest.raises(ConnectionFailure):
+                mongodb_client.get_user_theme(user_id="test-user-123")
+            mock_connect.assert_not_called()
+
+    def test_operation_duration_observed(self, mongodb_client, mock_mongodb):
+        """Test that each operation's duration is observed under its method name, including failures."""
+        def observed():
+            return REGISTRY.get_sample_value(
+                "bgchat_mongodb_operation_duration_seconds_count", {"operation": "get_user_theme"}
+            ) or 0
+
+        count = observed()
+        mongodb_client.get_user_theme(user_id="test-user-123")
+
+        mock_mongodb['db'].user_data.find_one.side_effect = OperationFailure("Unauthorized")
+        with pytest.raises(OperationFailure):
+            mongodb_client.get_user_theme(user_id="test-user-123")
+
+        assert observed() == count + 2
+
+    def test_operations_do_not_ping(self, mongodb_client, mock_mongodb):
+        """Test that operations make a single round trip rather than pinging first."""
+        mock_mongodb['client'].admin.command.reset_mock()
+        mock_mongodb['db'].messages.find_one.return_value = None
+
+        mongodb_client.get_message_history(user_id="test-user-123", board_game="Wingspan")
+        mongodb_client.get_todays_token_usage(user_id="test-user-123")
+        mongodb_client.get_similar_rulebook_pages(
+            board_game="Wingspan",
+            query_embedding=[0.1] * 1536,
+            limit=5
+        )
+        mongodb_client.append_messages(
+            user_id="test-user-123",
+            board_game="Wingspan",
+            messages=[{"role": "user", "content": "Question"}]
+        )
+
+        # Previously each of these four operations pinged first (eight round trips)
+        mock_mongodb['client'].admin.command.assert_not_called()
+
+
+class TestIndexManagement:
+    """Test index creation and verification."""
+
+    @staticmethod
+    def _set_existing_indexes(mock_mongodb, index_information, search_indexes):
+        mock_mongodb['collection'].index_information.return_value = index_information
+        mock_mongodb['collection'].list_search_indexes.return_value = search_indexes
+
+    def test_verify_indexes_reports_missing(self, mongodb_client, mock_mongodb):
+        """Test that missing indexes are reported."""
+        self._set_existing_indexes(mock_mongodb, {"_id_": {"key": [("_id", 1)]}}, [])
+
+        missing_indexes = mongodb_client.verify_indexes()
+
+        assert len(missing_indexes) == len(MONGODB_INDEXES) + 1
+        assert VECTOR_SEARCH_INDEX_NAME in missing_indexes
+
+    def test_verify_indexes_matches_by_key_pattern(self, mongodb_client, mock_mongodb):
+        """Test that indexes created by hand under a different name are recognised."""
+        index_information = {
+            f"hand_made_{position}": {"key": index["keys"], **index["options"]}
+            for position, index in enumerate(MONGODB_INDEXES)
+        }
+        self._set_existing_indexes(mock_mongodb, index_information, [{"name": VECTOR_SEARCH_INDEX_NAME}])
+
+        assert mongodb_client.verify_indexes() == []
+
+    def test_ensure_indexes_creates_missing(self, mongodb_client, mock_mongodb):
+        """Test that every missing index is created."""
+        self._set_existing_indexes(mock_mongodb, {}, [])
+
+        created_indexes = mongodb_client.ensure_indexes()
+
+        assert len(created_indexes) == len(MONGODB_INDEXES) + 1
+        assert mock_mongodb['collection'].create_index.call_count == len(MONGODB_INDEXES)
+        mock_mongodb['collection'].create_search_index.assert_called_once()
+
+    def test_ensure_indexes_is_idempotent(self, mongodb_client, mock_mongodb):
+        """Test that existing indexes are not recreated."""
+        index_information = {
+            index["options"]["name"]: {"key": index["keys"], **index["options"]}
+            for index in MONGODB_INDEXES
+        }
+        self._set_existing_indexes(mock_mongodb, index_information, [{"name": VECTOR_SEARCH_INDEX_NAME}])
+
+        assert mongodb_client.ensure_indexes() == []
+        mock_mongodb['collection'].create_index.assert_not_called()
+        mock_mongodb['collection'].create_search_index.assert_not_called()
+
+    def test_ensure_indexes_continues_after_failure(self, mongodb_client, mock_mongodb):
+        """Test that one index failing to build doesn't stop the others being created."""
+        self._set_existing_indexes(mock_mongodb, {}, [])
+        mock_mongodb['collection'].create_index.side_effect = (
+            [OperationFailure("duplicate key")] + [None] * (len(MONGODB_INDEXES) - 1)
+        )
+
+        created_indexes = mongodb_client.ensure_indexes()
+
+        assert len(created_indexes) == len(MONGODB_INDEXES)
+        assert mock_mongodb['collection'].create_index.call_count == len(MONGODB_INDEXES)
 
 
 class TestMessageOperations:
@@ -91,6 +252,7 @@ class TestMessageOperations:
 
     def test_append_messages(self, mongodb_client, mock_mongodb):
         """Test appending messages to user history."""
+        mock_mongodb['db'].messages.find_one.return_value = {"seq": 3}
         messages = [
             {"role": "user", "content": "Test question"},
             {"role": "assistant", "content": "Test answer"},
@@ -102,25 +264,54 @@ class TestMessageOperations:
             messages=messages
         )
 
-        # Verify update_one was called with correct parameters
-        mock_mongodb['db'].user_data.update_one.assert_called_once()
-        call_args = mock_mongodb['db'].user_data.update_one.call_args
+        # Verify each message was stored as its own document, numbered after the last one
+        mock_mongodb['db'].messages.insert_many.assert_called_once()
+        stored_messages = mock_mongodb['db'].messages.insert_many.call_args[0][0]
+
+        assert [message["seq"] for message in stored_messages] == [4, 5]
+        assert stored_messages[0]["user_id"] == "test-user-123"
+        assert stored_messages[0]["board_game"] == "Wingspan"
+        assert stored_messages[1]["content"] == "Test answer"
 
+        # Verify the user document is no longer used to store messages
+        call_args = mock_mongodb['db'].user_data.update_one.call_args
         assert call_args[0][0] == {"user_id": "test-user-123"}
-        assert "$push" in call_args[0][1]
-        assert "messages.Wingspan" in call_args[0][1]["$push"]
+        assert "$push" not in call_args[0][1]
+
+    def test_append_messages_first_message(self, mongodb_client, mock_mongodb):
+        """Test that the first message in a conversation has sequence number 0."""
+        mock_mongodb['db'].messages.find_one.return_value = None
+
+        mongodb_client.append_messages(
+            user_id="test-user-123",
+            board_game="Wingspan",
+            messages=[{"role": "user", "content": "Test question"}]
+        )
+
+        stored_messages = mock_mongodb['db'].messages.insert_many.call_args[0][0]
+        assert stored_messages[0]["seq"] == 0
+
+    def test_append_messages_retries_on_sequence_conflict(self, mongodb_client, mock_mongodb):
+        """Test that a concurrent append is retried with a fresh sequence number."""
+        mock_mongodb['db'].messages.find_one.side_effect = [{"seq": 1}, {"seq": 3}]
+        mock_mongodb['db'].messages.insert_many.side_effect = [DuplicateKeyError("duplicate"), None]
+
+        mongodb_client.append_messages(
+            user_id="test-user-123",
+            board_game="Wingspan",
+            messages=[{"role": "user", "content": "Test question"}]
+        )
+
+        assert mock_mongodb['db'].messages.insert_many.call_count == 2
+        stored_messages = mock_mongodb['db'].messages.insert_many.call_args[0][0]
+        assert stored_messages[0]["seq"] == 4
 
     def test_get_message_history_exists(self, mongodb_client, mock_mongodb):
         """Test retrieving existing message history."""
-        mock_result = {
-            "messages": {
-                "Wingspan": [
-                    {"role": "user", "content": "Question"},
-                    {"role": "assistant", "content": "Answer"},
-                ]
-            }
-        }
-        mock_mongodb['db'].user_data.find_one.return_value = mock_result
+        mock_mongodb['db'].messages.find.return_value.sort.return_value = [
+            {"role": "user", "content": "Question"},
+            {"role": "assistant", "content": "Answer"},
+        ]
 
         result = mongodb_client.get_message_history(
             user_id="test-user-123",
@@ -129,10 +320,60 @@ class TestMessageOperations:
 
         assert len(result) == 2
         assert result[0]["role"] == "user"
+        call_args = mock_mongodb['db'].messages.find.call_args
+        assert call_args[0][0] == {"user_id": "test-user-123", "board_game": "Wingspan"}
+
+    def test_get_message_history_paginated(self, mongodb_client, mock_mongodb):
+        """Test retrieving the most recent page of messages before a cursor."""
+        mock_mongodb['db'].messages.find.return_value.sort.return_value = [
+            {"seq": seq, "role": "user", "content": f"Message {seq}"}
+            for seq in range(12)
+        ]
+
+        result = mongodb_client.get_message_history(
+            user_id="test-user-123",
+            board_game="Wingspan",
+            limit=2,
+            before=10
+        )
+
+        assert [message["seq"] for message in result] == [8, 9]
+
+    def test_get_message_history_since(self, mongodb_client, mock_mongodb):
+        """Test retrieving only the messages a client doesn't already have."""
+        mock_mongodb['db'].messages.find.return_value.sort.return_value = [
+            {"seq": seq, "role": "user", "content": f"Message {seq}"}
+            for seq in range(5)
+        ]
+
+        result = mongodb_client.get_message_history(
+            user_id="test-user-123",
+            board_game="Wingspan",
+            since=4
+        )
+
+        assert [message["seq"] for message in result] == [4]
+
+    def test_get_recent_messages_fills_cache(self, mongodb_client, mock_mongodb):
+        """Test that reading the recent turns caches the conversation, so the next question's read is free."""
+        mock_mongodb['db'].messages.find.return_value.sort.return_value = [
+            {"seq": seq, "role": "user", "content": f"Message {seq}"}
+            for seq in range(10)
+        ]
+
+        first = mongodb_client.get_recent_messages("test-user-123", "Wingspan", 2)
+        second = mongodb_client.get_recent_messages("test-user-123", "Wingspan", 2)
+
+        assert [message["seq"] for message in first] == [8, 9]
+        assert second == first
+        mock_mongodb['db'].messages.find.assert_called_once()
+        assert mock_mongodb['db'].messages.find.call_args[0][0] == {
+            "user_id": "test-user-123", "board_game": "Wingspan"
+        }
 
     def test_get_message_history_not_exists(self, mongodb_client, mock_mongodb):
         """Test retrieving message history for non-existent user."""
-        mock_mongodb['db'].user_data.find_one.return_value = None
+        mock_mongodb['db'].messages.find.return_value.sort.return_value = []
 
         result = mongodb_client.get_message_history(
             user_id="nonexistent-user",
@@ -152,10 +393,10 @@ class TestMessageOperations:
             board_game="Wingspan"
         )
 
-        mock_mongodb['db'].user_data.update_one.assert_called_once()
-        call_args = mock_mongodb['db'].user_data.update_one.call_args
-        assert "messages.Wingspan" in call_args[0][1]["$set"]
-        assert call_args[0][1]["$set"]["messages.Wingspan"] == []
+        mock_mongodb['db'].messages.delete_many.assert_called_once_with({
+            "user_id": "test-user-123",
+            "board_game": "Wingspan"
+        })
 
     def test_delete_messages_from_index(self, mongodb_client, mock_mongodb):
         """Test deleting messages from specific index."""
@@ -169,10 +410,319 @@ class TestMessageOperations:
             index=5
         )
 
+        mock_mongodb['db'].messages.delete_many.assert_called_once_with({
+            "user_id": "test-user-123",
+            "board_game": "Wingspan",
+            "seq": {"$gte": 5}
+        })
+
+    def test_migrate_embedded_messages(self, mongodb_client, mock_mongodb):
+        """Test moving embedded message arrays into the messages collection."""
+        mock_mongodb['db'].user_data.find.return_value = [
+            {
+                "_id": "doc-1",
+                "user_id": "test-user-123",
+                "messages": {
+                    "Wingspan": [
+                        {"role": "user", "content": "Question"},
+                        {"role": "assistant", "content": "Answer"},
+                    ],
+                    "Root": [],
+                }
+            }
+        ]
+
+        migrated_conversations = mongodb_client.migrate_embedded_messages()
+
+        assert migrated_conversations == 2
+        mock_mongodb['db'].messages.bulk_write.assert_called_once()
+        operations = mock_mongodb['db'].messages.bulk_write.call_args[0][0]
+        assert len(operations) == 2
+        mock_mongodb['db'].user_data.update_one.assert_called_once_with(
+            {"_id": "doc-1"},
+            {"$unset": {"messages": ""}}
+        )
+
+
+    def test_migrate_keeps_conflicting_embedded_messages(self, mongodb_client, mock_mongodb):
+        """Test that a conversation already in the messages collection is neither overwritten nor unset."""
+        mock_mongodb['db'].user_data.find.return_value = [
+            {
+                "_id": "doc-1",
+                "user_id": "test-user-123",
+                "messages": {
+                    "Wingspan": [{"role": "user", "content": "Old question"}],
+                    "Root": [{"role": "user", "content": "Question"}],
+                }
+            }
+        ]
+
+        def find_stored_messages(query, projection):
+            if query["board_game"] == "Wingspan":
+                return [{"seq": 0, "role": "user", "content": "New question"}]
+            return []
+
+        mock_mongodb['db'].messages.find.side_effect = find_stored_messages
+
+        migrated_conversations = mongodb_client.migrate_embedded_messages()
+
+        assert migrated_conversations == 1
+        mock_mongodb['db'].messages.bulk_write.assert_called_once()
+        [operation] = mock_mongodb['db'].messages.bulk_write.call_args[0][0]
+        assert operation._filter["board_game"] == "Root"
+        mock_mongodb['db'].user_data.update_one.assert_called_once_with(
+            {"_id": "doc-1"},
+            {"$unset": {"messages.Root": ""}}
+        )
+
+    def test_migrate_resumes_partly_migrated_conversation(self, mongodb_client, mock_mongodb):
+        """Test that a conversation whose stored messages are a prefix of the embedded ones is migrated."""
+        embedded_messages = [
+            {"role": "user", "content": "Question"},
+            {"role": "assistant", "content": "Answer"},
+        ]
+        mock_mongodb['db'].user_data.find.return_value = [
+            {"_id": "doc-1", "user_id": "test-user-123", "messages": {"Wingspan": embedded_messages}}
+        ]
+        mock_mongodb['db'].messages.find.return_value = [{"seq": 0, **embedded_messages[0]}]
+
+        migrated_conversations = mongodb_client.migrate_embedded_messages()
+
+        assert migrated_conversations == 1
+        mock_mongodb['db'].user_data.update_one.assert_called_once_with(
+            {"_id": "doc-1"},
+            {"$unset": {"messages": ""}}
+        )
+
+
+class TestConversationCache:
+    """Test the in-process conversation cache."""
+
+    @staticmethod
+    def _set_stored_history(mock_mongodb, messages):
+        mock_mongodb['db'].messages.find.return_value.sort.return_value = messages
+
+    def test_full_history_is_cached(self, mongodb_client, mock_mongodb):
+        """Test that a conversation is only read from the database once."""
+        self._set_stored_history(mock_mongodb, [{"seq": 0, "role": "user", "content": "Question"}])
+
+        first = mongodb_client.get_message_history(user_id="test-user-123", board_game="Wingspan")
+        second = mongodb_client.get_message_history(user_id="test-user-123", board_game="Wingspan")
+
+        assert first == second
+        mock_mongodb['db'].messages.find.assert_called_once()
+        assert mongodb_client.get_cache_stats()["conversations"]["hits"] == 1
+
+    def test_pages_served_from_cache(self, mongodb_client, mock_mongodb):
+        """Test that paginated requests for a cached conversation don't query the database."""
+        self._set_stored_history(mock_mongodb, [
+            {"seq": seq, "role": "user", "content": f"Message {seq}"}
+            for seq in range(10)
+        ])
+        mongodb_client.get_message_history(user_id="test-user-123", board_game="Wingspan")
+
+        page = mongodb_client.get_message_history(
+            user_id="test-user-123", board_game="Wingspan", limit=3, before=8
+        )
+        new_messages = mongodb_client.get_message_history(
+            user_id="test-user-123", board_game="Wingspan", since=8
+        )
+
+        assert [message["seq"] for message in page] == [5, 6, 7]
+        assert [message["seq"] for message in new_messages] == [8, 9]
+        mock_mongodb['db'].messages.find.assert_called_once()
+
+    def test_append_writes_through(self, mongodb_client, mock_mongodb):
+        """Test that appended messages are added to a cached conversation that is up to date."""
+        self._set_stored_history(mock_mongodb, [{"seq": 0, "role": "user", "content": "Question"}])
+        mongodb_client.get_message_history(user_id="test-user-123", board_game="Wingspan")
+        mock_mongodb['db'].messages.find_one.return_value = {"seq": 0}
+
+        mongodb_client.append_messages(
+            user_id="test-user-123",
+            board_game="Wingspan",
+            messages=[{"role": "assistant", "content": "Answer"}]
+        )
+        result = mongodb_client.get_message_history(user_id="test-user-123", board_game="Wingspan")
+
+        assert mock_mongodb['db'].messages.insert_many.call_args[0][0][0]["seq"] == 1
+        # Only the two reads count as lookups, not the write-through
+        assert mongodb_client.get_cache_stats()["conversations"]["hits"] == 1
+        assert mongodb_client.get_cache_stats()["conversations"]["misses"] == 1
+        assert result == [
+            {"seq": 0, "role": "user", "content": "Question"},
+            {"seq": 1, "role": "assistant", "content": "Answer"},
+        ]
+        mock_mongodb['db'].messages.find.assert_called_once()
+
+    def test_next_seq_read_from_database_not_stale_cache(self, mongodb_client, mock_mongodb):
+        """Test that a conversation truncated by another process is appended to where the database ends."""
+        self._set_stored_history(mock_mongodb, [
+            {"seq": seq, "role": "user", "content": f"Message {seq}"}
+            for seq in range(3)
+        ])
+        mongodb_client.get_message_history(user_id="test-user-123", board_game="Wingspan")
+        # Another worker deleted every message from index 1, without this one hearing about it yet
+        mock_mongodb['db'].messages.find_one.return_value = {"seq": 0}
+
+        mongodb_client.append_messages(
+            user_id="test-user-123",
+            board_game="Wingspan",
+            messages=[{"role": "user", "content": "Edited question"}]
+        )
+        mongodb_client.get_message_history(user_id="test-user-123", board_game="Wingspan")
+
+        assert mock_mongodb['db'].messages.insert_many.call_args[0][0][0]["seq"] == 1
+        assert mock_mongodb['db'].messages.find.call_count == 2
+
+    def test_cached_pages_bounded_by_seq(self, mongodb_client, mock_mongodb):
+        """Test that cached pages match messages by seq, as the database query does, even with gaps."""
+        self._set_stored_history(mock_mongodb, [
+            {"seq": seq, "role": "user", "content": f"Message {seq}"}
+            for seq in (0, 1, 5, 6)
+        ])
+        mongodb_client.get_message_history(user_id="test-user-123", board_game="Wingspan")
+
+        page = mongodb_client.get_message_history(
+            user_id="test-user-123", board_game="Wingspan", limit=2, before=6
+        )
+        new_messages = mongodb_client.get_message_history(
+            user_id="test-user-123", board_game="Wingspan", since=2
+        )
+
+        assert [message["seq"] for message in page] == [1, 5]
+        assert [message["seq"] for message in new_messages] == [5, 6]
+
+    def test_sequence_conflict_invalidates_cache(self, mongodb_client, mock_mongodb):
+        """Test that a stale cached conversation is dropped when another worker has appended to it."""
+        self._set_stored_history(mock_mongodb, [{"seq": 0, "role": "user", "content": "Question"}])
+        mongodb_client.get_message_history(user_id="test-user-123", board_game="Wingspan")
+        mock_mongodb['db'].messages.find_one.return_value = {"seq": 2}
+        mock_mongodb['db'].messages.insert_many.side_effect = [DuplicateKeyError("duplicate"), None]
+
+        mongodb_client.append_messages(
+            user_id="test-user-123",
+            board_game="Wingspan",
+            messages=[{"role": "user", "content": "Another question"}]
+        )
+        mongodb_client.get_message_history(user_id="test-user-123", board_game="Wingspan")
+
+        assert mock_mongodb['db'].messages.insert_many.call_args[0][0][0]["seq"] == 3
+        assert mock_mongodb['db'].messages.find.call_count == 2
+
+    def test_delete_and_clear_invalidate(self, mongodb_client, mock_mongodb):
+        """Test that deleting or clearing messages invalidates the cached conversation."""
+        mock_result = Mock()
+        mock_result.matched_count = 1
+        mock_mongodb['db'].user_data.update_one.return_value = mock_result
+        self._set_stored_history(mock_mongodb, [{"seq": 0, "role": "user", "content": "Question"}])
+
+        mongodb_client.get_message_history(user_id="test-user-123", board_game="Wingspan")
+        mongodb_client.delete_messages_from_index(user_id="test-user-123", board_game="Wingspan", index=0)
+        mongodb_client.get_message_history(user_id="test-user-123", board_game="Wingspan")
+        mongodb_client.clear_message_history(user_id="test-user-123", board_game="Wingspan")
+        mongodb_client.get_message_history(user_id="test-user-123", board_game="Wingspan")
+
+        assert mock_mongodb['db'].messages.find.call_count == 3
+
+    def test_remote_invalidation_drops_user_conversations(self, mongodb_client, mock_mongodb):
+        """Test that a user invalidation from another process drops that user's cached conversations only."""
+        self._set_stored_history(mock_mongodb, [{"seq": 0, "role": "user", "content": "Question"}])
+        mongodb_client.get_message_history(user_id="test-user-123", board_game="Wingspan")
+        mongodb_client.get_message_history(user_id="test-user-456", board_game="Wingspan")
+
+        mongodb_client.invalidation_bus._handle_event(
+            {"_id": "event-1", "topic": "user:test-user-123", "source": "another-process"}
+        )
+        mongodb_client.get_message_history(user_id="test-user-123", board_game="Wingspan")
+        mongodb_client.get_message_history(user_id="test-user-456", board_game="Wingspan")
+
+        assert mock_mongodb['db'].messages.find.call_count == 3
+
+    def test_writes_publish_invalidations(self, mongodb_client, mock_mongodb):
+        """Test that writes tell other processes which cached data is stale."""
+        mongodb_client.invalidation_bus = Mock()
+        mock_mongodb['db'].messages.find_one.return_value = None
+
+        mongodb_client.record_turn(
+            user_id="test-user-123",
+            model_token_usages={"gpt-4o-mini": {"input_tokens": 100}},
+            board_game="Wingspan",
+            messages=[{"role": "user", "content": "Question"}],
+        )
+        mongodb_client.upsert_board_game("Wingspan", [{"name": "Rulebook", "page_count": 12}])
+
+        mongodb_client.invalidation_bus.publish.assert_any_call("user", "test-user-123")
+        mongodb_client.invalidation_bus.publish.assert_any_call("catalog")
+
+
+class TestLastActiveDebouncing:
+    """Test that last_active is written at most once per debounce window per user."""
+
+    def test_repeated_writes_touch_user_once(self, mongodb_client, mock_mongodb):
+        """Test that consecutive turns only write the user document the first time."""
+        for _ in range(3):
+            mongodb_client.record_turn(
+                user_id="test-user-123",
+                model_token_usages={"gpt-4o-mini": {"input_tokens": 100}},
+            )
+
+        assert mock_mongodb['db'].token_usage.update_one.call_count == 3
         mock_mongodb['db'].user_data.update_one.assert_called_once()
-        call_args = mock_mongodb['db'].user_data.update_one.call_args
-        assert "$push" in call_args[0][1]
-        assert "$slice" in call_args[0][1]["$push"]["messages.Wingspan"]
+
+    def test_users_are_debounced_separately(self, mongodb_client, mock_mongodb):
+        """Test that debouncing one user doesn't skip writes for another."""
+        for user_id in ["test-user-123", "test-user-456", "test-user-123"]:
+            mongodb_client.record_turn(
+                user_id=user_id,
+                model_token_usages={"gpt-4o-mini": {"input_tokens": 100}},
+            )
+
+        assert mock_mongodb['db'].user_data.update_one.call_count == 2
+
+    @patch('time.monotonic')
+    def test_touches_user_again_after_window(self, mock_monotonic, mongodb_client, mock_mongodb):
+        """Test that last_active is written again once the debounce window has passed."""
+        mock_monotonic.return_value = 0
+        mongodb_client.record_turn(user_id="test-user-123", model_token_usages={})
+
+        mock_monotonic.return_value = LAST_ACTIVE_DEBOUNCE_SECONDS
+        mongodb_client.record_turn(user_id="test-user-123", model_token_usages={})
+
+        assert mock_mongodb['db'].user_data.update_one.call_count == 2
+
+    def test_theme_write_counts_as_touch(self, mongodb_client, mock_mongodb):
+        """Test that saving a theme piggybacks last_active so the next turn skips it."""
+        mongodb_client.set_user_theme(user_id="test-user-123", theme=1)
+        mongodb_client.record_turn(user_id="test-user-123", model_token_usages={})
+
+        mock_mongodb['db'].user_data.update_one.assert_called_once()
+        assert "last_active" in mock_mongodb['db'].user_data.update_one.call_args[0][1]["$set"]
+
+    def test_recently_active_user_skips_existence_check(self, mongodb_client, mock_mongodb):
+        """Test that clearing history for a recently active user doesn't re-check the user document."""
+        mongodb_client.record_turn(user_id="test-user-123", model_token_usages={})
+        mock_mongodb['db'].user_data.update_one.reset_mock()
+
+        mongodb_client.clear_message_history(user_id="test-user-123", board_game="Wingspan")
+
+        mock_mongodb['db'].user_data.update_one.assert_not_called()
+        mock_mongodb['db'].messages.delete_many.assert_called_once()
+
+    def test_unknown_user_still_raises(self, mongodb_client, mock_mongodb):
+        """Test that deleting messages for an unknown user still fails."""
+        mock_result = Mock()
+        mock_result.matched_count = 0
+        mock_mongodb['db'].user_data.update_one.return_value = mock_result
+
+        with pytest.raises(ValueError):
+            mongodb_client.delete_messages_from_index(
+                user_id="unknown-user",
+                board_game="Wingspan",
+                index=0
+            )
+
+        mock_mongodb['db'].messages.delete_many.assert_not_called()
 
 
 class TestRulebookOperations:
@@ -243,13 +793,54 @@ class TestRulebookOperations:
         mock_mongodb['db'].rulebook_pages.aggregate.assert_called_once()
 
     def test_get_all_board_games(self, mongodb_client, mock_mongodb):
-        """Test retrieving all board game names."""
-        mock_games = ["Wingspan", "Azul", "Catan"]
-        mock_mongodb['db'].rulebook_pages.distinct.return_value = mock_games
+        """Test retrieving all board game names from the catalog."""
+        mock_mongodb['db'].board_games.find.return_value.sort.return_value = [
+            {"name": "Azul", "rulebooks": [], "page_count": 12, "version": 1},
+            {"name": "Wingspan", "rulebooks": [], "page_count": 20, "version": 3},
+        ]
 
         result = mongodb_client.get_all_board_games()
 
-        assert result == sorted(mock_games)
+        assert result == ["Azul", "Wingspan"]
+        mock_mongodb['db'].rulebook_pages.distinct.assert_not_called()
+
+    def test_get_board_game_catalog_falls_back_to_rulebook_pages(self, mongodb_client, mock_mongodb):
+        """Test that an empty catalog falls back to the board games in rulebook_pages."""
+        mock_mongodb['db'].board_games.find.return_value.sort.return_value = []
+        mock_mongodb['db'].rulebook_pages.distinct.return_value = ["Wingspan", "Azul"]
+
+        result = mongodb_client.get_board_game_catalog()
+
+        assert [board_game["name"] for board_game in result] == ["Azul", "Wingspan"]
+
+    def test_upsert_board_game(self, mongodb_client, mock_mongodb):
+        """Test that ingestion updates a board game's catalog entry and bumps its version."""
+        mongodb_client.upsert_board_game(
+            "Wingspan",
+            [{"name": "Rulebook", "page_count": 12}, {"name": "Appendix", "page_count": 8}],
+        )
+
+        call_args = mock_mongodb['db'].board_games.update_one.call_args
+        assert call_args[0][0] == {"name": "Wingspan"}
+        assert call_args[0][1]["$set"]["page_count"] == 20
+        assert call_args[0][1]["$inc"] == {"version": 1}
+        assert call_args[1]["upsert"] is True
+
+    def test_rebuild_board_game_catalog(self, mongodb_client, mock_mongodb):
+        """Test rebuilding the catalog from stored rulebook pages."""
+        mock_mongodb['db'].rulebook_pages.aggregate.return_value = [
+            {"_id": {"board_game": "Wingspan", "rulebook_name": "Appendix"}, "page_count": 8},
+            {"_id": {"board_game": "Wingspan", "rulebook_name": "Rulebook"}, "page_count": 12},
+            {"_id": {"board_game": "Azul", "rulebook_name": "Rules"}, "page_count": 4},
+        ]
+
+        result = mongodb_client.rebuild_board_game_catalog()
+
+        assert result == 2
+        assert mock_mongodb['db'].board_games.update_one.call_count == 2
+        mock_mongodb['db'].board_games.delete_many.assert_called_once_with(
+            {"name": {"$nin": ["Wingspan", "Azul"]}}
+        )
 
 
 class TestTokenUsageOperations:
@@ -265,41 +856,134 @@ class TestTokenUsageOperations:
             web_searches=1
         )
 
+        today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+        mock_mongodb['db'].token_usage.update_one.assert_called_once()
+        call_args = mock_mongodb['db'].token_usage.update_one.call_args
+
+        assert call_args[0][0] == {"user_id": "test-user-123", "date": today}
+        assert call_args[0][1]["$inc"] == {
+            "usage.gpt-4o-mini.input_tokens": 100,
+            "usage.gpt-4o-mini.output_tokens": 50,
+            "usage.gpt-4o-mini.web_searches": 1,
+        }
+        assert "created_at" in call_args[0][1]["$setOnInsert"]
+
+        # Verify usage is no longer accumulated on the user document
+        user_data_update = mock_mongodb['db'].user_data.update_one.call_args[0][1]
+        assert "$inc" not in user_data_update
+
+    def test_record_turn(self, mongodb_client, mock_mongodb):
+        """Test that messages and usage for several models are recorded with one write per collection."""
+        mock_mongodb['db'].messages.find_one.return_value = None
+
+        mongodb_client.record_turn(
+            user_id="test-user-123",
+            model_token_usages={
+                "text-embedding-ada-002": {"input_tokens": 10},
+                "gpt-4o-mini": {"input_tokens": 100, "output_tokens": 50, "web_searches": 0},
+            },
+            board_game="Wingspan",
+            messages=[
+                {"role": "user", "content": "Test question"},
+                {"role": "assistant", "content": "Test answer"},
+            ],
+        )
+
+        mock_mongodb['db'].messages.insert_many.assert_called_once()
+        mock_mongodb['db'].token_usage.update_one.assert_called_once()
         mock_mongodb['db'].user_data.update_one.assert_called_once()
-        call_args = mock_mongodb['db'].user_data.update_one.call_args
+        assert mock_mongodb['db'].token_usage.update_one.call_args[0][1]["$inc"] == {
+            "usage.text-embedding-ada-002.input_tokens": 10,
+            "usage.gpt-4o-mini.input_tokens": 100,
+            "usage.gpt-4o-mini.output_tokens": 50,
+        }
 
-        assert call_args[0][0] == {"user_id": "test-user-123"}
-        assert "$inc" in call_args[0][1]
+    def test_record_turn_without_messages(self, mongodb_client, mock_mongodb):
+        """Test that usage can be recorded without storing any messages."""
+        mongodb_client.record_turn(
+            user_id="test-user-123",
+            model_token_usages={"gpt-4o-mini": {"input_tokens": 100, "output_tokens": 5}},
+        )
+
+        mock_mongodb['db'].messages.insert_many.assert_not_called()
+        mock_mongodb['db'].token_usage.update_one.assert_called_once()
 
     def test_get_todays_token_usage_exists(self, mongodb_client, mock_mongodb):
         """Test retrieving token usage for today."""
         today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
         mock_result = {
-            "token_usage": {
-                today: {
-                    "gpt-4o-mini": {
-                        "input_tokens": 1000,
-                        "output_tokens": 500,
-                        "web_searches": 2
-                    }
+            "usage": {
+                "gpt-4o-mini": {
+                    "input_tokens": 1000,
+                    "output_tokens": 500,
+                    "web_searches": 2
                 }
             }
         }
-        mock_mongodb['db'].user_data.find_one.return_value = mock_result
+        mock_mongodb['db'].token_usage.find_one.return_value = mock_result
 
         result = mongodb_client.get_todays_token_usage(user_id="test-user-123")
 
         assert "gpt-4o-mini" in result
         assert result["gpt-4o-mini"]["input_tokens"] == 1000
+        call_args = mock_mongodb['db'].token_usage.find_one.call_args
+        assert call_args[0][0] == {"user_id": "test-user-123", "date": today}
 
     def test_get_todays_token_usage_not_exists(self, mongodb_client, mock_mongodb):
         """Test retrieving token usage for user with no data."""
-        mock_mongodb['db'].user_data.find_one.return_value = None
+        mock_mongodb['db'].token_usage.find_one.return_value = None
 
         result = mongodb_client.get_todays_token_usage(user_id="nonexistent-user")
 
         assert result == {}
 
+    def test_migrate_embedded_token_usage(self, mongodb_client, mock_mongodb):
+        """Test moving embedded daily usage into the token_usage collection."""
+        usage = {"gpt-4o-mini": {"input_tokens": 10, "output_tokens": 5}}
+        mock_mongodb['db'].user_data.find.return_value = [
+            {
+                "_id": "doc-1",
+                "user_id": "test-user-123",
+                "token_usage": {"2025-01-01": usage, "2025-01-02": usage},
+            }
+        ]
+
+        migrated_days = mongodb_client.migrate_embedded_token_usage()
+
+        assert migrated_days == 2
+        first_upsert = mock_mongodb['db'].token_usage.update_one.call_args_list[0]
+        assert first_upsert[0][0] == {
+            "user_id": "test-user-123", "date": "2025-01-01", "migrated_embedded_usage": {"$ne": True}
+        }
+        assert first_upsert[0][1]["$inc"] == {
+            "usage.gpt-4o-mini.input_tokens": 10,
+            "usage.gpt-4o-mini.output_tokens": 5,
+        }
+        assert first_upsert[0][1]["$set"] == {"migrated_embedded_usage": True}
+        assert first_upsert[0][1]["$setOnInsert"]["created_at"] == datetime(2025, 1, 1, tzinfo=timezone.utc)
+        assert first_upsert[1]["upsert"] is True
+        mock_mongodb['db'].user_data.update_one.assert_called_once_with(
+            {"_id": "doc-1"},
+            {"$unset": {"token_usage": ""}}
+        )
+
+    def test_migrate_skips_days_already_migrated(self, mongodb_client, mock_mongodb):
+        """Test that re-running the migration doesn't add a day's embedded usage twice."""
+        usage = {"gpt-4o-mini": {"input_tokens": 10}}
+        mock_mongodb['db'].user_data.find.return_value = [
+            {"_id": "doc-1", "user_id": "test-user-123", "token_usage": {"2025-01-01": usage}}
+        ]
+        # The day's document is marked as migrated, so the upsert tries to insert a duplicate
+        mock_mongodb['db'].token_usage.update_one.side_effect = DuplicateKeyError("duplicate key")
+
+        migrated_days = mongodb_client.migrate_embedded_token_usage()
+
+        assert migrated_days == 0
+        mock_mongodb['db'].user_data.update_one.assert_called_once_with(
+            {"_id": "doc-1"},
+            {"$unset": {"token_usage": ""}}
+        )
+
 
 class TestUserDataOperations:
     """Test user data operations."""
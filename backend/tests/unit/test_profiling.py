@@ -0,0 +1,133 @@
+"""
+Unit tests for per-request CPU profiling.
+"""
+import time
+from unittest.mock import patch
+
+import pytest
+from flask import Flask, Response
+
+from app.profiling import (
+    PROFILE_FILE_HEADER,
+    PROFILE_TOKEN_HEADER,
+    configure_profiling,
+    end_request_profile,
+    start_request_profile,
+)
+
+PROFILING_TOKEN = "test-profiling-token-at-least-32-chars"
+
+
+def burn_cpu(seconds: float = 0.05) -> None:
+    """Keep the CPU busy for a while, so the sampler has something to see."""
+    started_at = time.thread_time()
+    while time.thread_time() - started_at < seconds:
+        pass
+
+
+@pytest.fixture
+def output_dir(tmp_path):
+    return tmp_path / "profiles"
+
+
+@pytest.fixture
+def configure(output_dir):
+    """Turn profiling on with the given sample rate for one test, and off again afterwards."""
+    def configure(sample_rate: float = 0.0):
+        configure_profiling(str(output_dir), sample_rate=sample_rate, token=PROFILING_TOKEN)
+
+    yield configure
+    configure_profiling(None, sample_rate=0, token=None)
+
+
+@pytest.fixture
+def profiled_app():
+    """A minimal app with the profiling hooks, whose routes use CPU before and while streaming."""
+    app = Flask(__name__)
+    app.before_request(start_request_profile)
+    app.after_request(end_request_profile)
+
+    @app.route("/busy")
+    def busy():
+        burn_cpu()
+        return "done"
+
+    @app.route("/stream")
+    def stream():
+        def generate():
+            yield "An "
+            burn_cpu()
+            yield "answer"
+
+        return Response(generate(), mimetype="text/event-stream")
+
+    return app
+
+
+def _read_profile(path) -> dict[str, int]:
+    """Get the CPU microseconds recorded for each stack in a collapsed stack profile."""
+    stacks = {}
+    for line in path.read_text().splitlines():
+        stack, _, cpu_microseconds = line.rpartition(" ")
+        stacks[stack] = int(cpu_microseconds)
+    return stacks
+
+
+class TestRequestProfiling:
+    """Test choosing requests to profile and writing their profiles."""
+
+    def test_requested_profile_written(self, configure, output_dir, profiled_app):
+        """Test that a request sending the token is profiled, and told where its profile is."""
+        configure()
+
+        response = profiled_app.test_client().get("/busy", headers={PROFILE_TOKEN_HEADER: PROFILING_TOKEN})
+
+        profile_filename = response.headers[PROFILE_FILE_HEADER]
+        profile = _read_profile(output_dir / profile_filename)
+        assert "-get-busy-" in profile_filename
+        assert any("burn_cpu" in stack for stack in profile)
+        assert sum(profile.values()) > 0
+
+    def test_wrong_token_not_profiled(self, configure, output_dir, profiled_app):
+        """Test that requests without the right token aren't profiled."""
+        configure()
+
+        response = profiled_app.test_client().get("/busy", headers={PROFILE_TOKEN_HEADER: "not-the-token"})
+
+        assert PROFILE_FILE_HEADER not in response.headers
+        assert list(output_dir.iterdir()) == []
+
+    def test_stream_profiled_until_closed(self, configure, output_dir, profiled_app):
+        """Test that a streamed response is profiled for its whole life, and written once it closes."""
+        configure()
+
+        response = profiled_app.test_client().get(
+            "/stream", headers={PROFILE_TOKEN_HEADER: PROFILING_TOKEN}, buffered=False
+        )
+        profile_path = output_dir / response.headers[PROFILE_FILE_HEADER]
+        assert not profile_path.exists()
+
+        assert response.get_data() == b"An answer"
+        response.close()
+
+        assert any("generate" in stack and "burn_cpu" in stack for stack in _read_profile(profile_path))
+
+    def test_sampled_requests_profiled(self, configure, output_dir, profiled_app):
+        """Test that sampled requests are profiled without the token, but not told where the profile is."""
+        configure(sample_rate=1.0)
+
+        response = profiled_app.test_client().get("/busy")
+
+        assert PROFILE_FILE_HEADER not in response.headers
+        assert len(list(output_dir.iterdir())) == 1
+
+    def test_concurrent_profiles_capped(self, configure, output_dir, profiled_app):
+        """Test that a request isn't profiled while the worker is already profiling its maximum."""
+        configure()
+
+        with patch("app.profiling._profiling_slots.acquire", return_value=False):
+            response = profiled_app.test_client().get("/busy", headers={PROFILE_TOKEN_HEADER: PROFILING_TOKEN})
+
+        assert response.status_code == 200
+        assert PROFILE_FILE_HEADER not in response.headers
+        assert list(output_dir.iterdir()) == []
@@ -0,0 +1,145 @@
+"""
+Unit tests for the SQLite rate limit storage shared between worker processes.
+"""
+import multiprocessing
+from unittest.mock import patch
+
+import pytest
+from limits import RateLimitItemPerMinute
+from limits.storage import storage_from_string
+from limits.strategies import FixedWindowRateLimiter, SlidingWindowCounterRateLimiter
+
+from app.utils.rate_limit_storage import SQLiteStorage
+
+
+@pytest.fixture
+def storage_uri(tmp_path):
+    return f"sqlite:///{tmp_path / 'rate-limits.db'}"
+
+
+@pytest.fixture
+def storage(storage_uri):
+    return SQLiteStorage(storage_uri)
+
+
+def _hit_fixed_window(storage_uri, hits, results):
+    limiter = FixedWindowRateLimiter(SQLiteStorage(storage_uri))
+    limit = RateLimitItemPerMinute(50)
+    results.put(sum(limiter.hit(limit, "client") for _ in range(hits)))
+
+
+class TestSQLiteStorage:
+    """Test SQLite rate limit storage behaviour."""
+
+    def test_registered_as_sqlite_scheme(self, storage_uri):
+        """Test that sqlite:// URIs create a SQLite storage."""
+        storage = storage_from_string(storage_uri)
+
+        assert isinstance(storage, SQLiteStorage)
+        assert storage.check()
+
+    def test_requires_database_path(self):
+        """Test that a URI without a database path is rejected."""
+        with pytest.raises(ValueError):
+            SQLiteStorage("sqlite:///")
+
+    def test_incr_and_get(self, storage):
+        """Test that increments accumulate within a window."""
+        assert storage.incr("key", 60) == 1
+        assert storage.incr("key", 60, amount=2) == 3
+        assert storage.get("key") == 3
+        assert storage.get("other") == 0
+
+    @patch('app.utils.rate_limit_storage.time.time')
+    def test_counters_expire(self, mock_time, storage):
+        """Test that a counter resets once its window has expired."""
+        mock_time.return_value = 1000.0
+        storage.incr("key", 60)
+        storage.incr("key", 60)
+        assert storage.get_expiry("key") == 1060.0
+
+        mock_time.return_value = 1059.0
+        assert storage.get("key") == 2
+
+        mock_time.return_value = 1060.0
+        assert storage.get("key") == 0
+        assert storage.get_expiry("key") == 1060.0
+        assert storage.incr("key", 60) == 1
+        assert storage.get_expiry("key") == 1120.0
+
+    @patch('app.utils.rate_limit_storage.RATE_LIMIT_STORAGE_PURGE_INTERVAL_SECONDS', 0)
+    @patch('app.utils.rate_limit_storage.time.time')
+    def test_expired_counters_are_purged(self, mock_time, storage):
+        """Test that expired counters are deleted from the database."""
+        mock_time.return_value = 1000.0
+        storage.incr("expired", 10)
+
+        mock_time.return_value = 1020.0
+        storage.incr("current", 10)
+
+        keys = [row[0] for row in storage._connection().execute("SELECT key FROM rate_limit_counters")]
+        assert keys == ["current"]
+
+    def test_clear_and_reset(self, storage):
+        """Test that counters can be cleared individually or all at once."""
+        storage.incr("first", 60)
+        storage.incr("second", 60)
+
+        storage.clear("first")
+        assert storage.get("first") == 0
+        assert storage.get("second") == 1
+
+        assert storage.reset() == 1
+        assert storage.get("second") == 0
+
+    def test_fixed_window_limit(self, storage):
+        """Test that the fixed window strategy stops hits over the limit."""
+        limiter = FixedWindowRateLimiter(storage)
+        limit = RateLimitItemPerMinute(3)
+
+        assert [limiter.hit(limit, "client") for _ in range(4)] == [True, True, True, False]
+        assert limiter.get_window_stats(limit, "client").remaining == 0
+
+    def test_sliding_window_limit(self, storage):
+        """Test that the sliding window counter strategy stops hits over the limit."""
+        limiter = SlidingWindowCounterRateLimiter(storage)
+        limit = RateLimitItemPerMinute(3)
+
+        assert [limiter.hit(limit, "client") for _ in range(4)] == [True, True, True, False]
+        assert limiter.get_window_stats(limit, "client").remaining == 0
+
+        limiter.clear(limit, "client")
+        assert limiter.hit(limit, "client")
+
+    @patch('app.utils.rate_limit_storage.time.time')
+    def test_sliding_window_weights_previous_window(self, mock_time, storage):
+        """Test that hits in the previous window count in proportion to how much of it is still in view."""
+        mock_time.return_value = 6000.0
+        for _ in range(4):
+            assert storage.acquire_sliding_window_entry("key", limit=4, expiry=60)
+
+        # A quarter of the way through the next window, three quarters of the previous 4 hits still count
+        mock_time.return_value = 6075.0
+        previous_count, previous_ttl, current_count, _ = storage.get_sliding_window("key", 60)
+        assert (previous_count, previous_ttl, current_count) == (4, 45.0, 0)
+
+        assert storage.acquire_sliding_window_entry("key", limit=4, expiry=60)
+        assert not storage.acquire_sliding_window_entry("key", limit=4, expiry=60)
+
+    def test_counters_are_shared_between_processes(self, storage_uri):
+        """Test that concurrent processes share one limit without losing hits."""
+        context = multiprocessing.get_context("fork")
+        results = context.Queue()
+        processes = [
+            context.Process(target=_hit_fixed_window, args=(storage_uri, 20, results))
+            for _ in range(4)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join(timeout=30)
+
+        allowed_hits = sum(results.get(timeout=5) for _ in processes)
+
+        assert allowed_hits == 50
+        assert SQLiteStorage(storage_uri).get(RateLimitItemPerMinute(50).key_for("client")) == 80
@@ -0,0 +1,179 @@
+"""
+Unit tests for request tracing.
+"""
+import json
+import logging
+
+import pytest
+from flask import Flask, Response
+
+from app.tracing import (
+    SPAN_KIND_SERVER,
+    configure_tracing,
+    end_request_trace,
+    span,
+    start_request_trace,
+    traced,
+)
+
+
+@pytest.fixture
+def export_path(tmp_path):
+    return tmp_path / "traces.jsonl"
+
+
+@pytest.fixture
+def configure(export_path):
+    """Turn tracing on with the given settings for one test, and off again afterwards."""
+    def configure(sample_rate: float = 1.0, slow_request_seconds: float = 30):
+        configure_tracing(str(export_path), sample_rate=sample_rate, slow_request_seconds=slow_request_seconds)
+
+    yield configure
+    configure_tracing(None, sample_rate=0, slow_request_seconds=30)
+
+
+@pytest.fixture
+def traced_app():
+    """A minimal app with the tracing hooks, whose routes run a few spans."""
+    app = Flask(__name__)
+    app.before_request(start_request_trace)
+    app.after_request(end_request_trace)
+
+    @traced("answer")
+    def answer():
+        with span("search", rulebook="Wingspan"):
+            pass
+        yield "An "
+        yield "answer"
+
+    @app.route("/answer")
+    def answer_route():
+        with span("validate"):
+            logging.getLogger("tests.tracing").warning("validating")
+        return Response(answer(), mimetype="text/event-stream")
+
+    @app.route("/fail")
+    def fail_route():
+        raise RuntimeError("boom")
+
+    return app
+
+
+def _get(app: Flask, path: str, **kwargs) -> None:
+    """Make a request and read its response to the end, as a server would."""
+    response = app.test_client().get(path, **kwargs)
+    response.get_data()
+    response.close()
+
+
+def _read_traces(export_path) -> list[list[dict]]:
+    """Get the spans of each exported trace."""
+    if not export_path.exists():
+        return []
+
+    return [
+        json.loads(line)["resourceSpans"][0]["scopeSpans"][0]["spans"]
+        for line in export_path.read_text().splitlines()
+    ]
+
+
+class TestTracing:
+    """Test recording and exporting request traces."""
+
+    def test_spans_outside_a_trace_are_noops(self, configure, export_path):
+        """Test that spans do nothing outside a request, and with tracing off."""
+        with span("orphan") as orphan:
+            assert orphan is None
+
+        configure()
+        with span("orphan") as orphan:
+            assert orphan is None
+
+        assert _read_traces(export_path) == []
+
+    def test_sampled_request_exported_with_nested_spans(self, configure, export_path, traced_app):
+        """Test that a sampled request's spans are exported once its stream has closed, parented correctly."""
+        configure(sample_rate=1.0)
+
+        response = traced_app.test_client().get("/answer", buffered=False)
+        assert _read_traces(export_path) == []
+        assert response.get_data() == b"An answer"
+        response.close()
+
+        [spans] = _read_traces(export_path)
+        spans_by_name = {span["name"]: span for span in spans}
+        root_span = spans_by_name["GET /answer"]
+
+        assert set(spans_by_name) == {"GET /answer", "validate", "answer", "search"}
+        assert root_span["kind"] == SPAN_KIND_SERVER
+        assert "parentSpanId" not in root_span
+        assert spans_by_name["validate"]["parentSpanId"] == root_span["spanId"]
+        assert spans_by_name["answer"]["parentSpanId"] == root_span["spanId"]
+        assert spans_by_name["search"]["parentSpanId"] == spans_by_name["answer"]["spanId"]
+        assert spans_by_name["search"]["attributes"] == [{"key": "rulebook", "value": {"stringValue": "Wingspan"}}]
+        assert {span["traceId"] for span in spans} == {root_span["traceId"]}
+        assert int(root_span["endTimeUnixNano"]) >= int(spans_by_name["answer"]["endTimeUnixNano"])
+
+    def test_unsampled_request_not_exported(self, configure, export_path, traced_app):
+        """Test that fast, successful requests outside the sample aren't exported."""
+        configure(sample_rate=0.0)
+
+        _get(traced_app, "/answer")
+
+        assert _read_traces(export_path) == []
+
+    def test_slow_request_exported(self, configure, export_path, traced_app):
+        """Test that requests slower than the threshold are exported even if they weren't sampled."""
+        configure(sample_rate=0.0, slow_request_seconds=1e-9)
+
+        _get(traced_app, "/answer")
+
+        assert len(_read_traces(export_path)) == 1
+
+    def test_failed_request_exported_as_error(self, configure, export_path, traced_app):
+        """Test that requests that fail are exported even if they weren't sampled, with an error status."""
+        configure(sample_rate=0.0)
+
+        _get(traced_app, "/fail")
+
+        [spans] = _read_traces(export_path)
+        assert spans[0]["name"] == "GET /fail"
+        assert spans[0]["status"]["message"] == "HTTP 500"
+
+    def test_incoming_trace_continued(self, configure, export_path, traced_app):
+        """Test that a W3C traceparent header's trace is continued, and its sampled flag respected."""
+        configure(sample_rate=0.0)
+        trace_id, parent_span_id = "4bf92f3577b34da6a3ce929d0e0e4736", "00f067aa0ba902b7"
+
+        _get(traced_app, "/answer", headers={"traceparent": f"00-{trace_id}-{parent_span_id}-01"})
+
+        [spans] = _read_traces(export_path)
+        root_span = next(span for span in spans if span["name"] == "GET /answer")
+        assert root_span["traceId"] == trace_id
+        assert root_span["parentSpanId"] == parent_span_id
+
+    def test_cancelled_generator_span_marked(self, configure, export_path, traced_app):
+        """Test that a traced generator closed part-way, as when a client disconnects, is marked cancelled."""
+        configure(sample_rate=1.0)
+
+        response = traced_app.test_client().get("/answer", buffered=False)
+        next(response.response)
+        response.close()
+
+        [spans] = _read_traces(export_path)
+        answer_span = next(span for span in spans if span["name"] == "answer")
+        assert {"key": "cancelled", "value": {"boolValue": True}} in answer_span["attributes"]
+        assert "status" not in answer_span
+
+    def test_logs_carry_trace_ids(self, configure, export_path, traced_app, caplog):
+        """Test that records logged inside a span carry its trace and span IDs."""
+        configure(sample_rate=1.0)
+
+        _get(traced_app, "/answer")
+
+        [spans] = _read_traces(export_path)
+        validate_span = next(span for span in spans if span["name"] == "validate")
+        [record] = [record for record in caplog.records if record.getMessage() == "validating"]
+        assert record.trace_context == (
+            f" [trace_id={validate_span['traceId']} span_id={validate_span['spanId']}]"
+        )
@@ -0,0 +1,142 @@
+"""
+Unit tests for per-user admission control.
+"""
+from unittest.mock import patch
+
+import pytest
+
+from app.config.constants import (
+    ERROR_REQUEST_BUDGET_EXCEEDED,
+    ERROR_TOO_MANY_CONCURRENT_STREAMS,
+    USER_STREAM_LEASE_SECONDS,
+    USER_STREAM_RETRY_AFTER_SECONDS,
+)
+from app.user_admission import AdmissionDeniedError, UserAdmissionControl
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def storage_uri(request, tmp_path):
+    if request.param == "memory":
+        return "memory://"
+    return f"sqlite:///{tmp_path / 'admission.db'}"
+
+
+@pytest.fixture
+def mock_time():
+    with patch('app.user_admission.time.time') as mock_time:
+        mock_time.return_value = 1000.0
+        yield mock_time
+
+
+def _create_admission_control(storage_uri: str) -> UserAdmissionControl:
+    # A $0.01 bucket refilled at $0.036 an hour, i.e. $0.00001 a second
+    return UserAdmissionControl(
+        storage_uri,
+        budget_usd=0.01,
+        refill_usd_per_hour=0.036,
+        max_concurrent_streams=2,
+    )
+
+
+class TestUserAdmissionControl:
+    """Test the per-user token bucket and stream limit."""
+
+    def test_admits_within_budget(self, storage_uri, mock_time):
+        """Test that requests are admitted until their estimated costs use up the budget."""
+        admission = _create_admission_control(storage_uri)
+
+        for _ in range(4):
+            assert admission.acquire("user-1", 0.0025) is None
+
+        with pytest.raises(AdmissionDeniedError) as exc_info:
+            admission.acquire("user-1", 0.0025)
+
+        assert exc_info.value.message == ERROR_REQUEST_BUDGET_EXCEEDED
+        assert exc_info.value.retry_after_seconds == 250
+
+    def test_budgets_are_per_user(self, storage_uri, mock_time):
+        """Test that one user using up their budget doesn't affect another."""
+        admission = _create_admission_control(storage_uri)
+        admission.acquire("user-1", 0.01)
+
+        assert admission.acquire("user-2", 0.01) is None
+
+    def test_budget_refills(self, storage_uri, mock_time):
+        """Test that the bucket refills over time, up to the budget."""
+        admission = _create_admission_control(storage_uri)
+        admission.acquire("user-1", 0.01)
+
+        mock_time.return_value = 1250.0
+        assert admission.acquire("user-1", 0.0025) is None
+
+        mock_time.return_value = 100000.0
+        admission.acquire("user-1", 0.01)
+        with pytest.raises(AdmissionDeniedError):
+            admission.acquire("user-1", 0.001)
+
+    def test_cost_over_budget_is_capped(self, storage_uri, mock_time):
+        """Test that a request estimated at more than the budget can still be admitted with a full bucket."""
+        admission = _create_admission_control(storage_uri)
+
+        assert admission.acquire("user-1", 1.0) is None
+
+    def test_charge_settles_actual_cost(self, storage_uri, mock_time):
+        """Test that charging more than the estimate puts the bucket into debt."""
+        admission = _create_admission_control(storage_uri)
+        admission.acquire("user-1", 0.005)
+        admission.charge("user-1", 0.01)
+
+        with pytest.raises(AdmissionDeniedError) as exc_info:
+            admission.acquire("user-1", 0.001)
+
+        assert exc_info.value.retry_after_seconds == 600
+
+    def test_release_refunds_cost(self, storage_uri, mock_time):
+        """Test that a refunded request's cost is returned to the bucket."""
+        admission = _create_admission_control(storage_uri)
+        admission.acquire("user-1", 0.01)
+        admission.release("user-1", refund_usd=0.01)
+
+        assert admission.acquire("user-1", 0.01) is None
+
+    def test_concurrent_streams_are_capped(self, storage_uri, mock_time):
+        """Test that a user can only hold max_concurrent_streams stream slots at once."""
+        admission = _create_admission_control(storage_uri)
+        first_lease_id = admission.acquire("user-1", 0.001, stream=True)
+        admission.acquire("user-1", 0.001, stream=True)
+
+        with pytest.raises(AdmissionDeniedError) as exc_info:
+            admission.acquire("user-1", 0.001, stream=True)
+
+        assert exc_info.value.message == ERROR_TOO_MANY_CONCURRENT_STREAMS
+        assert exc_info.value.retry_after_seconds == USER_STREAM_RETRY_AFTER_SECONDS
+
+        admission.release("user-1", lease_id=first_lease_id)
+        assert admission.acquire("user-1", 0.001, stream=True) is not None
+
+    def test_stream_leases_expire(self, storage_uri, mock_time):
+        """Test that slots held by streams that were never released are freed once their lease expires."""
+        admission = _create_admission_control(storage_uri)
+        admission.acquire("user-1", 0.001, stream=True)
+        admission.acquire("user-1", 0.001, stream=True)
+
+        mock_time.return_value = 1000.0 + USER_STREAM_LEASE_SECONDS
+        assert admission.acquire("user-1", 0.001, stream=True) is not None
+
+    def test_sqlite_state_is_shared(self, tmp_path, mock_time):
+        """Test that admission controls using the same SQLite file share each user's budget."""
+        storage_uri = f"sqlite:///{tmp_path / 'admission.db'}"
+        first_worker = _create_admission_control(storage_uri)
+        second_worker = _create_admission_control(storage_uri)
+
+        first_worker.acquire("user-1", 0.01)
+
+        with pytest.raises(AdmissionDeniedError):
+            second_worker.acquire("user-1", 0.001)
+
+    def test_admits_when_state_unavailable(self, storage_uri, mock_time):
+        """Test that requests are admitted if the admission state can't be read."""
+        admission = _create_admission_control(storage_uri)
+
+        with patch.object(admission._store, 'transaction', side_effect=OSError("disk full")):
+            assert admission.acquire("user-1", 0.001, stream=True) is None
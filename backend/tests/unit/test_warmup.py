@@ -0,0 +1,69 @@
+"""
+Unit tests for worker warmup and readiness.
+"""
+from unittest.mock import Mock, patch
+
+from app.config.constants import WARMUP_RETRY_INTERVAL_SECONDS
+from app.warmup import Warmup
+
+
+class TestWarmup:
+    """Test running warmup steps and reporting readiness."""
+
+    def test_ready_once_all_steps_succeed(self):
+        """Test that the process is ready after every step has run successfully."""
+        steps = {"first": Mock(), "second": Mock()}
+        warmup = Warmup(steps)
+
+        assert warmup.is_ready() is False
+        assert warmup.status() == {"first": "pending", "second": "pending"}
+
+        assert warmup.run() is True
+        assert warmup.status() == {"first": "ok", "second": "ok"}
+        steps["first"].assert_called_once()
+        steps["second"].assert_called_once()
+
+    def test_failed_steps_are_retried(self):
+        """Test that only steps that failed are run again."""
+        steps = {"first": Mock(), "second": Mock(side_effect=[Exception("unreachable"), None])}
+        warmup = Warmup(steps)
+
+        assert warmup.run() is False
+        assert warmup.status() == {"first": "ok", "second": "failed"}
+
+        assert warmup.run() is True
+        steps["first"].assert_called_once()
+        assert steps["second"].call_count == 2
+
+    @patch('app.warmup.time.monotonic')
+    def test_retry_if_due_is_throttled(self, mock_monotonic):
+        """Test that readiness probes retry failed steps at most once per retry interval."""
+        step = Mock(side_effect=Exception("unreachable"))
+        warmup = Warmup({"step": step})
+
+        mock_monotonic.return_value = 0
+        warmup.run()
+
+        mock_monotonic.return_value = WARMUP_RETRY_INTERVAL_SECONDS - 1
+        assert warmup.retry_if_due() is False
+        assert step.call_count == 1
+
+        mock_monotonic.return_value = WARMUP_RETRY_INTERVAL_SECONDS
+        assert warmup.retry_if_due() is False
+        assert step.call_count == 2
+
+    @patch('app.warmup.os.getpid')
+    def test_steps_rerun_after_fork(self, mock_getpid):
+        """Test that a forked child isn't ready until it has run every step itself."""
+        step = Mock()
+        warmup = Warmup({"step": step})
+
+        mock_getpid.return_value = 100
+        warmup.run()
+
+        mock_getpid.return_value = 101
+        assert warmup.is_ready() is False
+        assert warmup.status() == {"step": "pending"}
+
+        assert warmup.run() is True
+        assert step.call_count == 2
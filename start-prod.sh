@@ -14,8 +14,14 @@ cd frontend
 npm run build
 cd ..
 
+# Move data still embedded in user documents into its collections before serving any requests,
+# since the app only reads those collections
+echo "🗄️  Migrating database..."
+cd backend
+python manage.py migrate-messages && python manage.py migrate-token-usage \
+    || { echo "❌ Database migration failed, not starting"; exit 1; }
+
 # Start backend with Gunicorn for production
 echo "🔧 Starting Flask backend with Gunicorn..."
-cd backend
-gunicorn --bind 0.0.0.0:5000 --workers 4 --timeout 120 run:app
+gunicorn --config gunicorn.conf.py run:app
 cd .. 
\ No newline at end of file